@@ -0,0 +1,133 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+# Bump whenever the pickled analyzer state or the aggregation rules change, old entries are then dropped
+SCHEMA_VERSION = 11
+DEFAULT_MAX_BYTES = 256 << 20
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def default_cache_path():
+    """
+    Returns the cache file location: %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere.
+    """
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "spotify_json_analyzer", "aggregates.sqlite3")
+
+
+def open_default_cache():
+    """
+    Opens the cache at default_cache_path(). Returns None if it cannot be used, the analyzer then works uncached.
+    """
+    try:
+        return AggregateCache(default_cache_path())
+    except (OSError, sqlite3.Error) as e:
+        print(f"Aggregate cache disabled: {e}")
+        return None
+
+
+class AggregateCache:
+    """
+    SQLite store of per-file aggregated statistics.
+    Entries are keyed by the SHA-256 of the file content, so renamed or copied exports are still recognised.
+    The (path, size, mtime) of every file seen is remembered so unchanged files are not hashed again.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The analyzer may run in a background thread, but never from two threads at once
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        with self.connection:
+            if version != SCHEMA_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS files")
+                self.connection.execute("DROP TABLE IF EXISTS entries")
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (digest TEXT, columnar INTEGER, data BLOB, size INTEGER,"
+                " last_used REAL, PRIMARY KEY (digest, columnar))")
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, file_path, columnar):
+        """
+        Returns the cached partial SpotifyAnalyzer for file_path, or None if the file is unknown or has changed.
+        """
+        digest = self._digest(file_path)
+        if digest is None:
+            return None
+        row = self.connection.execute(
+            "SELECT data FROM entries WHERE digest = ? AND columnar = ?", (digest, int(columnar))).fetchone()
+        if row is None:
+            return None
+        try:
+            partial = pickle.loads(row[0])
+        except Exception as e:
+            # Written by an incompatible version of the analyzer, parse the file again
+            print(f"Ignoring unreadable cache entry for {file_path}: {e}")
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE entries SET last_used = ? WHERE digest = ? AND columnar = ?", (time.time(), digest, int(columnar)))
+        return partial
+
+    def put(self, file_path, partial):
+        """
+        Stores the statistics aggregated from file_path alone, then evicts the least recently used
+        entries until the cache fits in max_bytes.
+        """
+        digest = self._digest(file_path)
+        if digest is None:
+            return
+        data = pickle.dumps(partial, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (digest, int(partial.store is not None), data, len(data), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute("SELECT digest, columnar, size FROM entries ORDER BY last_used").fetchall()
+        for digest, columnar, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM entries WHERE digest = ? AND columnar = ?", (digest, columnar))
+            total -= size
+        self.connection.execute("DELETE FROM files WHERE digest NOT IN (SELECT digest FROM entries)")
+
+    def _digest(self, file_path):
+        """
+        Returns the content hash of file_path, reusing the stored one while size and mtime are unchanged.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        path = os.path.abspath(file_path)
+        row = self.connection.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
@@ -1,54 +1,543 @@
+import heapq
 import json
 import os
-from datetime import datetime
+import sys
+import time
+from datetime import timezone
+from itertools import islice, repeat
+from zlib import crc32
+
+from json_backends import iter_entries, resolve_backend, resolve_fields
+from load_stats import LoadStats, resolve_profiler
+from play_keys import BATCH_KEYS, PlayKeys
+from periods import GRANULARITIES, Period, hour_of, parse_period, range_labels, value_label, weekday_of
+from play_store import PlayStore
+from queries import Filter, filter_rows, make_filter
+from symbols import SymbolTable, track_identity
+from timeline import SESSION_GAP_SECONDS, build_timeline
+from timestamps import from_isoformat
+
+# Below this many bytes of input, starting worker processes costs more than it saves
+PARALLEL_MIN_BYTES = 8 << 20
+# Entries between two progress reports while a file is streamed
+PROGRESS_INTERVAL = 10000
+# Returned by process_files/add_files when the progress callback asked to stop
+CANCELLED = "Error: Loading cancelled."
+# Returned by add_files/add_entries when the play keys of the statistics were dropped, see keep_play_keys
+KEYS_DROPPED = "Error: Plays can only be added to statistics loaded with keep_play_keys=True."
+# Aggregated periods kept for reuse, the oldest is dropped beyond this many
+PERIOD_CACHE_SIZE = 64
+# Bucket of a play for the Period kinds that are not time ranges
+_BUCKET_FUNCTIONS = {"weekday": weekday_of, "hour": hour_of}
+
+
+class LoadError(Exception):
+    """
+    Raised when an export file cannot be read. str(error) is the "Error: ..." message shown to the user.
+    """
+
+
+def _stat_view(name):
+    """
+    Property for one of the dict-of-dicts statistics, keyed by display name.
+    The analyzer counts by track and artist id (see _get_stat), the view is derived from those counts the first
+    time it is read after a change, adding up tracks that share a display name. Changing it in place has no effect.
+    Assigning a new dict replaces the statistic, its names becoming the identities, and drops the memoized rankings.
+    """
+    entity = name.partition("_")[0]
+
+    def getter(self):
+        view = self._name_views.get(name)
+        if view is None:
+            names = self._symbols(entity).names
+            view = self._name_views[name] = {year: _by_name(values, names)
+                                             for year, values in self._get_stat(name).items()}
+        return view
+
+    def setter(self, value):
+        symbols = self._symbols(entity)
+        setattr(self, "_" + name, {year: {symbols.intern(key, key): count for key, count in values.items()}
+                                   for year, values in value.items()})
+        self._invalidate()
+
+    return property(getter, setter)
+
+
+def _by_name(values, names):
+    named = {}
+    for key, value in values.items():
+        name = names[key]
+        named[name] = named.get(name, 0) + value
+    return named
+
+
+def _merge_year_dicts(target, source, key_map=None):
+    """
+    Adds the counters of a {year: {id: value}} dict into another one, source id i becoming key_map[i] if given.
+    """
+    for year, values in source.items():
+        year_dict = target.setdefault(year, {})
+        for key, value in values.items():
+            if key_map is not None:
+                key = key_map[key]
+            year_dict[key] = year_dict.get(key, 0) + value
+
+
+def _play_key(epoch, track_hash, ms_played):
+    """
+    Deterministic 64-bit key of a play, used to skip entries repeated across overlapping exports.
+    The upper half is the play's time in epoch seconds, so keys sort by time, the lower half adds ms_played
+    to track_hash, the _track_hash of the track played.
+    Python's hash() is salted per process, so it could not be compared across workers or the cache.
+    """
+    return (epoch & 0xFFFFFFFF) << 32 | (track_hash + ms_played) & 0xFFFFFFFF
+
+
+def _track_hash(identity):
+    """
+    CRC-32 of a symbols.track_identity, computed once per track and load.
+    """
+    return crc32(identity.encode("utf-8", "surrogatepass"))
+
+
+def _analyze_file(file_path, columnar, json_backend, used_fields_only, detailed=False, progress=None):
+    """
+    Worker for parallel ingestion: aggregates a single file in a fresh analyzer.
+    """
+    partial = SpotifyAnalyzer(columnar, json_backend=json_backend, used_fields_only=used_fields_only,
+                              load_stats=LoadStats(detailed))
+    return partial.process_files([file_path], progress=progress), partial
+
+
+def _sum_years(data_dict):
+    """
+    Combines a {year: {key: value}} dict into {key: total}.
+    """
+    combined = {}
+    for single_year_dict in data_dict.values():
+        for key, val in single_year_dict.items():
+            combined[key] = combined.get(key, 0) + val
+    return combined
+
 
 class SpotifyAnalyzer:
-    def __init__(self):
-        # Track statistics
-        self.track_plays = {}       # {year: {track_key: play_count}}
-        self.track_play_time = {}   # {year: {track_key: total_ms}}
-        # New artist statistics
-        self.artist_plays = {}      # {year: {artist_name: play_count}}
-        self.artist_play_time = {}  # {year: {artist_name: total_ms}}
-        self.track_years = set()    # Distinct years found in the data
+    # Track statistics, a track_key is "artist - track"
+    track_plays = _stat_view("track_plays")              # {year: {track_key: play_count}}
+    track_play_time = _stat_view("track_play_time")      # {year: {track_key: total_ms}}
+    # New artist statistics
+    artist_plays = _stat_view("artist_plays")            # {year: {artist_name: play_count}}
+    artist_play_time = _stat_view("artist_play_time")    # {year: {artist_name: total_ms}}
 
-    def load_json_files(self, file_paths):
-        combined_data = []
+    def __init__(self, columnar=False, cache=None, json_backend=None, used_fields_only=None, load_stats=None,
+                 keep_play_keys=True):
+        """
+        With columnar=True every qualifying play is kept in a PlayStore, which periods, queries, timelines and
+        snapshots need, and the statistics above are computed from it by grouped reductions. Loading is not faster
+        than counting into the dicts directly; the reductions are only cheap with NumPy installed.
+        cache is an optional AggregateCache holding the statistics of previously processed files.
+        json_backend and used_fields_only choose how files are decoded, see json_backends.iter_entries;
+        None takes them from $SPOTIFY_JSON_BACKEND and $SPOTIFY_JSON_USED_FIELDS.
+        load_stats is the LoadStats collecting counters and timings of the loads, by default one profiling
+        with $SPOTIFY_PROFILE if set.
+        keep_play_keys keeps the key of every play counted (8 bytes each) after a load, so that plays added later by
+        add_files, add_entries or merge are de-duplicated against them; within a single load they always are.
+        With False they are dropped after every load, and adding to the statistics fails until they are replaced.
+        """
+        # The same statistics keyed by the ids of self.tracks and self.artists
+        self._track_plays = {}
+        self._track_play_time = {}
+        self._artist_plays = {}
+        self._artist_play_time = {}
+        self._tracks = SymbolTable()    # Symbol tables outside columnar mode, the store has its own
+        self._artists = SymbolTable()
+        self._name_views = {}           # {stat_name: view by display name}, see _stat_view
+        self.track_years = []       # Distinct years found in the data, sorted
+        self.store = PlayStore() if columnar else None
+        self.cache = cache
+        self.json_backend = resolve_backend(json_backend)
+        self.json_fields = resolve_fields(used_fields_only)
+        self.keep_play_keys = keep_play_keys
+        self._play_keys = PlayKeys()    # _play_key of the plays counted, see keep_play_keys
+        self._play_keys_dropped = False
+        self.entries_read = 0       # Entries decoded from files, counted or not
+        self._totals = None         # {stat_name: {key: all-time total}}, built on first use after a change
+        self._rank_cache = {}       # {(stat_name, year): (leading keys sorted by value, complete)}
+        self._period_stats = {}     # {(entity, Period): ({key: play_count}, {key: total_ms})}
+        self._timeline = None       # timeline.Timeline of the last get_timeline call
+        self._views_stale = False
+        self._aggregated_rows = 0   # Rows of self.store counted in the statistics, see _materialize_views
+        self.load_stats = load_stats if load_stats is not None else LoadStats(profiler=resolve_profiler())
+
+    @property
+    def tracks(self):
+        """
+        SymbolTable of the tracks counted, keyed by symbols.track_identity and shown as "artist - track".
+        """
+        return self._symbols("track")
+
+    @property
+    def artists(self):
+        """
+        SymbolTable of the artists counted, keyed and shown by name.
+        """
+        return self._symbols("artist")
+
+    def _symbols(self, entity):
+        if self.store is not None:
+            return self.store.tracks if entity == "track" else self.store.artists
+        return self._tracks if entity == "track" else self._artists
+
+    def _release_play_keys(self):
+        """
+        Drops the play keys at the end of a load unless they are kept, see keep_play_keys.
+        """
+        if not self.keep_play_keys and len(self._play_keys):
+            self._play_keys.clear()
+            self._play_keys_dropped = True
+
+    def iter_json_entries(self, file_paths, progress=None):
+        """
+        Yields entries from each file in turn, decoded by self.json_backend.
+        The "stdlib" backend streams, the others hold at most one file's entries in memory.
+        progress, if given, is called as progress(bytes_done, total_bytes, entries_read) every
+        PROGRESS_INTERVAL entries and after each file; returning False stops with LoadError(CANCELLED).
+        Raises LoadError for a missing, empty or malformed file.
+        """
+        total = self._input_size(file_paths) if progress is not None else 0
+        done = 0
         for file_path in file_paths:
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        data = json.load(file)
-                        if not data:
-                            raise ValueError("Empty JSON file")
-                        combined_data.extend(data)
-                        print(f"Loaded {len(data)} entries from {file_path}")
-                except json.JSONDecodeError:
-                    print(f"File is not a valid JSON: {file_path}")
-                    return f"Error: File {file_path} is not a valid JSON."
-                except ValueError as ve:
-                    print(f"File error: {file_path}: {ve}")
-                    return f"Error: File {file_path} is empty."
-                except Exception as e:
-                    print(f"Error loading file {file_path}: {e}")
-                    return f"Error: Failed to load file {file_path}: {e}"
-            else:
+            if not os.path.exists(file_path):
                 print(f"File not found: {file_path}")
-                return f"Error: File not found {file_path}."
-        return combined_data
+                raise LoadError(f"Error: File not found {file_path}.")
+            try:
+                count = 0
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    for entry in iter_entries(self.load_stats.timed_file(file), self.json_backend, self.json_fields):
+                        count += 1
+                        yield entry
+                        if progress is not None and count % PROGRESS_INTERVAL == 0:
+                            if progress(done + file.buffer.tell(), total, self.entries_read + count) is False:
+                                raise LoadError(CANCELLED)
+                    # Every backend reads to the end of the file
+                    self.load_stats.bytes_read += file.buffer.tell()
+                if not count:
+                    raise ValueError("Empty JSON file")
+                print(f"Loaded {count} entries from {file_path}")
+            except LoadError:
+                raise
+            except json.JSONDecodeError:
+                print(f"File is not a valid JSON: {file_path}")
+                raise LoadError(f"Error: File {file_path} is not a valid JSON.")
+            except ValueError as ve:
+                print(f"File error: {file_path}: {ve}")
+                raise LoadError(f"Error: File {file_path} is empty.")
+            except Exception as e:
+                print(f"Error loading file {file_path}: {e}")
+                raise LoadError(f"Error: Failed to load file {file_path}: {e}")
+            self.entries_read += count
+            self.load_stats.files += 1
+            self.load_stats.entries_decoded += count
+            if progress is not None:
+                done += os.path.getsize(file_path)
+                if progress(done, total, self.entries_read) is False:
+                    raise LoadError(CANCELLED)
+
+    def load_json_files(self, file_paths):
+        """
+        Returns all entries from file_paths as one list, or an "Error: ..." string.
+        Prefer process_files, which never holds the whole history in memory.
+        """
+        try:
+            return list(self.iter_json_entries(file_paths))
+        except LoadError as e:
+            return str(e)
+
+    def process_files(self, file_paths, workers=1, progress=None):
+        """
+        Replaces the statistics with those of file_paths, see add_files.
+        Returns None on success or an "Error: ..." string, in which case the statistics are left empty.
+        """
+        self._reset_stats()
+        self.load_stats.reset()
+        error = self.add_files(file_paths, workers, progress)
+        if error:
+            self._reset_stats()
+        return error
+
+    def add_files(self, file_paths, workers=1, progress=None):
+        """
+        Streams the entries of file_paths into the current statistics. Plays already counted,
+        identified by their ts, track and ms_played, are skipped, so overlapping exports can be added.
+        With workers > 1 (None for one per CPU) every file is aggregated in its own process and the partial
+        statistics are merged in file order, which gives the same result as the serial path.
+        Inputs smaller than PARALLEL_MIN_BYTES are always processed serially.
+        With a cache, files seen before are taken from it and only new or changed files are parsed.
+        progress is called as in iter_json_entries, in worker processes only once per file;
+        returning False from it cancels the load and CANCELLED is returned.
+        Returns None on success or an "Error: ..." string, in which case nothing is added.
+        """
+        if self._play_keys_dropped:
+            return KEYS_DROPPED
+        with self.load_stats.capture():
+            try:
+                workers = os.cpu_count() if workers is None else workers
+                if workers > 1 and len(file_paths) > 1 and self._input_size(file_paths) >= PARALLEL_MIN_BYTES:
+                    return self._add_partials(file_paths, workers, progress)
+                if self.cache is not None or self.track_years:
+                    return self._add_partials(file_paths, 1, progress)
+                # Nothing to preserve on failure, so entries can go straight into the statistics
+                try:
+                    self._process_entries(self.iter_json_entries(file_paths, progress))
+                except LoadError as e:
+                    self._reset_stats()
+                    return str(e)
+                return None
+            finally:
+                self._release_play_keys()
+
+    def add_entries(self, entries):
+        """
+        Adds entries to the current statistics, skipping plays already counted, see keep_play_keys.
+        Returns None on success or an "Error: ..." string, in which case nothing is added.
+        """
+        if self._play_keys_dropped:
+            return KEYS_DROPPED
+        with self.load_stats.capture():
+            self._process_entries(entries)
+        self._release_play_keys()
+        return None
+
+    def _add_partials(self, file_paths, workers, progress=None):
+        """
+        Aggregates every file into its own partial analyzer, from the cache where possible.
+        The partials are merged in file order once all files have loaded.
+        """
+        columnar = self.store is not None
+        stats = self.load_stats
+        with stats.stage("cache"):
+            partials = [self.cache.get(path, columnar) if self.cache is not None else None for path in file_paths]
+        misses = [path for path, partial in zip(file_paths, partials) if partial is None]
+        computed_indexes = {index for index, partial in enumerate(partials) if partial is None}
+        pool = None
+        if workers > 1 and len(misses) > 1:
+            # Imported here, the multiprocessing machinery is a large part of the module's import time
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(misses)))
+            computed = pool.map(_analyze_file, misses, repeat(columnar), repeat(self.json_backend),
+                                repeat(self.json_fields is not None), repeat(stats.detailed))
+        total = self._input_size(file_paths) if progress is not None else 0
+        done = entries = 0
+
+        try:
+            for index, file_path in enumerate(file_paths):
+                if partials[index] is None:
+                    if pool is not None:
+                        error, partials[index] = next(computed)
+                    else:
+                        file_progress = None
+                        if progress is not None:
+                            def file_progress(file_done, _, file_entries, base=done, base_entries=entries):
+                                return progress(base + file_done, total, base_entries + file_entries)
+                        error, partials[index] = _analyze_file(file_path, columnar, self.json_backend,
+                                                               self.json_fields is not None, stats.detailed, file_progress)
+                    if error:
+                        # Report the first failing file, like the serial path does
+                        return error
+                    if self.cache is not None:
+                        with stats.stage("cache"):
+                            self.cache.put(file_path, partials[index])
+                if progress is not None:
+                    done += os.path.getsize(file_path)
+                    entries += partials[index].entries_read
+                    if progress(done, total, entries) is False:
+                        return CANCELLED
+        finally:
+            if pool is not None:
+                # Do not wait for files still being parsed when stopping early
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        stats.cache_hits += len(file_paths) - len(misses)
+        for index, (file_path, partial) in enumerate(zip(file_paths, partials)):
+            with stats.stage("merge"):
+                merged = self.merge(partial)
+            if not merged:
+                # The file overlaps data already counted, only its new plays can be added
+                try:
+                    self._process_entries(self.iter_json_entries([file_path]))
+                except LoadError as e:
+                    return str(e)
+            elif index in computed_indexes:
+                # Cached files were not read this time
+                stats.merge(partial.load_stats)
+        return None
+
+    @staticmethod
+    def _input_size(file_paths):
+        return sum(os.path.getsize(path) for path in file_paths if os.path.exists(path))
+
+    def merge(self, other):
+        """
+        Adds the statistics of another analyzer in the same mode, e.g. one built from a different file.
+        Returns False without changing anything if other contains plays already counted here,
+        or if either dropped its play keys, see keep_play_keys.
+        """
+        if self._play_keys_dropped or other._play_keys_dropped or not self._play_keys.isdisjoint(other._play_keys):
+            return False
+        if self.store is not None:
+            self.store.extend(other.store)
+            self._views_stale = True
+        else:
+            track_map = self._tracks.remap(other._tracks)
+            artist_map = self._artists.remap(other._artists)
+            _merge_year_dicts(self._track_plays, other._track_plays, track_map)
+            _merge_year_dicts(self._track_play_time, other._track_play_time, track_map)
+            _merge_year_dicts(self._artist_plays, other._artist_plays, artist_map)
+            _merge_year_dicts(self._artist_play_time, other._artist_play_time, artist_map)
+        self._play_keys.extend(other._play_keys)
+        self.entries_read += other.entries_read
+        self.track_years = sorted(set(self.track_years).union(other.track_years))
+        self._invalidate()
+        return True
 
     def process_data(self, combined_data):
         """
         For each track in combined_data, count a play only if ms_played >= 20000.
         Also accumulate total milliseconds played for each track+year and artist+year.
         """
-        self.track_plays.clear()
-        self.track_play_time.clear()
-        self.artist_plays.clear()
-        self.artist_play_time.clear()
-        self.track_years.clear()
+        self._reset_stats()
+        self.load_stats.reset()
+        with self.load_stats.capture():
+            self._process_entries(combined_data)
+        self._release_play_keys()
+
+    def save_snapshot(self, path):
+        """
+        Writes every play counted to a binary snapshot that load_snapshot can reopen without parsing JSON.
+        Needs the per-play records of columnar mode. Returns None on success or an "Error: ..." string.
+        """
+        if self.store is None:
+            return "Error: Snapshots can only be saved in columnar mode."
+        from snapshot import write_snapshot
+        try:
+            write_snapshot(path, self.store, self._play_keys, self.track_years, self.entries_read)
+        except OSError as e:
+            print(f"Error writing snapshot {path}: {e}")
+            return f"Error: Failed to write snapshot {path}: {e}"
+        return None
+
+    def load_snapshot(self, path):
+        """
+        Replaces the statistics with the plays of a snapshot written by save_snapshot, switching to columnar mode.
+        The file is memory-mapped and its columns are aggregated in place, nothing is copied until files are added.
+        Returns None on success or an "Error: ..." string, in which case the statistics are left empty.
+        """
+        from snapshot import SnapshotError, read_snapshot
+        self._reset_stats()
+        self.load_stats.reset()
+        try:
+            with self.load_stats.stage("snapshot"):
+                store, play_keys, years, entries_read = read_snapshot(path)
+        except (OSError, SnapshotError) as e:
+            print(f"Error loading snapshot {path}: {e}")
+            return f"Error: Failed to load snapshot {path}: {e}"
+        self.store = store
+        self._play_keys.add_sorted(play_keys)
+        self.track_years = years
+        self.entries_read = entries_read
+        self._views_stale = True
+        print(f"Loaded {len(store)} plays from snapshot {path}")
+        return None
+
+    def get_load_stats(self):
+        """
+        Returns the counters and stage timings of self.load_stats as a dict, see LoadStats.as_dict,
+        with the number of distinct tracks and artists of every year under "distinct_keys".
+        """
+        return self.load_stats.as_dict(self._distinct_keys())
+
+    def load_report(self):
+        """
+        Returns get_load_stats as text, followed by the profile captured by self.load_stats if there is one.
+        """
+        report = self.load_stats.format(self._distinct_keys())
+        if self.load_stats.profile_report:
+            report += "\n\n" + self.load_stats.profile_report
+        return report
+
+    def _distinct_keys(self):
+        return {f"{entity}s": {year: len(values) for year, values in sorted(self._get_stat(f"{entity}_plays").items())}
+                for entity in ("track", "artist")}
 
-        for entry in combined_data:
+    def _reset_stats(self):
+        self._track_plays.clear()
+        self._track_play_time.clear()
+        self._artist_plays.clear()
+        self._artist_play_time.clear()
+        self._tracks = SymbolTable()
+        self._artists = SymbolTable()
+        self.track_years = []
+        self._play_keys.clear()
+        self._play_keys_dropped = False
+        self.entries_read = 0
+        self._aggregated_rows = 0
+        self._invalidate()
+        if self.store is not None:
+            self.store = PlayStore()
+            self._views_stale = False
+
+    def _get_stat(self, stat_name):
+        """
+        Returns statistic stat_name keyed by id, aggregated from the play store first if new plays arrived.
+        """
+        if self._views_stale:
+            self._materialize_views()
+        return getattr(self, "_" + stat_name)
+
+    def _materialize_views(self):
+        """
+        Adds the plays appended to the store since the last call to the statistics, like merge adds another analyzer's.
+        Store rows are never changed or removed, so the rows counted before are not aggregated again.
+        """
+        self._views_stale = False
+        start, self._aggregated_rows = self._aggregated_rows, len(self.store)
+        with self.load_stats.stage("aggregate"):
+            for entity in ("track", "artist"):
+                plays, play_time = self.store.aggregate(entity, start)
+                if start:
+                    _merge_year_dicts(getattr(self, f"_{entity}_plays"), plays)
+                    _merge_year_dicts(getattr(self, f"_{entity}_play_time"), play_time)
+                else:
+                    setattr(self, f"_{entity}_plays", plays)
+                    setattr(self, f"_{entity}_play_time", play_time)
+
+    def _process_entries(self, entries):
+        """
+        Adds every qualifying entry of the iterable to the statistics.
+        """
+        years = set(self.track_years)
+        store = self.store
+        play_keys = self._play_keys
+        tracks, artists = self.tracks, self.artists
+        track_ids, artist_ids = tracks.ids, artists.ids
+        track_hashes = [None] * len(tracks)     # _track_hash by track id, filled on first use
+        if store is not None:
+            platforms, reason_ends = store.platforms, store.reason_ends
+            # The ids of the values seen, a missing platform or reason_end shares id 0 with ""
+            platform_ids, reason_end_ids = {**platforms.ids, None: 0}, {**reason_ends.ids, None: 0}
+            (append_track, append_artist, append_year, append_timestamp, append_ms,
+             append_platform, append_reason_end, append_shuffle, append_skipped) = store.appenders()
+        year_dicts = {}     # {year: the four per-year dicts of that year}
+        stats = self.load_stats
+        started, keys_before = time.perf_counter(), len(play_keys)
+        skipped_short = missing_metadata = invalid_timestamps = duplicates = 0
+        parse = from_isoformat
+        recent, low, high = play_keys.recent, play_keys.low, play_keys.high
+        if stats.detailed:
+            detailed_before = sum(stats.stage_seconds.get(stage, 0.0) for stage in ("read", "decode", "timestamps"))
+            entries = stats.timed_entries(entries)
+            parse = stats.timed("timestamps", from_isoformat)
+
+        for entry in entries:
             ms_played = entry.get("ms_played", 0)
             # Only count if 20+ seconds were played
             if ms_played >= 20000:
@@ -57,92 +546,280 @@ class SpotifyAnalyzer:
                 timestamp = entry.get("ts")
 
                 if track_name and artist_name and timestamp:
-                    track_key = f"{artist_name} - {track_name}"
+                    # Whole milliseconds, a float such as 30000.0 would not fit the columns of the store
+                    ms_played = int(ms_played)
+                    # Validated first, an invalid play must not leave a key behind
                     try:
-                        year = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).year
-                        self.track_years.add(year)
+                        moment = parse(timestamp)
+                    except (TypeError, ValueError):
+                        print(f"Invalid timestamp format: {timestamp}")
+                        invalid_timestamps += 1
+                        continue
+                    if moment.tzinfo is None:
+                        # Naive values are taken as UTC, like timestamps.parse_timestamp does
+                        moment = moment.replace(tzinfo=timezone.utc)
+                    year, epoch = moment.year, int(moment.timestamp())
 
-                        # Update track plays and play time
-                        if year not in self.track_plays:
-                            self.track_plays[year] = {}
-                        self.track_plays[year][track_key] = self.track_plays[year].get(track_key, 0) + 1
+                    # A track is looked up by its URI, the name pair only stands in for a missing one
+                    track_uri = entry.get("spotify_track_uri")
+                    track_id = track_ids.get(track_uri or track_identity(track_uri, artist_name, track_name))
+                    if track_id is None:
+                        identity = track_identity(track_uri, artist_name, track_name)
+                        track_id = tracks.add(identity, f"{artist_name} - {track_name}")
+                        track_hashes.append(_track_hash(identity))
+                    track_hash = track_hashes[track_id]
+                    if track_hash is None:
+                        track_hash = track_hashes[track_id] = _track_hash(tracks.keys[track_id])
 
-                        if year not in self.track_play_time:
-                            self.track_play_time[year] = {}
-                        self.track_play_time[year][track_key] = self.track_play_time[year].get(track_key, 0) + ms_played
+                    # _play_key and PlayKeys.add inlined, a new key is mostly past the range of the earlier batches
+                    play_key = (epoch & 0xFFFFFFFF) << 32 | (track_hash + ms_played) & 0xFFFFFFFF
+                    if play_key in recent or low <= play_key <= high and play_key in play_keys:
+                        duplicates += 1
+                        continue
+                    recent[play_key] = None
+                    if len(recent) >= BATCH_KEYS:
+                        play_keys.flush()
+                        recent, low, high = play_keys.recent, play_keys.low, play_keys.high
+                    years.add(year)
 
-                        # Update artist plays and play time
-                        if year not in self.artist_plays:
-                            self.artist_plays[year] = {}
-                        self.artist_plays[year][artist_name] = self.artist_plays[year].get(artist_name, 0) + 1
+                    artist_id = artist_ids.get(artist_name)
+                    if artist_id is None:
+                        artist_id = artists.add(artist_name, artist_name)
+                    if store is not None:
+                        # PlayStore.append inlined
+                        platform = entry.get("platform")
+                        platform_id = platform_ids.get(platform)
+                        if platform_id is None:
+                            platform_id = platform_ids[platform] = platforms.intern(platform, platform)
+                        reason_end = entry.get("reason_end")
+                        reason_end_id = reason_end_ids.get(reason_end)
+                        if reason_end_id is None:
+                            reason_end_id = reason_end_ids[reason_end] = reason_ends.intern(reason_end, reason_end)
+                        append_track(track_id)
+                        append_artist(artist_id)
+                        append_year(year)
+                        append_timestamp(epoch)
+                        append_ms(ms_played)
+                        append_platform(platform_id)
+                        append_reason_end(reason_end_id)
+                        append_shuffle(1 if entry.get("shuffle") else 0)
+                        append_skipped(1 if entry.get("skipped") else 0)
+                        continue
 
-                        if year not in self.artist_play_time:
-                            self.artist_play_time[year] = {}
-                        self.artist_play_time[year][artist_name] = self.artist_play_time[year].get(artist_name, 0) + ms_played
+                    current = year_dicts.get(year)
+                    if current is None:
+                        current = year_dicts[year] = (
+                            self._track_plays.setdefault(year, {}), self._track_play_time.setdefault(year, {}),
+                            self._artist_plays.setdefault(year, {}), self._artist_play_time.setdefault(year, {}))
+                    track_plays, track_play_time, artist_plays, artist_play_time = current
 
-                    except ValueError:
-                        print(f"Invalid timestamp format: {timestamp}")
+                    # Update track plays and play time
+                    track_plays[track_id] = track_plays.get(track_id, 0) + 1
+                    track_play_time[track_id] = track_play_time.get(track_id, 0) + ms_played
+
+                    # Update artist plays and play time
+                    artist_plays[artist_id] = artist_plays.get(artist_id, 0) + 1
+                    artist_play_time[artist_id] = artist_play_time.get(artist_id, 0) + ms_played
+                else:
+                    missing_metadata += 1
+            else:
+                skipped_short += 1
+
+        # Every new play key is a counted play
+        stats.plays_counted += len(play_keys) - keys_before
+        stats.skipped_short += skipped_short
+        stats.missing_metadata += missing_metadata
+        stats.invalid_timestamps += invalid_timestamps
+        stats.duplicates += duplicates
+        elapsed = time.perf_counter() - started
+        if stats.detailed:
+            # What the read, decode and timestamp timers did not take was spent counting
+            elapsed -= sum(stats.stage_seconds.get(stage, 0.0) for stage in ("read", "decode", "timestamps")) - detailed_before
+        stats.add_time("count" if stats.detailed else "stream", elapsed)
 
-        self.track_years = sorted(list(self.track_years))
+        self.track_years = sorted(years)
+        if store is not None:
+            self._views_stale = True
+        self._invalidate()
 
-    def _get_year_dict(self, data_dict, year=None):
+    def _invalidate(self):
         """
-        Returns dict for a single year or combines all years if year is None.
+        Drops the all-time totals and rankings derived from the statistics.
         """
+        self._totals = None
+        self._rank_cache.clear()
+        self._period_stats.clear()
+        self._name_views.clear()
+        self._timeline = None
+
+    def _get_year_dict(self, stat_name, year=None):
+        """
+        Returns the id-keyed dict of statistic stat_name for a single year, periods.Period or queries.Filter,
+        or its all-time totals if year is None.
+        The totals of all four statistics are built together once per data change.
+        """
+        if isinstance(year, (Period, Filter)):
+            entity, _, stat = stat_name.partition("_")
+            return self._get_period_stats(entity, year)[0 if stat == "plays" else 1]
         if year is not None:
-            return data_dict.get(year, {})
-        combined = {}
-        for single_year_dict in data_dict.values():
-            for key, val in single_year_dict.items():
-                combined[key] = combined.get(key, 0) + val
-        return combined
+            return self._get_stat(stat_name).get(year, {})
+        if self._totals is None:
+            names = ("track_plays", "track_play_time", "artist_plays", "artist_play_time")
+            stats = {name: self._get_stat(name) for name in names}
+            with self.load_stats.stage("totals"):
+                self._totals = {name: _sum_years(stats[name]) for name in names}
+        return self._totals[stat_name]
+
+    def _get_period_stats(self, entity, period):
+        """
+        Returns ({key: play_count}, {key: total_ms}) of entity over the plays inside period, or matching a
+        queries.Filter, aggregated from the play store's indexes instead of a scan of every play.
+        """
+        if self.store is None:
+            if isinstance(period, Filter):
+                raise ValueError("Queries need an analyzer created with columnar=True")
+            raise ValueError("Periods other than whole years need an analyzer created with columnar=True")
+        stats = self._period_stats.get((entity, period))
+        if stats is None:
+            with self.load_stats.stage("periods"):
+                if isinstance(period, Filter):
+                    bucket_of = period.period and _BUCKET_FUNCTIONS.get(period.period.kind)
+                    rows = filter_rows(self.store, period, bucket_of)
+                else:
+                    rows = self.store.select(period, _BUCKET_FUNCTIONS.get(period.kind))
+                stats = self.store.aggregate_rows(entity, rows)
+            if len(self._period_stats) >= PERIOD_CACHE_SIZE:
+                dropped_entity, dropped = next(iter(self._period_stats))
+                del self._period_stats[(dropped_entity, dropped)]
+                # Its rankings go with it, or they would pile up the same way
+                for stat_name in (f"{dropped_entity}_plays", f"{dropped_entity}_play_time"):
+                    self._rank_cache.pop((stat_name, dropped), None)
+            self._period_stats[(entity, period)] = stats
+        return stats
+
+    def get_timeline(self, gap=SESSION_GAP_SECONDS):
+        """
+        Returns the timeline.Timeline of every play: listening sessions split at pauses over gap seconds,
+        daily totals, artist streaks and first and last listens, keyed by the ids of self.tracks and self.artists.
+        Built in one pass over the plays in time order and kept until the data changes. Needs columnar mode.
+        """
+        if self.store is None:
+            raise ValueError("Timelines need an analyzer created with columnar=True")
+        if self._timeline is None or self._timeline.gap != gap:
+            with self.load_stats.stage("timeline"):
+                self._timeline = build_timeline(self.store, gap)
+        return self._timeline
+
+    def available_periods(self, granularity):
+        """
+        Returns the labels of the periods of granularity (see periods.GRANULARITIES) holding at least one play,
+        in order. Each label can be passed to get_ranking as its year. Only years are known outside columnar mode.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if granularity == "year" or self.store is None:
+            return [str(year) for year in self.track_years] if granularity == "year" else []
+        if granularity in _BUCKET_FUNCTIONS:
+            values = self.store.bucket_rows(granularity, _BUCKET_FUNCTIONS[granularity])
+            return [value_label(granularity, value) for value in sorted(values)]
+        return range_labels(granularity, self.store.time_order()[1])
+
+    def _ranking(self, stat_name, year=None, size=None):
+        """
+        Returns (keys, complete) where keys are the ids of statistic stat_name for year sorted by value in descending order.
+        With size only the leading size keys are guaranteed, found by heap selection while that is
+        much cheaper than a full sort, and complete tells whether keys holds every key.
+        Rankings are memoized until the data changes, so switching views does not sort again.
+        """
+        cached = self._rank_cache.get((stat_name, year))
+        if cached is not None and (cached[1] or (size is not None and len(cached[0]) >= size)):
+            return cached
+        values = self._get_year_dict(stat_name, year)
+        with self.load_stats.stage("sort"):
+            if size is None or size * 4 >= len(values):
+                cached = (sorted(values, key=values.get, reverse=True), True)
+            else:
+                # Same order as the full sort: nlargest breaks ties by position like sorted does
+                cached = (heapq.nlargest(size, values, key=values.get), False)
+        self._rank_cache[(stat_name, year)] = cached
+        return cached
+
+    def get_ranking(self, entity="track", metric="plays", year=None, limit=None, offset=0, min_plays=0):
+        """
+        Ranks tracks or artists (entity "track" or "artist") by "plays" or "ms" played in descending order.
+        Returns up to limit (name, play_count, total_ms) tuples starting at position offset,
+        counting only keys with at least min_plays plays.
+        year is a year, None for all time, or a period as accepted by periods.parse_period,
+        e.g. "2023-06", "Monday" or "2023-06-01..2023-08-31"; periods other than years need columnar mode.
+        Asking for the first pages of a large library does not sort all of it.
+        """
+        if entity not in ("track", "artist") or metric not in ("plays", "ms"):
+            raise ValueError(f"Unknown ranking: {entity} by {metric}")
+        if isinstance(year, str):
+            year = parse_period(year)
+        plays = self._get_year_dict(f"{entity}_plays", year)
+        play_time = self._get_year_dict(f"{entity}_play_time", year)
+        stat_name = f"{entity}_plays" if metric == "plays" else f"{entity}_play_time"
+        end = None if limit is None else offset + limit
+
+        size = end
+        while True:
+            keys, complete = self._ranking(stat_name, year, size)
+            qualifying = (key for key in keys if key in plays and plays[key] >= min_plays)
+            selected = list(islice(qualifying, offset, end))
+            if complete or len(selected) == limit:
+                break
+            # Keys below min_plays were skipped, look further down the ranking
+            size *= 2
+        names = self._symbols(entity).names
+        return [(names[key], plays[key], play_time.get(key, 0)) for key in selected]
+
+    def query(self, entity="track", metric="plays", where=None, limit=None, offset=0, min_plays=0):
+        """
+        Ranks tracks or artists like get_ranking over the plays matching every condition of where, e.g.
+        {"artist": "Radiohead", "platform": "android", "years": [2022, 2023], "skipped": False};
+        see queries.make_filter for the conditions. Needs columnar mode.
+        Conditions are answered from posting lists and bitmaps built on the first query, and results are cached
+        until the data changes.
+        """
+        return self.get_ranking(entity, metric, make_filter(where), limit, offset, min_plays)
 
     def get_sorted_by_plays(self, year=None):
         """
         Sorts tracks by total plays in descending order.
         """
-        tracks_data = self._get_year_dict(self.track_plays, year)
-        return sorted(tracks_data.items(), key=lambda item: item[1], reverse=True)
+        plays = self._get_year_dict("track_plays", year)
+        names = self.tracks.names
+        return [(names[track], plays[track]) for track in self._ranking("track_plays", year)[0]]
 
     def get_sorted_by_minutes(self, year=None):
         """
         Sorts tracks by total milliseconds played in descending order.
         Returns a list of (track_key, total_plays) tuples.
         """
-        selected_dict = self._get_year_dict(self.track_play_time, year)
-        sorted_data = sorted(selected_dict.items(), key=lambda item: item[1], reverse=True)
+        plays = self._get_year_dict("track_plays", year)
+        names = self.tracks.names
+        return [(names[track], plays[track]) for track in self._ranking("track_play_time", year)[0] if track in plays]
 
-        if year is not None:
-            if year in self.track_plays:
-                return [(track, self.track_plays[year][track]) for track, _ in sorted_data
-                        if track in self.track_plays[year]]
-            else:
-                return []
-        else:
-            all_plays = self._get_year_dict(self.track_plays, None)
-            return [(track, all_plays[track]) for track, _ in sorted_data if track in all_plays]
-            
     def get_artists_sorted_by_plays(self, year=None):
         """
         Sorts artists by total plays in descending order.
         """
-        artists_data = self._get_year_dict(self.artist_plays, year)
-        return sorted(artists_data.items(), key=lambda item: item[1], reverse=True)
+        plays = self._get_year_dict("artist_plays", year)
+        names = self.artists.names
+        return [(names[artist], plays[artist]) for artist in self._ranking("artist_plays", year)[0]]
 
     def get_artists_sorted_by_minutes(self, year=None):
         """
         Sorts artists by total milliseconds played in descending order.
         Returns a list of (artist_name, total_plays) tuples.
         """
-        selected_dict = self._get_year_dict(self.artist_play_time, year)
-        sorted_data = sorted(selected_dict.items(), key=lambda item: item[1], reverse=True)
+        plays = self._get_year_dict("artist_plays", year)
+        names = self.artists.names
+        return [(names[artist], plays[artist]) for artist in self._ranking("artist_play_time", year)[0] if artist in plays]
 
-        if year is not None:
-            if year in self.artist_plays:
-                return [(artist, self.artist_plays[year][artist]) for artist, _ in sorted_data
-                        if artist in self.artist_plays[year]]
-            else:
-                return []
-        else:
-            all_plays = self._get_year_dict(self.artist_plays, None)
-            return [(artist, all_plays[artist]) for artist, _ in sorted_data if artist in all_plays]
+
+if __name__ == "__main__":
+    # Go through the cli module so pickled analyzers refer to analyze_json.SpotifyAnalyzer, not __main__
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from analyze_json import SpotifyAnalyzer
+from cli import expand_paths
+
+# Users handled by one worker process before it is replaced, returning its memory to the system (Python 3.11+)
+TASKS_PER_WORKER = 50
+
+
+def load_manifest(path):
+    """
+    Reads a manifest: a JSON list of {"user_id": ..., "files": [...]} objects.
+    Files may be paths, directories or glob patterns, relative ones are taken from the manifest's directory.
+    Returns a list of (user_id, file_paths) pairs.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    base = os.path.dirname(os.path.abspath(path))
+    users = []
+    for item in manifest:
+        patterns = [os.path.join(base, pattern) for pattern in item["files"]]
+        users.append((str(item["user_id"]), expand_paths(patterns)))
+    return users
+
+
+def analyze_user(user_id, file_paths, top=10):
+    """
+    Worker task: aggregates one user's files and returns their ranked summary.
+    A file that fails to load is recorded in "errors" and the user's other files are still counted.
+    """
+    started = time.perf_counter()
+    # Files are added one at a time, the play keys de-duplicate overlapping exports across the calls
+    analyzer = SpotifyAnalyzer()
+    errors = []
+    with open(os.devnull, "w") as log, contextlib.redirect_stdout(log):
+        for file_path in file_paths:
+            # One call per file, a failing add_files leaves the files loaded before it in place
+            error = analyzer.add_files([file_path])
+            if error:
+                errors.append(error)
+
+    def summary(entity, metric):
+        return [{"name": name, "plays": plays, "ms_played": total_ms}
+                for name, plays, total_ms in analyzer.get_ranking(entity, metric, limit=top)]
+
+    if not file_paths:
+        errors.append("Error: No files found.")
+    return {
+        "user_id": user_id,
+        "status": "ok" if not errors else ("partial" if analyzer.track_years else "failed"),
+        "errors": errors,
+        "files": len(file_paths),
+        "entries": analyzer.entries_read,
+        "plays": analyzer.load_stats.plays_counted,
+        "years": analyzer.track_years,
+        "top_tracks_by_plays": summary("track", "plays"),
+        "top_tracks_by_minutes": summary("track", "ms"),
+        "top_artists_by_plays": summary("artist", "plays"),
+        "top_artists_by_minutes": summary("artist", "ms"),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _failed(user_id, file_paths, error):
+    return {"user_id": user_id, "status": "failed", "errors": [error], "files": len(file_paths),
+            "entries": 0, "plays": 0, "years": [], "seconds": 0.0}
+
+
+def _new_pool(workers):
+    kwargs = {"max_workers": workers}
+    if sys.version_info >= (3, 11):
+        kwargs["max_tasks_per_child"] = TASKS_PER_WORKER
+    return ProcessPoolExecutor(**kwargs)
+
+
+def run_batch(users, workers=None, top=10, on_result=None):
+    """
+    Analyzes every (user_id, file_paths) pair in a shared process pool.
+    At most two tasks per worker are queued at a time, so pending results never pile up in memory.
+    When a worker dies, the users in flight are run again one at a time in a fresh pool,
+    and only one that brings down its worker again is reported as failed.
+    on_result(summary) is called in the calling process as each user finishes.
+    Returns the run report with throughput and the failures per user.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    report = {"users": len(users), "ok": 0, "partial": 0, "failed": 0, "entries": 0, "plays": 0,
+              "failures": {}, "per_user": []}
+    pending = list(reversed(users))
+    suspects = []       # Users in flight when a worker died, any of them may have caused it
+    running = {}        # {future: (user_id, file_paths, retried)}
+    pool = _new_pool(workers)
+    try:
+        while pending or suspects or running:
+            if suspects:
+                # Alone in the pool, a user that kills its worker again is the one to blame
+                if not running:
+                    user_id, file_paths = suspects.pop()
+                    running[pool.submit(analyze_user, user_id, file_paths, top)] = (user_id, file_paths, True)
+            else:
+                while pending and len(running) < workers * 2:
+                    user_id, file_paths = pending.pop()
+                    running[pool.submit(analyze_user, user_id, file_paths, top)] = (user_id, file_paths, False)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                user_id, file_paths, retried = running.pop(future)
+                try:
+                    result = future.result()
+                except (BrokenProcessPool, CancelledError):
+                    # Cancelled when the broken pool was shut down before it failed the task itself
+                    broken = True
+                    if not retried:
+                        suspects.append((user_id, file_paths))
+                        continue
+                    result = _failed(user_id, file_paths, "Error: Worker process died.")
+                except Exception as e:
+                    result = _failed(user_id, file_paths, f"Error: {e}")
+
+                report[result["status"]] += 1
+                report["entries"] += result["entries"]
+                report["plays"] += result["plays"]
+                if result["errors"]:
+                    report["failures"][user_id] = result["errors"]
+                report["per_user"].append({
+                    "user_id": user_id,
+                    "status": result["status"],
+                    "entries": result["entries"],
+                    "seconds": result["seconds"],
+                    "entries_per_second": round(result["entries"] / result["seconds"]) if result["seconds"] else 0,
+                })
+                if on_result is not None:
+                    on_result(result)
+
+            if broken:
+                # Every task still in the broken pool fails the same way and is retried, the others get a fresh pool
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool(workers)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["entries_per_second"] = round(report["entries"] / report["seconds"]) if report["seconds"] else 0
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m batch",
+        description="Rank the streaming histories of many users listed in a manifest.")
+    parser.add_argument("manifest", help='JSON list of {"user_id": ..., "files": [...]} objects')
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 for one per CPU (default: 0)")
+    parser.add_argument("--top", type=int, default=10, help="rows per ranking in each summary (default: 10)")
+    parser.add_argument("--output", help="write one JSON summary per user to this file instead of stdout")
+    parser.add_argument("--report", help="write the run report to this file instead of stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        users = load_manifest(args.manifest)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Error: Invalid manifest {args.manifest}: {e}", file=sys.stderr)
+        return 1
+
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.output, "w", encoding="utf-8")) if args.output else sys.stdout
+
+        def write_result(result):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        report = run_batch(users, args.workers, args.top, write_result)
+
+    report_text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            file.write(report_text + "\n")
+    else:
+        print(report_text, file=sys.stderr)
+    # Failing users do not stop the batch, but the exit status tells a scheduler something went wrong
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from itertools import accumulate, islice
+
+from analyze_json import SpotifyAnalyzer
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is then left out of the results
+    resource = None
+
+SIZES = (10_000, 1_000_000, 10_000_000)
+# Entries per generated file, extended history exports are split into files of a similar size
+PLAYS_PER_FILE = 20_000
+# load_json_files and process_data hold every entry as a dict, about 1 KB each, so they are skipped above this
+IN_MEMORY_MAX_PLAYS = 2_000_000
+# A stage regresses when it is slower than its baseline by this fraction plus MIN_REGRESSION_SECONDS
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.005
+# Share of generated plays skipped before 20 s and of podcast episodes, which have no track metadata
+SKIP_SHARE = 0.15
+PODCAST_SHARE = 0.05
+SORTED_METHODS = ("get_sorted_by_plays", "get_sorted_by_minutes",
+                  "get_artists_sorted_by_plays", "get_artists_sorted_by_minutes")
+# Launches of the app timed by --startup, the first is the cold start, and the most it may take to be ready
+STARTUP_RUNS = 5
+STARTUP_BUDGET_SECONDS = 1.0
+STARTUP_TIMEOUT_SECONDS = 60
+# Exit statuses, argparse itself exits with 2 on bad arguments
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+
+_WORDS = ("Neon", "Velvet", "Échos", "Midnight", "Paper", "Søren", "Electric", "Golden",
+          "Ghost", "東京", "Lunar", "Static", "Wild", "Blue", "Crystal", "Drift")
+_PLATFORMS = ("android", "ios", "windows", "osx", "web_player", "cast_to_device")
+_COUNTRIES = ("DE", "US", "GB", "SE", "JP", "BR")
+_BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_MAX_TRACKS_PER_ARTIST = 40
+
+
+def _spotify_id(text):
+    number = int.from_bytes(blake2b(text.encode(), digest_size=16).digest(), "little")
+    return "".join(_BASE62[number // 62 ** i % 62] for i in range(22))
+
+
+def _name(index):
+    return f"{_WORDS[index % 16]} {_WORDS[index // 16 % 16]} {index}"
+
+
+def _zipf_cum_weights(count, exponent=1.1):
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def generate_history(plays, seed=0, years=5):
+    """
+    Yields plays entries of a synthetic extended streaming history in chronological order, spread over years years.
+    Artists and each artist's tracks are drawn from Zipf distributions, about SKIP_SHARE of the plays stop before
+    20 s and PODCAST_SHARE are podcast episodes without track metadata. The same arguments yield the same entries.
+    """
+    rnd = random.Random(seed)
+    artist_count = max(20, plays // 50)
+    artist_weights = _zipf_cum_weights(artist_count)
+    track_weights = [_zipf_cum_weights(count) for count in range(1, _MAX_TRACKS_PER_ARTIST + 1)]
+    artists = range(artist_count)
+    start = 1546300800      # 2019-01-01
+    mean_gap = years * 365 * 86400 / max(plays, 1)
+    moment = float(start)
+
+    for _ in range(plays):
+        moment += rnd.expovariate(1 / mean_gap)
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(moment)),
+            "platform": rnd.choice(_PLATFORMS),
+            "ms_played": 0,
+            "conn_country": rnd.choice(_COUNTRIES),
+            "ip_addr": f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)}",
+            "master_metadata_track_name": None,
+            "master_metadata_album_artist_name": None,
+            "master_metadata_album_album_name": None,
+            "spotify_track_uri": None,
+            "episode_name": None,
+            "episode_show_name": None,
+            "spotify_episode_uri": None,
+            "reason_start": rnd.choice(("trackdone", "clickrow", "fwdbtn")),
+            "reason_end": "trackdone",
+            "shuffle": rnd.random() < 0.4,
+            "skipped": False,
+            "offline": False,
+            "offline_timestamp": int(moment),
+            "incognito_mode": False,
+        }
+        if rnd.random() < PODCAST_SHARE:
+            show = rnd.randrange(30)
+            episode = rnd.randrange(200)
+            entry["episode_name"] = f"Episode {episode}: {_name(episode)}"
+            entry["episode_show_name"] = f"The {_name(show)} Show"
+            entry["spotify_episode_uri"] = f"spotify:episode:{_spotify_id(f'{show}:{episode}')}"
+            entry["ms_played"] = rnd.randrange(60_000, 3_600_000)
+            yield entry
+            continue
+
+        artist = rnd.choices(artists, cum_weights=artist_weights)[0]
+        # Every artist has a fixed catalog size, its tracks are ranked by popularity like the artists are
+        catalog = track_weights[artist * 7919 % _MAX_TRACKS_PER_ARTIST]
+        track = rnd.choices(range(len(catalog)), cum_weights=catalog)[0]
+        entry["master_metadata_track_name"] = f"{_name(track)} Song"
+        entry["master_metadata_album_artist_name"] = _name(artist)
+        entry["master_metadata_album_album_name"] = f"{_name(artist + track // 10)} Album"
+        entry["spotify_track_uri"] = f"spotify:track:{_spotify_id(f'{artist}:{track}')}"
+        duration = 120_000 + (artist * 31 + track * 17) % 240 * 1000
+        if rnd.random() < SKIP_SHARE:
+            entry["ms_played"] = rnd.randrange(20_000)
+            entry["reason_end"] = "fwdbtn"
+            entry["skipped"] = True
+        else:
+            entry["ms_played"] = duration
+        yield entry
+
+
+def write_history(directory, plays, seed=0, plays_per_file=PLAYS_PER_FILE):
+    """
+    Writes generate_history(plays, seed) as Streaming_History_Audio_<n>.json files into directory.
+    Files left by an earlier call with the same plays and seed are reused. Returns the paths of the files.
+    """
+    manifest_path = os.path.join(directory, "benchmark_data.json")
+    settings = {"plays": plays, "seed": seed, "plays_per_file": plays_per_file}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest["settings"] == settings and all(os.path.exists(path) for path in manifest["paths"]):
+            return manifest["paths"]
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    entries = generate_history(plays, seed)
+    while True:
+        chunk = list(islice(entries, plays_per_file))
+        if not chunk:
+            break
+        paths.append(os.path.join(directory, f"Streaming_History_Audio_{len(paths)}.json"))
+        with open(paths[-1], 'w', encoding='utf-8') as file:
+            json.dump(chunk, file, ensure_ascii=False)
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump({"settings": settings, "paths": paths}, file)
+    return paths
+
+
+def _timed(function, *args):
+    gc.collect()
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None where the resource module is missing.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def time_ui(analyzer):
+    """
+    Seconds the window takes to show the first page of the track and artist rankings, as after loading files.
+    Returns None when there is no display to open a window on.
+    """
+    try:
+        import tkinter as tk
+        from main import RankingView
+        root = tk.Tk()
+    except Exception as e:
+        # ImportError without Tk, tkinter.TclError without a display
+        print(f"UI not timed: {e}")
+        return None
+    try:
+        root.withdraw()
+        views = [RankingView(root, "black", "white") for _ in range(2)]
+        analyzer._invalidate()
+        started = time.perf_counter()
+        for view, entity in zip(views, ("track", "artist")):
+            view.show(entity, lambda offset, limit, entity=entity: analyzer.get_ranking(entity, "plays", None, limit, offset))
+        root.update_idletasks()
+        return time.perf_counter() - started
+    finally:
+        root.destroy()
+
+
+def run_size(plays, data_dir, seed=0, in_memory_limit=IN_MEMORY_MAX_PLAYS, ui=True):
+    """
+    Times every stage on a generated history of plays entries.
+    Returns {"peak_rss_mb": ..., "stages": {stage: {"seconds": ..., "plays_per_second": ...}}}.
+    Meant to run in a fresh process, so the peak RSS is that of this size alone.
+    """
+    paths = write_history(os.path.join(data_dir, f"{plays}_{seed}"), plays, seed)
+    stages = {}
+
+    def record(stage, seconds):
+        stages[stage] = {"seconds": round(seconds, 6), "plays_per_second": round(plays / seconds) if seconds else None}
+
+    with open(os.devnull, "w") as log, contextlib.redirect_stdout(log):
+        if plays <= in_memory_limit:
+            analyzer = SpotifyAnalyzer()
+            seconds, entries = _timed(analyzer.load_json_files, paths)
+            record("load_json_files", seconds)
+            record("process_data", _timed(analyzer.process_data, entries)[0])
+            del entries, analyzer
+
+        analyzer = SpotifyAnalyzer()
+        record("process_files", _timed(analyzer.process_files, paths)[0])
+        for method in SORTED_METHODS:
+            # Cold, as right after loading: the totals and rankings are rebuilt for every method
+            analyzer._invalidate()
+            record(method, _timed(getattr(analyzer, method))[0])
+        if ui:
+            seconds = time_ui(analyzer)
+            if seconds is not None:
+                record("ui_first_page", seconds)
+    return {"peak_rss_mb": peak_rss_mb(), "stages": stages}
+
+
+def time_startup(command, runs=STARTUP_RUNS):
+    """
+    Launches the app with command runs times, each exiting as soon as its analyzer is ready.
+    Returns the seconds from launch until the window appeared and the analyzer was ready, of the first launch
+    ("cold_window", "cold_ready") and the median of all ("window", "ready").
+    Returns None when the app did not start, e.g. without a display.
+    """
+    from main import STARTUP_REPORT_ENV
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, "startup.json")
+        env = dict(os.environ, **{STARTUP_REPORT_ENV: report_path})
+        for _ in range(runs):
+            started = time.time()
+            completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                       timeout=STARTUP_TIMEOUT_SECONDS)
+            if not os.path.exists(report_path):
+                error = completed.stderr.decode(errors="replace").strip().splitlines()
+                print(f"Start-up not timed: {error[-1] if error else f'exit status {completed.returncode}'}")
+                return None
+            with open(report_path, encoding="utf-8") as file:
+                report = json.load(file)
+            os.remove(report_path)
+            timings.append({stage: report[stage] - started for stage in ("window", "ready")})
+    result = {f"cold_{stage}": round(timings[0][stage], 6) for stage in ("window", "ready")}
+    for stage in ("window", "ready"):
+        result[stage] = round(statistics.median(timing[stage] for timing in timings), 6)
+    return result
+
+
+def startup_commands(executable=None):
+    """
+    Returns {name: command} of the builds to time: the source run and, if given, the packaged executable.
+    """
+    commands = {"source": [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]}
+    if executable:
+        commands["frozen"] = [os.path.abspath(executable)]
+    return commands
+
+
+def over_budget(results, budget=STARTUP_BUDGET_SECONDS):
+    """
+    Returns a message for every build whose cold start took longer than budget seconds until it was ready.
+    """
+    return [f"{name} cold start took {timings['cold_ready']:.3f} s, budget {budget:.3f} s"
+            for name, timings in results.get("startup", {}).items() if timings["cold_ready"] > budget]
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns a message for every stage of results slower than in baseline, and every size whose peak RSS grew,
+    by more than tolerance. Stages or sizes missing from either side are not compared.
+    """
+    regressions = []
+    for size, result in results["sizes"].items():
+        base = baseline.get("sizes", {}).get(size)
+        if base is None:
+            continue
+        for stage, timing in result["stages"].items():
+            old = base["stages"].get(stage)
+            if old is not None and timing["seconds"] > old["seconds"] * (1 + tolerance) + MIN_REGRESSION_SECONDS:
+                regressions.append(f"{size} plays: {stage} took {timing['seconds']:.3f} s, "
+                                   f"baseline {old['seconds']:.3f} s")
+        if result["peak_rss_mb"] and base.get("peak_rss_mb") and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{size} plays: peak RSS {result['peak_rss_mb']} MB, baseline {base['peak_rss_mb']} MB")
+    for name, timings in results.get("startup", {}).items():
+        base = baseline.get("startup", {}).get(name, {})
+        for stage, seconds in timings.items():
+            old = base.get(stage)
+            if old is not None and seconds > old * (1 + tolerance) + MIN_REGRESSION_SECONDS:
+                regressions.append(f"{name} start-up: {stage} took {seconds:.3f} s, baseline {old:.3f} s")
+    return regressions
+
+
+def parse_size(text):
+    """
+    Parses a play count such as 10000, 10k or 1M.
+    """
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1_000_000}.get(text[-1:], 1)
+    number = int(text[:-1] if scale != 1 else text)
+    if number <= 0:
+        raise ValueError(f"Invalid size {text!r}")
+    return number * scale
+
+
+def write_report(results, out):
+    for name, timings in results.get("startup", {}).items():
+        out.write(f"{name} start-up\n")
+        for stage, seconds in timings.items():
+            out.write(f"  {stage:32} {seconds:10.3f} s\n")
+    for size, result in results["sizes"].items():
+        rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']} MB"
+        out.write(f"{int(size):,} plays, peak RSS {rss}\n")
+        for stage, timing in result["stages"].items():
+            rate = timing["plays_per_second"]
+            out.write(f"  {stage:32} {timing['seconds']:10.3f} s  {rate or 0:>12,} plays/s\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="Time loading and ranking generated Spotify histories and compare against a baseline.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES),
+                        help="comma separated play counts such as 10k,1M (default: 10k,1M,10M)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated histories (default: 0)")
+    parser.add_argument("--data-dir", metavar="PATH",
+                        help="keep generated histories here and reuse them (default: a temporary directory)")
+    parser.add_argument("--in-memory-limit", default=str(IN_MEMORY_MAX_PLAYS),
+                        help="largest size load_json_files and process_data are timed at (default: 2M)")
+    parser.add_argument("--no-ui", action="store_true", help="do not time the window")
+    parser.add_argument("--startup", action="store_true",
+                        help="time how long the app takes to start instead of loading histories")
+    parser.add_argument("--executable", metavar="PATH",
+                        help="with --startup, also time this packaged build, e.g. dist/main/main")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="with --startup, the most seconds a cold start may take (default: 1.0)")
+    parser.add_argument("--output", metavar="PATH", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", metavar="PATH", help="report regressions against these results")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the --baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown as a fraction (default: 0.25)")
+    return parser
+
+
+def main(argv=None, out=None):
+    """
+    Command line entry point. Returns EXIT_REGRESSION if a stage is slower than the baseline
+    or a cold start is over budget, otherwise EXIT_OK.
+    """
+    out = sys.stdout if out is None else out
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+        in_memory_limit = parse_size(args.in_memory_limit)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+    if args.executable and not args.startup:
+        parser.error("--executable needs --startup")
+
+    results = {"python": sys.version.split()[0], "platform": sys.platform, "sizes": {}}
+    if args.startup:
+        results["startup"] = {}
+        for name, command in startup_commands(args.executable).items():
+            timings = time_startup(command)
+            if timings is not None:
+                results["startup"][name] = timings
+    else:
+        with contextlib.ExitStack() as stack:
+            data_dir = args.data_dir or stack.enter_context(tempfile.TemporaryDirectory())
+            for size in sizes:
+                # A fresh process per size, so its peak RSS is not that of a larger size run before
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results["sizes"][str(size)] = pool.submit(
+                        run_size, size, data_dir, args.seed, in_memory_limit, not args.no_ui).result()
+    write_report(results, out)
+    failures = [f"Over budget: {message}" for message in over_budget(results, args.startup_budget)]
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        failures += [f"Regression: {message}" for message in regressions]
+    for message in failures:
+        out.write(message + "\n")
+    return EXIT_REGRESSION if failures else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import os
+import heapq
+import sys
+from datetime import datetime, timezone
+
+from analyze_json import SpotifyAnalyzer
+from json_backends import BACKENDS
+from load_stats import PROFILERS, LoadStats, resolve_profiler
+from periods import Period, parse_period
+from timeline import SESSION_GAP_SECONDS, day_date
+
+# Exit statuses, argparse itself exits with 2 on bad arguments
+EXIT_OK = 0
+EXIT_LOAD_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NO_DATA = 3
+# Columns of every --timeline listing
+TIMELINE_COLUMNS = {
+    "sessions": ("start", "end", "plays", "ms_played"),
+    "days": ("date", "plays", "ms_played"),
+    "streaks": ("artist", "days", "last_day"),
+    "discoveries": ("track", "first_listen", "last_listen"),
+}
+
+
+def expand_paths(patterns):
+    """
+    Expands files, directories (every *.json inside) and glob patterns into a sorted, de-duplicated list of files.
+    """
+    file_paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            file_paths.extend(glob.glob(os.path.join(pattern, "*.json")))
+        elif glob.has_magic(pattern):
+            file_paths.extend(glob.glob(pattern, recursive=True))
+        else:
+            # Missing files are reported by the analyzer
+            file_paths.append(pattern)
+    return sorted(set(file_paths))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m analyze_json",
+        description="Rank the tracks or artists of Spotify streaming history exports without the UI.")
+    parser.add_argument("paths", nargs="*", help="export files, directories of *.json files or glob patterns")
+    parser.add_argument("--entity", choices=("tracks", "artists"), default="tracks", help="what to rank (default: tracks)")
+    parser.add_argument("--sort", choices=("plays", "minutes"), default="plays", help="ranking metric (default: plays)")
+    parser.add_argument("--year", type=int, help="only count plays from this year")
+    parser.add_argument("--period", help="only count plays from this period, e.g. 2023-06, 2023-W23, Monday, 14:00 "
+                                         "or 2023-06-01..2023-08-31 (UTC)")
+    parser.add_argument("--timeline", choices=TIMELINE_COLUMNS,
+                        help="instead of a ranking, list the longest listening sessions, the days with the most "
+                             "minutes, the artists' longest streaks of daily plays or the tracks most recently "
+                             "played for the first time, over all plays")
+    parser.add_argument("--session-gap", type=int, default=SESSION_GAP_SECONDS // 60, metavar="MINUTES",
+                        help="with --timeline, a pause this long starts a new session (default: 30)")
+    parser.add_argument("--top", type=int, default=10, help="number of rows to output, 0 for all (default: 10)")
+    parser.add_argument("--format", choices=("text", "json", "csv"), default="text", help="output format (default: text)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU (default: 1)")
+    parser.add_argument("--cache", metavar="PATH", help="reuse per-file aggregates from this cache file")
+    parser.add_argument("--snapshot", metavar="PATH", help="start from the plays of this snapshot, paths are added to it")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="write every play loaded to this snapshot file")
+    parser.add_argument("--json-backend", choices=BACKENDS,
+                        help="JSON decoder, auto uses orjson when installed (default: $SPOTIFY_JSON_BACKEND or auto)")
+    parser.add_argument("--used-fields", action="store_true", default=None,
+                        help="keep only the fields the analyzer reads from each decoded entry")
+    parser.add_argument("--stats", action="store_true",
+                        help="report counters and the time spent reading, decoding, parsing timestamps, counting "
+                             "and sorting on stderr, which makes loading slightly slower")
+    parser.add_argument("--profile", choices=PROFILERS,
+                        help="profile the load and report on stderr (default: $SPOTIFY_PROFILE or none)")
+    parser.add_argument("--quiet", action="store_true", help="do not report loaded files on stderr")
+    return parser
+
+
+def write_rows(rows, args, out, load_stats=None):
+    if args.format == "json":
+        result = {
+            "entity": args.entity,
+            "sort": args.sort,
+            "year": args.year,
+            "period": args.period,
+            "results": [{"rank": rank, "name": name, "plays": plays, "ms_played": total_ms}
+                        for rank, (name, plays, total_ms) in enumerate(rows, start=1)],
+        }
+        if load_stats is not None:
+            result["load_stats"] = load_stats
+        json.dump(result, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+    elif args.format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["rank", "name", "plays", "ms_played", "minutes"])
+        for rank, (name, plays, total_ms) in enumerate(rows, start=1):
+            writer.writerow([rank, name, plays, total_ms, f"{total_ms / 60000:.2f}"])
+    else:
+        for rank, (name, plays, total_ms) in enumerate(rows, start=1):
+            out.write(f"{rank}. {name}: {plays} plays, {total_ms / 60000:.2f} minutes\n")
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def timeline_rows(analyzer, kind, gap, limit=None):
+    """
+    Returns up to limit rows of a --timeline listing, tuples of the TIMELINE_COLUMNS of kind with times in UTC.
+    """
+    timeline = analyzer.get_timeline(gap)
+    if kind == "sessions":
+        return [(_utc(start), _utc(end), plays, ms) for start, end, plays, ms in timeline.longest_sessions(limit)]
+    if kind == "days":
+        days = timeline.daily_totals()
+        days = sorted(days, key=lambda day: day[2], reverse=True)[:limit]
+        return [(day_date(day).isoformat(), plays, ms) for day, plays, ms in days]
+    if kind == "streaks":
+        names = analyzer.artists.names
+        return [(names[artist_id], days, day_date(last_day).isoformat())
+                for artist_id, days, last_day in timeline.longest_streaks(limit)]
+    names = analyzer.tracks.names
+    played = (track_id for track_id in range(len(names)) if timeline.listens(track_id) is not None)
+    if limit is None:
+        track_ids = sorted(played, key=timeline.first_listens.__getitem__, reverse=True)
+    else:
+        track_ids = heapq.nlargest(limit, played, key=timeline.first_listens.__getitem__)
+    return [(names[track_id], *map(_utc, timeline.listens(track_id))) for track_id in track_ids]
+
+
+def write_timeline(kind, rows, args, out, load_stats=None):
+    columns = TIMELINE_COLUMNS[kind]
+    if args.format == "json":
+        result = {
+            "timeline": kind,
+            "session_gap_minutes": args.session_gap,
+            "results": [{"rank": rank, **dict(zip(columns, row))} for rank, row in enumerate(rows, start=1)],
+        }
+        if load_stats is not None:
+            result["load_stats"] = load_stats
+        json.dump(result, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+    elif args.format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["rank", *columns])
+        for rank, row in enumerate(rows, start=1):
+            writer.writerow([rank, *row])
+    else:
+        for rank, row in enumerate(rows, start=1):
+            out.write(f"{rank}. " + ", ".join(f"{column}: {value}" for column, value in zip(columns, row)) + "\n")
+
+
+def main(argv=None, out=None):
+    """
+    Command line entry point. Returns the process exit status.
+    """
+    out = sys.stdout if out is None else out
+    args = build_parser().parse_args(argv)
+    if args.top < 0 or args.workers < 0 or args.session_gap < 0:
+        print("Error: --top, --workers and --session-gap cannot be negative.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.timeline and (args.year is not None or args.period):
+        print("Error: --timeline covers every play, it cannot be combined with --year or --period.", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        period = parse_period(args.period) if args.period else args.year
+    except ValueError as e:
+        print(f"Error: {e}.", file=sys.stderr)
+        return EXIT_USAGE
+    if not args.paths and not args.snapshot:
+        print("Error: Give export paths, a --snapshot or both.", file=sys.stderr)
+        return EXIT_USAGE
+    file_paths = expand_paths(args.paths)
+    if args.paths and not file_paths:
+        print("Error: No files match the given paths.", file=sys.stderr)
+        return EXIT_LOAD_ERROR
+
+    try:
+        # Snapshots, timelines and periods shorter than a year need the per-play records,
+        # which only the columnar mode keeps
+        columnar = bool(args.save_snapshot or args.timeline) or isinstance(period, Period)
+        load_stats = LoadStats(detailed=args.stats, profiler=resolve_profiler(args.profile))
+        analyzer = SpotifyAnalyzer(columnar=columnar, json_backend=args.json_backend,
+                                   used_fields_only=args.used_fields, load_stats=load_stats)
+    except ValueError as e:
+        print(f"Error: {e}.", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.cache:
+        # Imported only when asked for, sqlite3 is not needed otherwise
+        import sqlite3
+        from aggregate_cache import AggregateCache
+        try:
+            analyzer.cache = AggregateCache(args.cache)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error: Cannot open cache {args.cache}: {e}.", file=sys.stderr)
+            return EXIT_USAGE
+    # The analyzer reports progress with print, keep stdout for the results
+    log = open(os.devnull, "w") if args.quiet else sys.stderr
+    try:
+        with contextlib.redirect_stdout(log):
+            error = analyzer.load_snapshot(args.snapshot) if args.snapshot else None
+            if not error and file_paths:
+                error = analyzer.add_files(file_paths, workers=args.workers or None)
+            if not error and args.save_snapshot:
+                error = analyzer.save_snapshot(args.save_snapshot)
+    finally:
+        if args.quiet:
+            log.close()
+        if analyzer.cache is not None:
+            analyzer.cache.close()
+    if error:
+        print(error, file=sys.stderr)
+        return EXIT_LOAD_ERROR
+    if not analyzer.track_years:
+        print("Error: No data to process.", file=sys.stderr)
+        return EXIT_NO_DATA
+
+    if args.timeline:
+        rows = timeline_rows(analyzer, args.timeline, args.session_gap * 60, limit=args.top or None)
+    else:
+        entity = "track" if args.entity == "tracks" else "artist"
+        metric = "plays" if args.sort == "plays" else "ms"
+        rows = analyzer.get_ranking(entity, metric, period, limit=args.top or None)
+    if not rows:
+        print("Error: No plays in the chosen year or period.", file=sys.stderr)
+        return EXIT_NO_DATA
+    if args.timeline:
+        write_timeline(args.timeline, rows, args, out, analyzer.get_load_stats() if args.stats else None)
+    else:
+        write_rows(rows, args, out, analyzer.get_load_stats() if args.stats else None)
+    if args.stats or load_stats.profile_report:
+        print(analyzer.load_report(), file=sys.stderr)
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import importlib.util
+import json
+import os
+import re
+
+# Characters read from disk per chunk while streaming a JSON array
+READ_CHUNK_SIZE = 1 << 16
+# Files above this size are streamed by the "auto" backend, orjson would hold the whole file in memory
+ORJSON_MAX_BYTES = 256 << 20
+# Decoders selectable with SpotifyAnalyzer(json_backend=...) or $SPOTIFY_JSON_BACKEND
+BACKENDS = ("auto", "stdlib", "orjson")
+BACKEND_ENV = "SPOTIFY_JSON_BACKEND"
+# Set to 1 to keep only USED_FIELDS of every entry, see iter_entries
+USED_FIELDS_ENV = "SPOTIFY_JSON_USED_FIELDS"
+# The fields of an export entry the analyzer reads
+USED_FIELDS = ("ts", "ms_played", "master_metadata_track_name", "master_metadata_album_artist_name",
+               "spotify_track_uri", "platform", "reason_end", "shuffle", "skipped")
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DELIMITER = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+
+
+def orjson_available():
+    return importlib.util.find_spec("orjson") is not None
+
+
+def resolve_backend(name=None):
+    """
+    Returns the backend to use: name, or $SPOTIFY_JSON_BACKEND if name is None, or "auto".
+    Raises ValueError for an unknown backend or one that is not installed.
+    """
+    if name is None:
+        name = os.environ.get(BACKEND_ENV) or "auto"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}, expected one of: {', '.join(BACKENDS)}")
+    if name == "orjson" and not orjson_available():
+        raise ValueError("JSON backend 'orjson' is not installed")
+    return name
+
+
+def resolve_fields(used_fields_only=None):
+    """
+    Returns USED_FIELDS if entries should be reduced to them, else None.
+    used_fields_only=None reads $SPOTIFY_JSON_USED_FIELDS.
+    """
+    if used_fields_only is None:
+        used_fields_only = os.environ.get(USED_FIELDS_ENV, "").lower() in ("1", "true", "yes")
+    return USED_FIELDS if used_fields_only else None
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the elements of the top-level JSON array in file one at a time.
+    Only the current chunk and the elements decoded from it are held in memory.
+    """
+    scan_once = _DECODER.scan_once
+    buffer = ""
+    pos = 0
+    eof = False
+    batch = True
+
+    def read_more(size):
+        nonlocal buffer, pos, eof, batch
+        chunk = file.read(size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        batch = True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return
+            read_more(chunk_size)
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != "[":
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+    skip_whitespace()
+    if buffer[pos:pos + 1] == "]":
+        pos += 1
+    else:
+        while True:
+            end = -1
+            if batch:
+                # Decode every element up to the last "}" of the chunk in one call, which shares the key
+                # strings between them. "[" + text + "]" only decodes in full if the brackets of text balance,
+                # so on success text is exactly a run of complete elements. Tried once per chunk read.
+                batch = False
+                cut = buffer.rfind("}", pos) + 1
+                if cut > pos:
+                    text = "[" + buffer[pos:cut] + "]"
+                    try:
+                        values, text_end = scan_once(text, 0)
+                        if text_end == len(text):
+                            end = cut
+                    except (StopIteration, json.JSONDecodeError):
+                        pass
+            if end < 0:
+                try:
+                    value, end = scan_once(buffer, pos)
+                except StopIteration as e:
+                    if eof:
+                        raise json.JSONDecodeError("Expecting value", buffer, e.value) from None
+                    end = len(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = len(buffer)
+                # A number running up to the end of the buffer, or stopped at the "." or exponent it was cut in,
+                # may continue in the next chunk
+                if not eof and (end == len(buffer) or (buffer[end] in ".eE+-" and isinstance(value, (int, float)))):
+                    # Grow the read size with the buffer so a large element is not re-parsed once per chunk
+                    read_more(max(chunk_size, len(buffer)))
+                    continue
+                values = (value,)
+            yield from values
+
+            match = _DELIMITER.match(buffer, end)
+            if match is not None and (match.end() < len(buffer) or eof):
+                pos = match.end()
+                if match.group(1) == "]":
+                    break
+                continue
+            # The delimiter or the whitespace around it reaches the end of the buffer
+            pos = end
+            skip_whitespace()
+            delimiter = buffer[pos:pos + 1]
+            pos += 1
+            if delimiter == "]":
+                break
+            if delimiter != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos - 1)
+            skip_whitespace()
+    skip_whitespace()
+    if pos < len(buffer):
+        raise json.JSONDecodeError("Extra data", buffer, pos)
+
+
+def _iter_orjson(file):
+    """
+    Decodes the whole file with orjson, then hands the entries out one at a time,
+    dropping the reference to each so it can be freed once the caller is done with it.
+    The bytes of a text file are read from its binary buffer, orjson decodes UTF-8 itself.
+    """
+    import orjson
+
+    buffer = getattr(file, "buffer", None)
+    data = buffer.read() if buffer is not None else None
+    if not isinstance(data, bytes):
+        # A text stream without a binary buffer, e.g. io.StringIO
+        data = file.read()
+    entries = orjson.loads(data)
+    if not isinstance(entries, list):
+        raise json.JSONDecodeError("Expecting '['", "", 0)
+    for index in range(len(entries)):
+        entry = entries[index]
+        entries[index] = None
+        yield entry
+
+
+def _file_size(file):
+    try:
+        return os.fstat(file.fileno()).st_size
+    except (AttributeError, OSError, TypeError, ValueError):
+        return None
+
+
+def iter_entries(file, backend="stdlib", fields=None):
+    """
+    Yields the entries of the export in file with the given backend:
+    "stdlib" streams the file through json, "orjson" decodes it at once with orjson,
+    and "auto" uses orjson when it is installed and the file is at most ORJSON_MAX_BYTES.
+    With fields, every entry is reduced to a dict of just those keys right after decoding,
+    so only the fields in use are kept by callers that hold on to the entries.
+    """
+    if backend == "auto":
+        size = _file_size(file)
+        use_orjson = orjson_available() and (size is None or size <= ORJSON_MAX_BYTES)
+        backend = "orjson" if use_orjson else "stdlib"
+    entries = _iter_orjson(file) if backend == "orjson" else iter_json_array(file)
+    if fields is None:
+        return entries
+    return ({key: entry[key] for key in fields if key in entry} if isinstance(entry, dict) else entry
+            for entry in entries)
@@ -0,0 +1,189 @@
+import io
+import os
+import time
+from contextlib import contextmanager
+
+# Profilers selectable with LoadStats(profiler=...) or $SPOTIFY_PROFILE
+PROFILERS = ("cprofile", "tracemalloc")
+PROFILER_ENV = "SPOTIFY_PROFILE"
+# Functions or allocation sites listed in a captured profile
+PROFILE_ROWS = 25
+# Counters in report order
+COUNTERS = ("files", "bytes_read", "entries_decoded", "plays_counted", "skipped_short", "missing_metadata",
+            "invalid_timestamps", "duplicates", "cache_hits")
+# Marks the end of the entries in timed_entries, where None is a valid JSON value
+_END = object()
+
+
+def resolve_profiler(name=None):
+    """
+    Returns the profiler to capture loads with: name, or $SPOTIFY_PROFILE if name is None. "" and None disable it.
+    Raises ValueError for an unknown profiler.
+    """
+    if name is None:
+        name = os.environ.get(PROFILER_ENV) or None
+    if name and name not in PROFILERS:
+        raise ValueError(f"Unknown profiler {name!r}, expected one of: {', '.join(PROFILERS)}")
+    return name or None
+
+
+class _TimedFile:
+    """
+    File wrapper adding the time spent in read() to the "read" stage of stats.
+    """
+
+    def __init__(self, file, stats):
+        self._file = file
+        self._stats = stats
+
+    def read(self, *args):
+        started = time.perf_counter()
+        data = self._file.read(*args)
+        elapsed = time.perf_counter() - started
+        self._stats.add_time("read", elapsed)
+        # Reads happen while the decoder pulls the next entry, that time is not decoding
+        self._stats.add_time("decode", -elapsed)
+        return data
+
+    @property
+    def buffer(self):
+        return _TimedFile(self._file.buffer, self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class LoadStats:
+    """
+    Counters and stage timings of the data loaded into a SpotifyAnalyzer, see COUNTERS and stage_seconds.
+    Counting and the coarse stages cost a few additions per entry. With detailed=True the "stream" stage,
+    reading, decoding and counting the entries of files, is split into "read", "decode", "timestamps" and "count",
+    which times every entry and makes loading noticeably slower.
+    profiler ("cprofile" or "tracemalloc") captures the loads of the analyzer into profile_report.
+    """
+
+    def __init__(self, detailed=False, profiler=None):
+        self.detailed = detailed
+        self.profiler = resolve_profiler(profiler) if profiler else None
+        self.profile_report = None
+        self.reset()
+
+    def reset(self):
+        """
+        Zeroes the counters and timings, keeping the detailed and profiler settings.
+        """
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.stage_seconds = {}
+        self.profile_report = None
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed(self, stage, function):
+        """
+        Returns function wrapped to add the time of every call to stage.
+        """
+        perf_counter = time.perf_counter
+        add_time = self.add_time
+
+        def wrapper(*args):
+            started = perf_counter()
+            try:
+                return function(*args)
+            finally:
+                add_time(stage, perf_counter() - started)
+
+        return wrapper
+
+    def timed_entries(self, entries):
+        """
+        Yields the entries of the iterable, adding the time spent producing each to the "decode" stage.
+        """
+        perf_counter = time.perf_counter
+        iterator = iter(entries)
+        while True:
+            started = perf_counter()
+            entry = next(iterator, _END)
+            self.add_time("decode", perf_counter() - started)
+            if entry is _END:
+                return
+            yield entry
+
+    def timed_file(self, file):
+        return _TimedFile(file, self) if self.detailed else file
+
+    def merge(self, other):
+        """
+        Adds the counters and timings of another LoadStats, e.g. of a file loaded by a worker process.
+        """
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for stage, seconds in other.stage_seconds.items():
+            self.add_time(stage, seconds)
+
+    @contextmanager
+    def capture(self):
+        """
+        Runs the block under self.profiler, leaving its report in profile_report. Does nothing without a profiler.
+        Work done in worker processes is not part of the report.
+        """
+        if self.profiler == "cprofile":
+            import cProfile
+            import pstats
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_ROWS)
+                self.profile_report = stream.getvalue()
+        elif self.profiler == "tracemalloc":
+            import tracemalloc
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if started:
+                    tracemalloc.stop()
+                lines = [f"Traced memory: {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB"]
+                lines.extend(str(statistic) for statistic in snapshot.statistics("lineno")[:PROFILE_ROWS])
+                self.profile_report = "\n".join(lines) + "\n"
+        else:
+            yield
+
+    def as_dict(self, distinct_keys=None):
+        """
+        Returns the counters, the stage timings and, if given, distinct_keys ({"tracks": {year: count}, ...}).
+        """
+        stats = {name: getattr(self, name) for name in COUNTERS}
+        stats["stage_seconds"] = {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()}
+        if distinct_keys is not None:
+            stats["distinct_keys"] = distinct_keys
+        return stats
+
+    def format(self, distinct_keys=None):
+        """
+        Returns the statistics as text for display, see as_dict.
+        """
+        lines = [f"{name.replace('_', ' ').capitalize()}: {getattr(self, name):,}" for name in COUNTERS]
+        for stage, seconds in sorted(self.stage_seconds.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"Time {stage}: {seconds:.3f} s")
+        for entity, per_year in (distinct_keys or {}).items():
+            lines.append(f"Distinct {entity}: " + ", ".join(f"{year}: {count:,}" for year, count in per_year.items()))
+        return "\n".join(lines)
@@ -1,19 +1,124 @@
-import ctypes
+import json
+import os
+import queue
+import sys
+import threading
+import time
 import tkinter as tk
-from tkinter import filedialog, messagebox, Text, Scrollbar, Frame, Button, Label, OptionMenu, StringVar, ttk
-from analyze_json import SpotifyAnalyzer
+from tkinter import filedialog, messagebox, Scrollbar, Frame, Button, Label, OptionMenu, StringVar, ttk
+from periods import parse_period
+
+# Rows fetched from the analyzer at a time while scrolling a ranking
+PAGE_SIZE = 200
+# How often the Tk thread checks on a load running in the background, in ms
+LOAD_POLL_INTERVAL = 100
+# Choices of the period unit dropdown and the analyzer granularity behind each
+PERIOD_UNITS = {"Year": "year", "Month": "month", "Week": "week", "Weekday": "weekday", "Hour": "hour"}
+# When set to a file path, the app writes the times its window appeared and its analyzer was ready there
+# as JSON ({"window": epoch seconds, "ready": epoch seconds}) and exits, see benchmark.time_startup
+STARTUP_REPORT_ENV = "SPOTIFY_STARTUP_REPORT"
+# Rows of every list in the sessions and streaks window, and the pause in seconds that starts a new session
+TIMELINE_ROWS = 20
+TIMELINE_GAP = 30 * 60
+
+
+class RankingView:
+    """
+    Title plus a Treeview listing a ranking. Rows are fetched a page at a time,
+    the next page only when the list is scrolled close to its end.
+    """
+
+    def __init__(self, parent, bg_color, text_color):
+        self.title = Label(parent, font=("Arial", 12), bg=bg_color, fg=text_color, justify=tk.LEFT, anchor="w")
+        self.title.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+
+        frame = Frame(parent, bg=bg_color)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(frame, columns=("rank", "name", "plays", "minutes"), show="headings")
+        for column, heading, width, anchor in (("rank", "#", 60, "e"), ("name", "Name", 700, "w"),
+                                               ("plays", "Plays", 100, "e"), ("minutes", "Minutes", 120, "e")):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor=anchor, stretch=(column == "name"))
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = Scrollbar(frame, command=self.tree.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.config(yscrollcommand=self.on_scroll)
+
+        self.fetch_page = None
+        self.loaded = 0
+
+    def show_message(self, message):
+        self.tree.delete(*self.tree.get_children())
+        self.fetch_page = None
+        self.title.config(text=message)
+
+    def show(self, title, fetch_page):
+        """
+        fetch_page(offset, limit) returns the (name, play_count, total_ms) rows of the ranking at offset
+        """
+        self.show_message(title)
+        self.fetch_page = fetch_page
+        self.loaded = 0
+        self.load_page()
+
+    def load_page(self):
+        rows = self.fetch_page(self.loaded, PAGE_SIZE)
+        for rank, (name, play_count, total_ms) in enumerate(rows, start=self.loaded + 1):
+            minutes = f"{total_ms / 60000:.2f}" if total_ms > 0 else "n/a"
+            self.tree.insert("", tk.END, values=(rank, name, play_count, minutes))
+        self.loaded += len(rows)
+        if len(rows) < PAGE_SIZE:
+            # Whole ranking is shown
+            self.fetch_page = None
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.fetch_page is not None and float(last) > 0.9:
+            self.load_page()
+
 
 class SpotifyAnalyzerUI:
     def __init__(self, root):
         self.root = root
-        self.analyzer = SpotifyAnalyzer()
-        self.selected_year = StringVar(root)
-        self.selected_year.set("All Time")
+        # Created by init_analyzer once the window is on screen
+        self.analyzer = None
+        self.period_unit = StringVar(root)
+        self.period_unit.set("Year")
+        self.selected_period = StringVar(root)
+        self.selected_period.set("All Time")
+        # Period the rankings show: its text and its parsed form, None for all time
+        self.period_text = "All Time"
+        self.period = None
         # Add variable to track current sort method
         self.current_sort = "plays"  # Default sort is by plays
-        # Add a trace to the selected_year variable
-        self.selected_year.trace("w", self.year_changed)
+        # Loading runs in a background thread which reports back through load_queue
+        self.loading = False
+        self.load_thread = None
+        self.load_queue = queue.Queue()
+        self.cancel_requested = threading.Event()
+        self.load_started = 0.0
         self.setup_ui()
+        # Idle callbacks run in order, so this one runs after Tk has drawn the window set up above
+        self.root.after_idle(self.init_analyzer)
+
+    def init_analyzer(self):
+        """
+        Imports the analyzer and opens the aggregate cache, unless that was done already
+        """
+        if self.analyzer is not None:
+            return
+        shown = time.time()
+        from aggregate_cache import open_default_cache
+        from analyze_json import SpotifyAnalyzer
+        # Columnar mode keeps every play's timestamp, which the month, week, weekday and hour periods need
+        self.analyzer = SpotifyAnalyzer(columnar=True, cache=open_default_cache())
+
+        report_path = os.environ.get(STARTUP_REPORT_ENV)
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as file:
+                json.dump({"window": shown, "ready": time.time()}, file)
+            self.root.destroy()
 
     def setup_ui(self):
         self.root.title("Spotify Streaming History Analyzer")
@@ -32,17 +137,27 @@ class SpotifyAnalyzerUI:
         top_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=10)
 
         # Add buttons to top frame with specified colors
-        select_button = Button(top_frame, text="Select JSON Files", command=self.select_files, font=("Arial", 12),
+        self.select_button = select_button = Button(top_frame, text="Select JSON Files", command=self.select_files, font=("Arial", 12),
                               bg=DARK_GREEN, fg=TEXT_COLOR, padx=10, pady=5)
         select_button.pack(side=tk.LEFT, padx=5)
 
-        # Year selection
-        year_label = Label(top_frame, text="Year:", font=("Arial", 12), bg=BG_COLOR, fg=TEXT_COLOR)
-        year_label.pack(side=tk.LEFT, padx=5)
+        self.add_button = add_button = Button(top_frame, text="Add JSON Files", command=lambda: self.select_files(append=True),
+                            font=("Arial", 12), bg=DARK_GREEN, fg=TEXT_COLOR, padx=10, pady=5)
+        add_button.pack(side=tk.LEFT, padx=5)
+
+        # Period selection: a unit, then one of its periods or a typed range such as 2023-06-01..2023-08-31
+        period_label = Label(top_frame, text="Period:", font=("Arial", 12), bg=BG_COLOR, fg=TEXT_COLOR)
+        period_label.pack(side=tk.LEFT, padx=5)
 
-        self.year_dropdown = OptionMenu(top_frame, self.selected_year, "All Time")
-        self.year_dropdown.config(font=("Arial", 12), bg=DARK_GREEN, fg=TEXT_COLOR)
-        self.year_dropdown.pack(side=tk.LEFT, padx=5)
+        unit_dropdown = OptionMenu(top_frame, self.period_unit, *PERIOD_UNITS, command=self.unit_changed)
+        unit_dropdown.config(font=("Arial", 12), bg=DARK_GREEN, fg=TEXT_COLOR)
+        unit_dropdown.pack(side=tk.LEFT, padx=5)
+
+        self.period_box = ttk.Combobox(top_frame, textvariable=self.selected_period, values=["All Time"],
+                                       font=("Arial", 12), width=24)
+        self.period_box.bind("<<ComboboxSelected>>", self.period_changed)
+        self.period_box.bind("<Return>", self.period_changed)
+        self.period_box.pack(side=tk.LEFT, padx=5)
 
         # Sort buttons
         sort_label = Label(top_frame, text="Sort By:", font=("Arial", 12), bg=BG_COLOR, fg=TEXT_COLOR)
@@ -76,182 +191,294 @@ class SpotifyAnalyzerUI:
         self.tab_control.add(artists_tab, text='Artists')
         
         self.tab_control.pack(expand=1, fill="both", padx=10, pady=10)
+
+        # Progress of a running load
+        progress_frame = Frame(self.root, bg=BG_COLOR)
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 10))
+        self.cancel_button = Button(progress_frame, text="Cancel", command=self.cancel_load, font=("Arial", 12),
+                                    bg=DARK_PINK, fg=TEXT_COLOR, padx=10, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        stats_button = Button(progress_frame, text="Load Stats", command=self.show_load_stats, font=("Arial", 12),
+                              bg=DARK_GREEN, fg=TEXT_COLOR, padx=10)
+        stats_button.pack(side=tk.RIGHT, padx=5)
+        timeline_button = Button(progress_frame, text="Sessions & Streaks", command=self.show_timeline,
+                                 font=("Arial", 12), bg=DARK_GREEN, fg=TEXT_COLOR, padx=10)
+        timeline_button.pack(side=tk.RIGHT, padx=5)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=100, length=300)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        self.progress_label = Label(progress_frame, text="", font=("Arial", 11), bg=BG_COLOR, fg=TEXT_COLOR, anchor="w")
+        self.progress_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
-        # Tracks content
+        # Ranking lists
+        style.configure("Treeview", background=TEXT_BG, fieldbackground=TEXT_BG, foreground=TEXT_COLOR,
+                        font=("Arial", 12), rowheight=26, borderwidth=0)
+        style.configure("Treeview.Heading", background=BG_COLOR, foreground=TEXT_COLOR, font=("Arial", 12, "bold"))
+        style.map("Treeview", background=[("selected", DARK_PINK)])
+
         tracks_frame = Frame(tracks_tab, bg=BG_COLOR)
         tracks_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        self.tracks_text = Text(tracks_frame, wrap=tk.WORD, font=("Arial", 12), bg=TEXT_BG, fg=TEXT_COLOR,
-                               insertbackground='white')
-        self.tracks_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        tracks_scrollbar = Scrollbar(tracks_frame, command=self.tracks_text.yview)
-        tracks_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tracks_text.config(yscrollcommand=tracks_scrollbar.set)
-        
-        # Artists content
+        self.tracks_view = RankingView(tracks_frame, BG_COLOR, TEXT_COLOR)
+
         artists_frame = Frame(artists_tab, bg=BG_COLOR)
         artists_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        self.artists_text = Text(artists_frame, wrap=tk.WORD, font=("Arial", 12), bg=TEXT_BG, fg=TEXT_COLOR,
-                                insertbackground='white')
-        self.artists_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        artists_scrollbar = Scrollbar(artists_frame, command=self.artists_text.yview)
-        artists_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.artists_text.config(yscrollcommand=artists_scrollbar.set)
-        
-        # Default welcome message
+        self.artists_view = RankingView(artists_frame, BG_COLOR, TEXT_COLOR)
+
+        # Default welcome message, shown again while there is no data
         welcome_message = "Welcome to Spotify Streaming History Analyzer!\n\n"
-        welcome_message += "1. Click 'Select JSON Files' to load your Spotify data\n"
-        welcome_message += "2. Choose a year filter from the dropdown\n"
+        welcome_message += "1. Click 'Select JSON Files' to load your Spotify data, 'Add JSON Files' to add newer exports\n"
+        welcome_message += "2. Choose a year, month, week, weekday or hour, or type a range like 2023-06-01..2023-08-31\n"
         welcome_message += "3. Sort by Play Count or Total Minutes\n"
         welcome_message += "4. Switch between Tracks and Artists tabs to view results"
-        
-        self.tracks_text.insert(tk.END, welcome_message)
-        self.artists_text.insert(tk.END, welcome_message)
+        self.welcome_message = welcome_message
+
+        self.tracks_view.show_message(welcome_message)
+        self.artists_view.show_message(welcome_message)
 
-    def select_files(self):
-        self.tracks_text.delete(1.0, tk.END)
-        self.artists_text.delete(1.0, tk.END)
-        self.tracks_text.insert(tk.END, "Analyzing your files, please wait...\n")
-        self.artists_text.insert(tk.END, "Analyzing your files, please wait...\n")
-        self.root.update_idletasks()
+    def select_files(self, append=False):
+        """
+        Loads the chosen export files in a background thread,
+        replacing the current data or adding to it when append is True
+        """
+        if self.loading:
+            return
 
         file_paths = filedialog.askopenfilenames(filetypes=[("JSON files", "*.json")])
         if not file_paths:
             messagebox.showinfo("Info", "No files selected.")
             return
 
-        combined_data = self.analyzer.load_json_files(file_paths)
-        if isinstance(combined_data, str) and combined_data.startswith("Error:"):
-            messagebox.showerror("Error", combined_data)
+        self.init_analyzer()
+        self.loading = True
+        self.cancel_requested.clear()
+        self.select_button.config(state=tk.DISABLED)
+        self.add_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_bar["value"] = 0
+        self.progress_label.config(text="Starting...")
+        self.tracks_view.show_message("Analyzing your files, please wait...")
+        self.artists_view.show_message("Analyzing your files, please wait...")
+
+        self.load_started = time.perf_counter()
+        self.load_thread = threading.Thread(target=self.load_worker, args=(list(file_paths), append), daemon=True)
+        self.load_thread.start()
+        self.root.after(LOAD_POLL_INTERVAL, self.poll_load)
+
+    def load_worker(self, file_paths, append):
+        """
+        Runs in the background thread. It must not touch any widget, everything goes through load_queue
+        """
+        def progress(bytes_done, total_bytes, entries):
+            self.load_queue.put(("progress", bytes_done, total_bytes, entries))
+            return not self.cancel_requested.is_set()
+
+        analyzer = self.analyzer
+        try:
+            # Stream the files straight into the analyzer instead of loading them into one list first
+            if append:
+                error = analyzer.add_files(file_paths, workers=None, progress=progress)
+            else:
+                # A new analyzer replaces the current one once it has loaded, a failed or cancelled load keeps the data
+                from analyze_json import SpotifyAnalyzer
+                analyzer = SpotifyAnalyzer(columnar=True, cache=self.analyzer.cache)
+                error = analyzer.process_files(file_paths, workers=None, progress=progress)
+        except Exception as e:
+            error = f"Error: {e}"
+        self.load_queue.put(("done", error, analyzer))
+
+    def cancel_load(self):
+        self.cancel_requested.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="Cancelling...")
+
+    def poll_load(self):
+        """
+        Applies the messages of the background load, then checks again until it is done
+        """
+        while True:
+            try:
+                message = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "done":
+                self.finish_load(*message[1:])
+                return
+            self.show_progress(*message[1:])
+        self.root.after(LOAD_POLL_INTERVAL, self.poll_load)
+
+    def show_progress(self, bytes_done, total_bytes, entries):
+        if self.cancel_requested.is_set():
+            return
+        elapsed = max(time.perf_counter() - self.load_started, 1e-6)
+        text = f"{bytes_done / 1e6:.1f} of {total_bytes / 1e6:.1f} MB, {entries:,} entries ({entries / elapsed:,.0f}/s)"
+        if 0 < bytes_done < total_bytes:
+            text += f", about {(total_bytes - bytes_done) * elapsed / bytes_done:.0f} s left"
+        self.progress_bar["value"] = 100 * bytes_done / total_bytes if total_bytes else 0
+        self.progress_label.config(text=text)
+
+    def finish_load(self, error, analyzer):
+        from analyze_json import CANCELLED
+        self.loading = False
+        self.select_button.config(state=tk.NORMAL)
+        self.add_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_bar["value"] = 0
+        self.progress_label.config(text="")
+
+        # A cancelled or failed load leaves the previous data in place
+        if error == CANCELLED:
+            messagebox.showinfo("Info", "Loading cancelled.")
+            self.restore_views()
             return
-        elif not combined_data:
+        if error:
+            messagebox.showerror("Error", error)
+            self.restore_views()
+            return
+        elif not analyzer.track_years:
             messagebox.showerror("Error", "No data to process.")
+            self.restore_views()
             return
+        self.analyzer = analyzer
 
-        # Process the loaded data
-        self.analyzer.process_data(combined_data)
+        self.progress_label.config(text=f"Loaded {self.analyzer.entries_read:,} entries "
+                                        f"in {time.perf_counter() - self.load_started:.1f} s")
 
-        # Update the dropdown based on the years found in the data
-        years = ["All Time"] + self.analyzer.track_years
-        menu = self.year_dropdown["menu"]
-        menu.delete(0, "end")
-        for y in years:
-            menu.add_command(label=y, command=lambda year_val=y: self.selected_year.set(year_val))
+        # Offer the periods found in the data
+        self.update_periods()
 
         # Default display using play counts
         self.sort_by_plays()
 
-    def display_tracks(self, sorted_data, sort_type="plays"):
+    def restore_views(self):
         """
-        Display track statistics in the tracks text widget
+        Shows the data loaded before, or the welcome message and no periods if there is none
         """
-        self.tracks_text.delete(1.0, tk.END)
-        chosen_year = self.selected_year.get()
-        self.tracks_text.insert(tk.END, f"Tracks - Sorted by {sort_type.title()} ({chosen_year}):\n\n")
-
-        # Convert "All Time" to None for easier lookups
-        the_year = None if chosen_year == "All Time" else int(chosen_year)
-
-        for index, (track_key, play_count) in enumerate(sorted_data, start=1):
-            total_ms = 0
-
-            if the_year is not None:
-                # Lookup based on the exact year
-                if the_year in self.analyzer.track_play_time:
-                    total_ms = self.analyzer.track_play_time[the_year].get(track_key, 0)
-            else:
-                # Sum across all years for "All Time"
-                for y_data in self.analyzer.track_play_time.values():
-                    total_ms += y_data.get(track_key, 0)
-
-            if total_ms > 0:
-                total_minutes = total_ms / 60000
-                self.tracks_text.insert(tk.END,
-                    f"{index}. {track_key}: {play_count} plays, {total_minutes:.2f} minutes\n"
-                )
-            else:
-                print(f"Debug: Track {track_key} not found in track_play_time")
-                self.tracks_text.insert(tk.END,
-                    f"{index}. {track_key}: {play_count} plays, Play time not available\n"
-                )
+        if self.analyzer.track_years:
+            self.refresh()
+            return
+        self.period_box["values"] = ["All Time"]
+        self.selected_period.set("All Time")
+        self.period_text = "All Time"
+        self.period = None
+        self.tracks_view.show_message(self.welcome_message)
+        self.artists_view.show_message(self.welcome_message)
 
-    def display_artists(self, sorted_data, sort_type="plays"):
+    def display_tracks(self, sort_type="plays"):
         """
-        Display artist statistics in the artists text widget
+        Display track statistics in the tracks list
         """
-        self.artists_text.delete(1.0, tk.END)
-        chosen_year = self.selected_year.get()
-        self.artists_text.insert(tk.END, f"Artists - Sorted by {sort_type.title()} ({chosen_year}):\n\n")
+        self.display_ranking(self.tracks_view, "track", "Tracks", sort_type)
 
-        # Convert "All Time" to None for easier lookups
-        the_year = None if chosen_year == "All Time" else int(chosen_year)
+    def display_artists(self, sort_type="plays"):
+        """
+        Display artist statistics in the artists list
+        """
+        self.display_ranking(self.artists_view, "artist", "Artists", sort_type)
 
-        for index, (artist_name, play_count) in enumerate(sorted_data, start=1):
-            total_ms = 0
-
-            if the_year is not None:
-                # Lookup based on the exact year
-                if the_year in self.analyzer.artist_play_time:
-                    total_ms = self.analyzer.artist_play_time[the_year].get(artist_name, 0)
-            else:
-                # Sum across all years for "All Time"
-                for y_data in self.analyzer.artist_play_time.values():
-                    total_ms += y_data.get(artist_name, 0)
-
-            if total_ms > 0:
-                total_minutes = total_ms / 60000
-                self.artists_text.insert(tk.END,
-                    f"{index}. {artist_name}: {play_count} plays, {total_minutes:.2f} minutes\n"
-                )
-            else:
-                print(f"Debug: Artist {artist_name} not found in artist_play_time")
-                self.artists_text.insert(tk.END,
-                    f"{index}. {artist_name}: {play_count} plays, Play time not available\n"
-                )
+    def display_ranking(self, view, entity, label, sort_type):
+        period = self.period
+        metric = "plays" if sort_type == "plays" else "ms"
+        # Play counts and minutes come with each ranking row, only the rows scrolled into view are fetched
+        view.show(f"{label} - Sorted by {sort_type.title()} ({self.period_text}):",
+                  lambda offset, limit: self.analyzer.get_ranking(entity, metric, period, limit, offset))
 
     def sort_by_plays(self):
         """
         Sort both tracks and artists by play count
         """
         self.current_sort = "plays"  # Update current sort method
-        chosen_year = self.selected_year.get()
-        year_val = None if chosen_year == "All Time" else int(chosen_year)
-        
-        # Get sorted data and display for tracks
-        tracks_data = self.analyzer.get_sorted_by_plays(year_val)
-        self.display_tracks(tracks_data, "plays")
-        
-        # Get sorted data and display for artists
-        artists_data = self.analyzer.get_artists_sorted_by_plays(year_val)
-        self.display_artists(artists_data, "plays")
+        # The analyzer is being written by the load thread
+        if self.loading:
+            return
+        self.display_tracks("plays")
+        self.display_artists("plays")
 
     def sort_by_minutes(self):
         """
         Sort both tracks and artists by total minutes played
         """
         self.current_sort = "minutes"  # Update current sort method
-        chosen_year = self.selected_year.get()
-        year_val = None if chosen_year == "All Time" else int(chosen_year)
-        
-        # Get sorted data and display for tracks
-        tracks_data = self.analyzer.get_sorted_by_minutes(year_val)
-        self.display_tracks(tracks_data, "minutes")
-        
-        # Get sorted data and display for artists
-        artists_data = self.analyzer.get_artists_sorted_by_minutes(year_val)
-        self.display_artists(artists_data, "minutes")
-    
-    def year_changed(self, *args):
+        if self.loading:
+            return
+        self.display_tracks("minutes")
+        self.display_artists("minutes")
+
+    def update_periods(self):
+        """
+        Fills the period list with the periods of the chosen unit found in the data
+        """
+        granularity = PERIOD_UNITS[self.period_unit.get()]
+        self.period_box["values"] = ["All Time"] + self.analyzer.available_periods(granularity)
+
+    def unit_changed(self, *args):
+        if self.loading or self.analyzer is None:
+            return
+        self.update_periods()
+        self.selected_period.set("All Time")
+        self.period_changed()
+
+    def period_changed(self, *args):
+        """
+        Called when a period is picked or typed, re-applies the current sort for it
+        """
+        chosen = self.selected_period.get().strip()
+        try:
+            period = None if chosen in ("", "All Time") else parse_period(chosen)
+        except ValueError as e:
+            messagebox.showerror("Error", f"{e}.\nUse e.g. 2023, 2023-06, 2023-W23, Monday, 14:00 "
+                                          "or 2023-06-01..2023-08-31.")
+            return
+        self.period_text = chosen or "All Time"
+        self.period = period
+        self.refresh()
+
+    def show_load_stats(self):
+        """
+        Opens a window with the counters and timings of the loads, and the profile if $SPOTIFY_PROFILE is set
+        """
+        if self.loading or self.analyzer is None or not self.analyzer.track_years:
+            messagebox.showinfo("Info", "Load some files first.")
+            return
+        self.show_text("Load Statistics", self.analyzer.load_report())
+
+    def show_timeline(self):
         """
-        Called when the year selection changes, re-applies the current sort
+        Opens a window with the longest sessions, the busiest days, the longest artist streaks
+        and the latest discoveries
         """
-        # Skip if no data is loaded yet
-        if not hasattr(self.analyzer, 'track_years') or not self.analyzer.track_years:
+        if self.loading or self.analyzer is None or not self.analyzer.track_years:
+            messagebox.showinfo("Info", "Load some files first.")
             return
-            
+        from cli import TIMELINE_COLUMNS, timeline_rows
+        sections = []
+        for kind, title in (("sessions", "Longest sessions"), ("days", "Days with the most minutes"),
+                            ("streaks", "Longest streaks of daily plays"), ("discoveries", "Latest discoveries")):
+            lines = [f"{title}:"]
+            for rank, row in enumerate(timeline_rows(self.analyzer, kind, TIMELINE_GAP, TIMELINE_ROWS), start=1):
+                lines.append(f"{rank:3}. " + ", ".join(f"{column}: {value}"
+                                                       for column, value in zip(TIMELINE_COLUMNS[kind], row)))
+            sections.append("\n".join(lines))
+        self.show_text("Sessions & Streaks", "\n\n".join(sections))
+
+    def show_text(self, title, content):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("900x500")
+        text = tk.Text(window, font=("Courier", 11), bg="#2e2e2e", fg="white", wrap=tk.NONE)
+        scrollbar = Scrollbar(window, command=text.yview)
+        text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, content)
+        text.config(state=tk.DISABLED)
+
+    def refresh(self):
+        """
+        Re-applies the current sort
+        """
+        # Skip if no data is loaded yet or a load is running
+        if self.loading or self.analyzer is None or not self.analyzer.track_years:
+            return
+
         # Apply the current sort method
         if self.current_sort == "plays":
             self.sort_by_plays()
@@ -259,7 +486,13 @@ class SpotifyAnalyzerUI:
             self.sort_by_minutes()
 
 if __name__ == "__main__":
-    ctypes.windll.shcore.SetProcessDpiAwareness(True)
+    # Imported here, only starting the app needs them
+    import multiprocessing
+    # Needed by the process pool in the packaged executable
+    multiprocessing.freeze_support()
+    if sys.platform == "win32":
+        import ctypes
+        ctypes.windll.shcore.SetProcessDpiAwareness(True)
     root = tk.Tk()
     app = SpotifyAnalyzerUI(root)
     root.mainloop()
\ No newline at end of file
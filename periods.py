@@ -0,0 +1,120 @@
+import calendar
+import re
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+# Granularities of SpotifyAnalyzer.available_periods
+GRANULARITIES = ("year", "month", "week", "weekday", "hour")
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+_DAY = 86400
+_YEAR = re.compile(r"(\d{4})")
+_MONTH = re.compile(r"(\d{4})-(\d{1,2})")
+_WEEK = re.compile(r"(\d{4})-W(\d{1,2})", re.IGNORECASE)
+_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+_HOUR = re.compile(r"(\d{1,2})(?::00|h)", re.IGNORECASE)
+
+
+class Period(namedtuple("Period", ("kind", "start", "end"))):
+    """
+    Time filter over plays, all in UTC like the "ts" of the exports.
+    kind "range" keeps plays with start <= timestamp < end, in epoch seconds.
+    kind "weekday" (0 is Monday) and "hour" (0-23) keep plays by weekday or hour of day, start == end is the value.
+    """
+
+
+def _epoch(day):
+    return calendar.timegm(day.timetuple())
+
+
+def _bounds(text):
+    """
+    Returns the (start, end) epoch seconds of a year, month, ISO week or day written as text.
+    """
+    if _YEAR.fullmatch(text):
+        year = int(text)
+        return _epoch(date(year, 1, 1)), _epoch(date(year + 1, 1, 1))
+    match = _MONTH.fullmatch(text)
+    if match:
+        year, month = int(match[1]), int(match[2])
+        start = date(year, month, 1)
+        return _epoch(start), _epoch(start) + calendar.monthrange(year, month)[1] * _DAY
+    match = _WEEK.fullmatch(text)
+    if match:
+        start = _epoch(date.fromisocalendar(int(match[1]), int(match[2]), 1))
+        return start, start + 7 * _DAY
+    match = _DATE.fullmatch(text)
+    if match:
+        start = _epoch(date(int(match[1]), int(match[2]), int(match[3])))
+        return start, start + _DAY
+    raise ValueError(f"Unknown period {text!r}")
+
+
+def parse_period(text):
+    """
+    Parses a period: "2023", "2023-06", "2023-W23", "2023-06-01", a range of those such as "2023-06-01..2023-08-31"
+    (both ends included), a weekday such as "Monday" or "mon", or an hour of day such as "14:00" or "14h".
+    Returns a plain year as an int, which every analyzer mode can answer, anything else as a Period.
+    Raises ValueError for text that is none of these.
+    """
+    text = text.strip()
+    if _YEAR.fullmatch(text):
+        return int(text)
+    if ".." in text:
+        first, _, last = text.partition("..")
+        start, end = _bounds(first.strip())[0], _bounds(last.strip())[1]
+        if end <= start:
+            raise ValueError(f"Period {text!r} ends before it starts")
+        return Period("range", start, end)
+    if len(text) >= 3:
+        for index, name in enumerate(WEEKDAYS):
+            if name.lower().startswith(text.lower()):
+                return Period("weekday", index, index)
+    match = _HOUR.fullmatch(text)
+    if match:
+        hour = int(match[1])
+        if hour > 23:
+            raise ValueError(f"Unknown hour {text!r}")
+        return Period("hour", hour, hour)
+    return Period("range", *_bounds(text))
+
+
+def weekday_of(timestamp):
+    # 1970-01-01 was a Thursday
+    return (timestamp // _DAY + 3) % 7
+
+
+def hour_of(timestamp):
+    return timestamp // 3600 % 24
+
+
+def _bucket(granularity, timestamp):
+    """
+    Returns the label of the year, month or ISO week holding timestamp and the epoch second it ends at.
+    """
+    moment = datetime.fromtimestamp(timestamp, timezone.utc).date()
+    if granularity == "year":
+        return str(moment.year), _epoch(date(moment.year + 1, 1, 1))
+    if granularity == "month":
+        return f"{moment.year}-{moment.month:02d}", _bounds(f"{moment.year}-{moment.month}")[1]
+    year, week, weekday = moment.isocalendar()
+    return f"{year}-W{week:02d}", _epoch(moment + timedelta(days=8 - weekday))
+
+
+def range_labels(granularity, sorted_timestamps):
+    """
+    Returns the labels of the years, months or ISO weeks holding at least one of sorted_timestamps, in order.
+    Jumps from one bucket to the next by binary search, so the cost grows with the number of buckets, not plays.
+    """
+    labels = []
+    index = 0
+    while index < len(sorted_timestamps):
+        label, end = _bucket(granularity, sorted_timestamps[index])
+        labels.append(label)
+        index = bisect_left(sorted_timestamps, end, index)
+    return labels
+
+
+def value_label(kind, value):
+    return WEEKDAYS[value] if kind == "weekday" else f"{value:02d}:00"
@@ -0,0 +1,102 @@
+from array import array
+from bisect import bisect_left
+
+# Keys held in a set before they are sorted into a batch
+BATCH_KEYS = 1 << 16
+
+
+def _contains(keys, key):
+    index = bisect_left(keys, key)
+    return index < len(keys) and keys[index] == key
+
+
+class PlayKeys:
+    """
+    The de-duplication keys of the plays counted, see analyze_json._play_key, at 8 bytes per play.
+    A key begins with the time of its play, so the sorted array('Q') batches of a chronological export cover
+    disjoint key ranges and a key is only looked up in the batches whose range holds it. The latest keys are
+    in the dict recent until BATCH_KEYS of them are sorted into a batch: in insertion order they are nearly
+    sorted already, which timsort takes in linear time, unlike the hash order of a set.
+    """
+
+    def __init__(self):
+        self.batches = []       # [sorted keys]
+        self.recent = {}        # {key: None}
+        # Smallest and largest key of all batches, an empty range while there are none
+        self.low, self.high = 1, 0
+
+    def __len__(self):
+        return len(self.recent) + sum(len(keys) for keys in self.batches)
+
+    def __iter__(self):
+        for keys in self.batches:
+            yield from keys
+        yield from self.recent
+
+    def __contains__(self, key):
+        if key in self.recent:
+            return True
+        if self.low <= key <= self.high:
+            for keys in self.batches:
+                if keys[0] <= key <= keys[-1] and _contains(keys, key):
+                    return True
+        return False
+
+    def __getstate__(self):
+        self.flush()
+        return self.__dict__.copy()
+
+    def add(self, key):
+        """
+        Adds the key of a play. Returns False if it was added before.
+        """
+        if key in self:
+            return False
+        self.recent[key] = None
+        if len(self.recent) >= BATCH_KEYS:
+            self.flush()
+        return True
+
+    def add_sorted(self, keys):
+        """
+        Adds a batch of distinct keys sorted in ascending order, such as a memoryview over a snapshot.
+        """
+        if len(keys):
+            self.batches.append(keys)
+            if self.low > self.high:
+                self.low, self.high = keys[0], keys[-1]
+            else:
+                self.low, self.high = min(self.low, keys[0]), max(self.high, keys[-1])
+
+    def flush(self):
+        """
+        Sorts the keys held in recent into a batch.
+        """
+        if self.recent:
+            self.add_sorted(array('Q', sorted(self.recent)))
+            self.recent = {}
+
+    def isdisjoint(self, other):
+        """
+        Returns True if no key of other was added here. Only batches with overlapping key ranges are compared.
+        """
+        self.flush()
+        other.flush()
+        for keys in other.batches:
+            for mine in self.batches:
+                if mine[0] <= keys[-1] and keys[0] <= mine[-1]:
+                    small, large = (keys, mine) if len(keys) <= len(mine) else (mine, keys)
+                    if any(_contains(large, key) for key in small):
+                        return False
+        return True
+
+    def extend(self, other):
+        """
+        Adds the keys of other, which must not share any with this one, see isdisjoint.
+        """
+        other.flush()
+        for keys in other.batches:
+            self.add_sorted(keys)
+
+    def clear(self):
+        self.__init__()
@@ -0,0 +1,366 @@
+import importlib
+import importlib.util
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+from symbols import SymbolTable
+
+
+class _LazyModule:
+    """
+    Stands in for a module and imports it when the first of its attributes is used.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        return getattr(importlib.import_module(self._name), name)
+
+
+# NumPy is optional, the pure Python reductions give the same results. It takes longer to import than the
+# rest of the app, so it is only imported once a store has rows to reduce.
+np = _LazyModule("numpy") if importlib.util.find_spec("numpy") is not None else None
+
+
+# Per-play columns and their array typecodes
+COLUMNS = (("track_ids", 'i'), ("artist_ids", 'i'), ("years", 'H'), ("timestamps", 'q'), ("ms_played", 'q'),
+           ("platform_ids", 'H'), ("reason_end_ids", 'H'), ("shuffle", 'B'), ("skipped", 'B'))
+
+
+_TYPECODES = dict(COLUMNS)
+# Positions of the set bits of every byte value
+_BIT_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _raw(column):
+    return memoryview(column).cast('B')
+
+
+def _group_sums(group, ms_played, size):
+    """
+    Counts the rows and sums ms_played of every group id below size with NumPy.
+    Returns the groups present in the order of their first row, as the pure Python loops meet them,
+    so that ties rank alike with and without NumPy, and their counts and totals.
+    """
+    present, first_rows = np.unique(group, return_index=True)
+    present = present[np.argsort(first_rows)]
+    counts = np.bincount(group, minlength=size)[present]
+    # float64 sums are exact for any realistic total (< 2**53 ms)
+    totals = np.bincount(group, weights=ms_played, minlength=size)[present].astype(np.int64)
+    return present, counts, totals
+
+
+class PlayStore:
+    """
+    Columnar store of qualifying plays.
+    Tracks and artists are interned to integer ids, every play is one row across the typed arrays below.
+    """
+
+    def __init__(self):
+        # Symbol tables, tracks keyed by symbols.track_identity and artists by name
+        self.tracks = SymbolTable()
+        self.artists = SymbolTable()
+        # Platforms and reasons a play ended, id 0 is "" for plays without one
+        self.platforms = SymbolTable([""], [""])
+        self.reason_ends = SymbolTable([""], [""])
+        # One entry per play
+        self.track_ids = array('i')
+        self.artist_ids = array('i')
+        self.years = array('H')
+        self.timestamps = array('q')    # Epoch seconds
+        self.ms_played = array('q')
+        self.platform_ids = array('H')
+        self.reason_end_ids = array('H')
+        self.shuffle = array('B')       # 1 if the play was in shuffle mode
+        self.skipped = array('B')       # 1 if the track was skipped
+        # True while the columns are read-only memoryviews over a snapshot, see snapshot.read_snapshot
+        self.mapped = False
+        # Indexes, built on first use and extended once rows were added, see time_order, bucket_rows and bitmaps
+        self._time_order = None
+        self._buckets = {}
+        self._bitmaps = {}
+
+    def __len__(self):
+        return len(self.ms_played)
+
+    def append(self, track_id, artist_id, year, timestamp, ms_played, platform_id=0, reason_end_id=0,
+               shuffle=False, skipped=False):
+        """
+        Adds one play, the ids come from the symbol tables of the same name.
+        """
+        if self.mapped:
+            self._copy_columns()
+        self.track_ids.append(track_id)
+        self.artist_ids.append(artist_id)
+        self.years.append(year)
+        self.timestamps.append(timestamp)
+        self.ms_played.append(ms_played)
+        self.platform_ids.append(platform_id)
+        self.reason_end_ids.append(reason_end_id)
+        self.shuffle.append(1 if shuffle else 0)
+        self.skipped.append(1 if skipped else 0)
+
+    def appenders(self):
+        """
+        Returns the append methods of the columns in COLUMNS order, to add many plays without a call to append each.
+        shuffle and skipped take 0 or 1. The methods are only valid until the columns are replaced.
+        """
+        if self.mapped:
+            self._copy_columns()
+        return tuple(getattr(self, name).append for name, _ in COLUMNS)
+
+    def extend(self, other):
+        """
+        Appends all rows of another store, remapping its ids into this store's symbol tables.
+        """
+        if self.mapped:
+            self._copy_columns()
+        for name, symbols in (("track_ids", "tracks"), ("artist_ids", "artists"),
+                              ("platform_ids", "platforms"), ("reason_end_ids", "reason_ends")):
+            id_map = getattr(self, symbols).remap(getattr(other, symbols))
+            getattr(self, name).extend(id_map[i] for i in getattr(other, name))
+        # Raw copies, other's columns may be arrays or memoryviews of the same item types
+        for name in ("years", "timestamps", "ms_played", "shuffle", "skipped"):
+            getattr(self, name).frombytes(_raw(getattr(other, name)))
+
+    def _copy_columns(self):
+        """
+        Replaces memoryviews over a snapshot with arrays holding a copy, before the first change.
+        """
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            column.frombytes(_raw(getattr(self, name)))
+            setattr(self, name, column)
+        self.mapped = False
+
+    def aggregate(self, entity, start=0):
+        """
+        Groups the rows from start on by (year, id) for entity "track" or "artist", in the order ids first appear.
+        Returns ({year: {id: play_count}}, {year: {id: total_ms}}).
+        """
+        ids, symbols = self._entity(entity)
+        if np is not None and len(self) > start:
+            return self._aggregate_numpy(ids, len(symbols), start)
+        if start:
+            return self._aggregate_python(ids[start:], self.years[start:], self.ms_played[start:])
+        return self._aggregate_python(ids, self.years, self.ms_played)
+
+    def _entity(self, entity):
+        return (self.track_ids, self.tracks) if entity == "track" else (self.artist_ids, self.artists)
+
+    def _aggregate_numpy(self, ids, id_count, start):
+        id_col = np.frombuffer(ids, dtype=np.intc)[start:].astype(np.int64)
+        distinct_years, year_index = np.unique(np.frombuffer(self.years, dtype=np.uint16)[start:], return_inverse=True)
+        group = year_index * id_count + id_col
+        present, counts, totals = _group_sums(group, np.frombuffer(self.ms_played, dtype=np.int64)[start:],
+                                              len(distinct_years) * id_count)
+        year_rows, ids = np.divmod(present, id_count)
+
+        plays, play_time = {}, {}
+        # Years in the order of their first play as well
+        _, first = np.unique(year_rows, return_index=True)
+        for year_row in year_rows[np.sort(first)].tolist():
+            selected = year_rows == year_row
+            keys = ids[selected].tolist()
+            year = int(distinct_years[year_row])
+            plays[year] = dict(zip(keys, counts[selected].tolist()))
+            play_time[year] = dict(zip(keys, totals[selected].tolist()))
+        return plays, play_time
+
+    def in_time_order(self):
+        """
+        Returns True if no play has an earlier timestamp than the play before it.
+        """
+        if self._time_order is not None and len(self._time_order[0]) == len(self):
+            return isinstance(self._time_order[0], range)
+        return self._in_time_order(0)
+
+    def _in_time_order(self, start):
+        if np is not None:
+            column = np.frombuffer(self.timestamps, dtype=np.int64)[start:]
+            return bool(np.all(column[1:] >= column[:-1]))
+        return all(a <= b for a, b in zip(islice(self.timestamps, start, None), islice(self.timestamps, start + 1, None)))
+
+    def time_order(self):
+        """
+        Returns (rows, sorted_timestamps): the row numbers ordered by timestamp and their timestamps in that order.
+        rows is a range when the rows were added in time order, as they are from a chronological export.
+        Rows are only ever appended, so once built the order is extended by the rows added since.
+        """
+        if self._time_order is None:
+            self._time_order = (range(0), array('q'))
+        start = len(self._time_order[0])
+        if start != len(self):
+            rows, sorted_timestamps = self._time_order
+            timestamps = self.timestamps
+            if isinstance(rows, range) and self._in_time_order(max(start - 1, 0)):
+                self._time_order = (range(len(self)), timestamps)
+            elif np is not None:
+                column = np.frombuffer(timestamps, dtype=np.int64)
+                added = np.argsort(column[start:], kind="stable") + start
+                # Each added row goes after the rows with the same timestamp, as a stable sort of all rows would
+                positions = np.searchsorted(np.frombuffer(sorted_timestamps, dtype=np.int64)[:start],
+                                            column[added], side="right")
+                order = np.insert(np.frombuffer(rows, dtype=np.intc) if isinstance(rows, array)
+                                  else np.arange(start, dtype=np.intc), positions, added.astype(np.intc))
+                self._time_order = (array('i', order.astype(np.intc).tobytes()), array('q', column[order].tobytes()))
+            else:
+                # Two sorted runs, which timsort merges in linear time
+                order = array('i', rows)
+                order.extend(sorted(range(start, len(self)), key=timestamps.__getitem__))
+                if start and timestamps[order[start]] < sorted_timestamps[start - 1]:
+                    order = array('i', sorted(order, key=timestamps.__getitem__))
+                self._time_order = (order, array('q', [timestamps[row] for row in order]))
+        return self._time_order
+
+    def bucket_rows(self, kind, bucket_of):
+        """
+        Returns {value: rows} grouping the rows by bucket_of(timestamp), e.g. their weekday, in row order.
+        """
+        return self._group_rows(kind, "timestamps", bucket_of)
+
+    def posting_lists(self, name):
+        """
+        Returns {value: rows} grouping the rows by their value in column name, e.g. "artist_ids", in row order.
+        """
+        return self._group_rows(name, name)
+
+    def _group_rows(self, kind, name, function=None):
+        cached = self._buckets.get(kind)
+        if cached is None or cached[0] != len(self):
+            # Only the rows added since the last call are grouped, then appended to copies of their groups
+            start, groups = cached if cached is not None else (0, {})
+            added = {}
+            if np is not None and len(self) > start:
+                values = np.frombuffer(getattr(self, name), dtype=_TYPECODES[name])[start:]
+                if function is not None:
+                    # function is plain arithmetic, so it also works on a whole column at once
+                    values = function(values)
+                order = np.argsort(values, kind="stable")
+                distinct, starts = np.unique(values[order], return_index=True)
+                for value, rows in zip(distinct.tolist(), np.split((order + start).astype(np.intc), starts[1:])):
+                    added[value] = array('i', rows.tobytes())
+            else:
+                values = islice(getattr(self, name), start, None)
+                for row, value in enumerate(values if function is None else map(function, values), start):
+                    if value in added:
+                        added[value].append(row)
+                    else:
+                        added[value] = array('i', [row])
+            groups = dict(groups)
+            for value, rows in added.items():
+                groups[value] = groups[value] + rows if value in groups else rows
+            cached = self._buckets[kind] = (len(self), groups)
+        return cached[1]
+
+    def bitmaps(self, name):
+        """
+        Returns {value: bitmap} for column name, where bit i of the int bitmap is set if row i holds value.
+        Meant for columns with few distinct values such as "platform_ids", bitmaps combine with & and |.
+        """
+        cached = self._bitmaps.get(name)
+        if cached is None or cached[0] != len(self):
+            # The bits of the rows added since the last call are or-ed into the bitmaps built before
+            start, bitmaps = cached if cached is not None else (0, {})
+            bitmaps = dict(bitmaps)
+            if np is not None and len(self) > start:
+                column = np.frombuffer(getattr(self, name), dtype=_TYPECODES[name])[start:]
+                for value in np.unique(column).tolist():
+                    bits = np.packbits(column == value, bitorder="little")
+                    bitmaps[value] = bitmaps.get(value, 0) | int.from_bytes(bits.tobytes(), "little") << start
+            else:
+                for value, rows in self.posting_lists(name).items():
+                    first = bisect_left(rows, start)
+                    if first == len(rows):
+                        continue
+                    bits = bytearray((len(self) + 7) // 8)
+                    for row in islice(rows, first, None):
+                        bits[row >> 3] |= 1 << (row & 7)
+                    bitmaps[value] = bitmaps.get(value, 0) | int.from_bytes(bits, "little")
+            cached = self._bitmaps[name] = (len(self), bitmaps)
+        return cached[1]
+
+    def bitmap_rows(self, bitmap, rows=None):
+        """
+        Returns the rows whose bit is set in bitmap in order, or only those of the given rows, keeping their order.
+        """
+        data = bitmap.to_bytes((len(self) + 7) // 8, "little")
+        if np is not None:
+            bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+            if rows is None:
+                selected = np.flatnonzero(bits)
+            else:
+                candidates = np.frombuffer(rows, dtype=np.intc) if isinstance(rows, array) else np.arange(
+                    rows.start, rows.stop, dtype=np.intc)
+                selected = candidates[bits[candidates].astype(bool)]
+            return array('i', selected.astype(np.intc).tobytes())
+        if rows is not None:
+            return array('i', [row for row in rows if data[row >> 3] >> (row & 7) & 1])
+        selected = array('i')
+        for index, byte in enumerate(data):
+            if byte:
+                selected.extend(index * 8 + bit for bit in _BIT_POSITIONS[byte])
+        return selected
+
+    def select(self, period, bucket_of=None):
+        """
+        Returns the rows inside a periods.Period, for kind "range" by binary search over the time order,
+        for other kinds through the rows grouped by bucket_of. Costs O(log n + k) for k rows once the index exists.
+        """
+        if period.kind == "range":
+            rows, sorted_timestamps = self.time_order()
+            start = bisect_left(sorted_timestamps, period.start)
+            return rows[start:bisect_left(sorted_timestamps, period.end, start)]
+        return self.bucket_rows(period.kind, bucket_of).get(period.start, array('i'))
+
+    def aggregate_rows(self, entity, rows):
+        """
+        Groups the given rows by id for entity "track" or "artist".
+        Returns ({id: play_count}, {id: total_ms}).
+        """
+        ids, symbols = self._entity(entity)
+        if np is not None and len(rows):
+            if isinstance(rows, range):
+                selected = slice(rows.start, rows.stop)
+            else:
+                selected = np.frombuffer(rows, dtype=np.intc)
+            present, counts, totals = _group_sums(np.frombuffer(ids, dtype=np.intc)[selected],
+                                                  np.frombuffer(self.ms_played, dtype=np.int64)[selected],
+                                                  len(symbols))
+            keys = present.tolist()
+            return dict(zip(keys, counts.tolist())), dict(zip(keys, totals.tolist()))
+
+        counts, totals = {}, {}
+        ms_played = self.ms_played
+        for row in rows:
+            key = ids[row]
+            if key in counts:
+                counts[key] += 1
+                totals[key] += ms_played[row]
+            else:
+                counts[key] = 1
+                totals[key] = ms_played[row]
+        return counts, totals
+
+    def _aggregate_python(self, ids, years, ms_played):
+        # One flat dict keyed by (year << 32 | id) avoids a nested lookup per row
+        counts, totals = {}, {}
+        for group, ms in zip(map(lambda y, i: y << 32 | i, years, ids), ms_played):
+            if group in counts:
+                counts[group] += 1
+                totals[group] += ms
+            else:
+                counts[group] = 1
+                totals[group] = ms
+
+        plays, play_time = {}, {}
+        for group, count in counts.items():
+            year, key = group >> 32, group & 0xFFFFFFFF
+            if year not in plays:
+                plays[year] = {}
+                play_time[year] = {}
+            plays[year][key] = count
+            play_time[year][key] = totals[group]
+        return plays, play_time
@@ -0,0 +1,132 @@
+from array import array
+from collections import namedtuple
+
+from periods import Period, parse_period
+
+# Conditions of a where clause, see make_filter
+WHERE_KEYS = ("artist", "platform", "reason_end", "years", "period", "min_ms", "shuffle", "skipped")
+
+
+class Filter(namedtuple("Filter", ("artists", "platforms", "reason_ends", "years", "period", "min_ms",
+                                   "shuffle", "skipped"))):
+    """
+    Hashable form of a where clause, None for every condition not given. Built by make_filter.
+    """
+
+
+def _names(key, value):
+    values = (value,) if isinstance(value, str) else tuple(value)
+    if not values or not all(isinstance(item, str) for item in values):
+        raise ValueError(f"where[{key!r}] must be a name or a list of names")
+    return tuple(sorted(set(values)))
+
+
+def make_filter(where=None):
+    """
+    Validates a where clause and returns it as a Filter. Every condition given must hold for a play to count:
+    "artist": an artist name or a list of names, any of which matches
+    "platform": text or a list of texts, matching platforms that contain one of them in any case, e.g. "android"
+    "reason_end": a reason a play ended, e.g. "trackdone" or "fwdbtn", or a list of them
+    "years": a year or a list of years
+    "period": a period as accepted by periods.parse_period, or a Period
+    "min_ms": the least ms_played of a play
+    "shuffle", "skipped": True or False
+    Raises ValueError for an unknown key or a value of the wrong kind.
+    """
+    where = dict(where or {})
+    unknown = set(where) - set(WHERE_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown query condition {sorted(unknown)[0]!r}, expected any of: {', '.join(WHERE_KEYS)}")
+    conditions = dict.fromkeys(Filter._fields)
+    if where.get("artist") is not None:
+        conditions["artists"] = _names("artist", where["artist"])
+    if where.get("platform") is not None:
+        conditions["platforms"] = tuple(sorted({text.lower() for text in _names("platform", where["platform"])}))
+    if where.get("reason_end") is not None:
+        conditions["reason_ends"] = _names("reason_end", where["reason_end"])
+    years = where.get("years")
+    if years is not None:
+        years = (years,) if isinstance(years, int) else tuple(years)
+        if not years or not all(isinstance(year, int) and not isinstance(year, bool) for year in years):
+            raise ValueError("where['years'] must be a year or a list of years")
+        conditions["years"] = tuple(sorted(set(years)))
+    period = where.get("period")
+    if isinstance(period, str):
+        period = parse_period(period)
+    if isinstance(period, int):
+        # A whole year, the years condition covers it
+        conditions["years"] = tuple(sorted(set(conditions["years"] or (period,)) & {period}))
+    elif period is not None:
+        if not isinstance(period, Period):
+            raise ValueError("where['period'] must be a period such as '2023-06' or a Period")
+        conditions["period"] = period
+    if where.get("min_ms") is not None:
+        if not isinstance(where["min_ms"], int) or isinstance(where["min_ms"], bool):
+            raise ValueError("where['min_ms'] must be an int")
+        conditions["min_ms"] = where["min_ms"]
+    for key in ("shuffle", "skipped"):
+        if where.get(key) is not None:
+            if not isinstance(where[key], bool):
+                raise ValueError(f"where[{key!r}] must be True or False")
+            conditions[key] = where[key]
+    return Filter(**conditions)
+
+
+def _union(bitmaps, values):
+    combined = 0
+    for value in values:
+        combined |= bitmaps.get(value, 0)
+    return combined
+
+
+def filter_rows(store, query_filter, bucket_of=None):
+    """
+    Returns the rows of a PlayStore matching every condition of query_filter.
+    Artists are looked up in posting lists, the platform, reason_end, year, shuffle and skipped conditions
+    intersect bitmaps and a period is selected through the time indexes; only the rows left are checked
+    against min_ms. bucket_of is the bucket function of a period that is not a time range.
+    """
+    mask = None
+    for values, name in ((query_filter.reason_ends, "reason_end_ids"), (query_filter.years, "years"),
+                         (query_filter.platforms, "platform_ids"),
+                         (None if query_filter.shuffle is None else (query_filter.shuffle,), "shuffle"),
+                         (None if query_filter.skipped is None else (query_filter.skipped,), "skipped")):
+        if values is None:
+            continue
+        if name == "reason_end_ids":
+            values = [store.reason_ends.ids[value] for value in values if value in store.reason_ends.ids]
+        elif name == "platform_ids":
+            values = [platform_id for platform_id, platform in enumerate(store.platforms.names)
+                      if any(text in platform.lower() for text in values)]
+        elif name in ("shuffle", "skipped"):
+            values = [int(values[0])]
+        bitmap = _union(store.bitmaps(name), values)
+        mask = bitmap if mask is None else mask & bitmap
+
+    # Rows from the posting lists of the artists and the period, the smaller side is checked against the other
+    candidates = []
+    if query_filter.artists is not None:
+        groups = store.posting_lists("artist_ids")
+        artist_ids = (store.artists.ids.get(name) for name in query_filter.artists)
+        rows = array('i')
+        for artist_id in artist_ids:
+            rows.extend(groups.get(artist_id, ()))
+        candidates.append(rows)
+    if query_filter.period is not None:
+        candidates.append(store.select(query_filter.period, bucket_of))
+    candidates.sort(key=len)
+
+    if len(candidates) == 2:
+        others = set(candidates[1])
+        candidates[0] = array('i', [row for row in candidates[0] if row in others])
+    if candidates:
+        rows = candidates[0] if mask is None else store.bitmap_rows(mask, candidates[0])
+    elif mask is not None:
+        rows = store.bitmap_rows(mask)
+    else:
+        rows = range(len(store))
+
+    if query_filter.min_ms is not None:
+        ms_played = store.ms_played
+        rows = array('i', [row for row in rows if ms_played[row] >= query_filter.min_ms])
+    return rows
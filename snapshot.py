@@ -0,0 +1,163 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from play_store import COLUMNS, PlayStore
+from symbols import SymbolTable
+
+MAGIC = b"SPOTSNAP"
+FORMAT_VERSION = 4
+# Sections in file order with the array typecode of their items, text sections hold UTF-8
+SECTIONS = (
+    ("track_offsets", 'Q'),     # Character offset of each track name in track_text, plus the end
+    ("track_text", None),
+    ("track_key_offsets", 'Q'), # Identity keys of the tracks, see symbols.track_identity
+    ("track_key_text", None),
+    ("artist_offsets", 'Q'),    # Artists, platforms and reasons a play ended are keyed by their name
+    ("artist_text", None),
+    ("platform_offsets", 'Q'),
+    ("platform_text", None),
+    ("reason_end_offsets", 'Q'),
+    ("reason_end_text", None),
+    ("track_ids", 'i'),         # One fixed-width record per play, stored column by column, see play_store.COLUMNS
+    ("artist_ids", 'i'),
+    ("years", 'H'),
+    ("timestamps", 'q'),
+    ("ms_played", 'q'),
+    ("platform_ids", 'H'),
+    ("reason_end_ids", 'H'),
+    ("shuffle", 'B'),
+    ("skipped", 'B'),
+    ("play_keys", 'Q'),         # Sorted de-duplication keys of the plays, see analyze_json._play_key
+    ("track_years", 'H'),
+)
+# magic, format version, flags, section count, entries read
+_HEADER = struct.Struct("<8sHHIQ")
+# offset and length in bytes of one section
+_SECTION = struct.Struct("<QQ")
+_BIG_ENDIAN = 1
+_ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    """
+    Raised for a file that is not a readable snapshot.
+    """
+
+
+def _encode_names(names):
+    text = "".join(names)
+    offsets = array('Q', [0])
+    end = 0
+    for name in names:
+        end += len(name)
+        offsets.append(end)
+    # Spotify names are JSON strings, which may hold lone surrogates
+    return offsets, text.encode("utf-8", "surrogatepass")
+
+
+def _decode_names(offsets, data):
+    text = str(data, "utf-8", "surrogatepass")
+    return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def write_snapshot(path, store, play_keys, track_years, entries_read):
+    """
+    Writes the plays of store with their de-duplication keys to path.
+    The file is written next to path and renamed over it, so a reader never sees it half written.
+    """
+    track_offsets, track_text = _encode_names(store.tracks.names)
+    track_key_offsets, track_key_text = _encode_names(store.tracks.keys)
+    data = {
+        "track_offsets": track_offsets, "track_text": track_text,
+        "track_key_offsets": track_key_offsets, "track_key_text": track_key_text,
+        "play_keys": array('Q', sorted(play_keys)), "track_years": array('H', track_years),
+    }
+    for symbols in ("artist", "platform", "reason_end"):
+        data[f"{symbols}_offsets"], data[f"{symbols}_text"] = _encode_names(getattr(store, f"{symbols}s").names)
+    for name, _ in COLUMNS:
+        data[name] = getattr(store, name)
+
+    position = _HEADER.size + _SECTION.size * len(SECTIONS)
+    table = []
+    for name, _ in SECTIONS:
+        position += -position % _ALIGNMENT
+        size = memoryview(data[name]).nbytes
+        table.append((position, size))
+        position += size
+
+    flags = _BIG_ENDIAN if sys.byteorder == "big" else 0
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(SECTIONS), entries_read))
+            for offset, size in table:
+                file.write(_SECTION.pack(offset, size))
+            for (name, _), (offset, _) in zip(SECTIONS, table):
+                file.write(b"\0" * (offset - file.tell()))
+                file.write(data[name])
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def is_snapshot(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_snapshot(path):
+    """
+    Maps the snapshot at path into memory.
+    Returns (store, play_keys, track_years, entries_read): the columns of store and play_keys are read-only
+    memoryviews over the mapping, so pages are only read from disk when a computation touches them.
+    Only the symbol tables are decoded up front. Raises SnapshotError or OSError.
+    """
+    with open(path, "rb") as file:
+        try:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            raise SnapshotError(f"{path} is not a snapshot") from None
+    view = memoryview(mapping)
+
+    table_end = _HEADER.size + _SECTION.size * len(SECTIONS)
+    if len(view) < table_end or view[:len(MAGIC)] != MAGIC:
+        raise SnapshotError(f"{path} is not a snapshot")
+    _, version, flags, count, entries_read = _HEADER.unpack_from(view)
+    if version != FORMAT_VERSION or count != len(SECTIONS):
+        raise SnapshotError(f"{path} has unsupported snapshot version {version}")
+    if bool(flags & _BIG_ENDIAN) != (sys.byteorder == "big"):
+        raise SnapshotError(f"{path} was written on a machine with a different byte order")
+
+    sections = {}
+    for index, (name, typecode) in enumerate(SECTIONS):
+        offset, size = _SECTION.unpack_from(view, _HEADER.size + index * _SECTION.size)
+        itemsize = array(typecode).itemsize if typecode else 1
+        if offset + size > len(view) or offset % _ALIGNMENT or size % itemsize:
+            raise SnapshotError(f"{path} is truncated or corrupt")
+        section = view[offset:offset + size]
+        sections[name] = section.cast(typecode) if typecode else section
+
+    store = PlayStore()
+    store.tracks = SymbolTable(_decode_names(sections["track_key_offsets"], sections["track_key_text"]),
+                               _decode_names(sections["track_offsets"], sections["track_text"]))
+    for symbols in ("artist", "platform", "reason_end"):
+        names = _decode_names(sections[f"{symbols}_offsets"], sections[f"{symbols}_text"])
+        setattr(store, f"{symbols}s", SymbolTable(names, names))
+    if len(store.tracks.names) != len(store.tracks):
+        raise SnapshotError(f"{path} is truncated or corrupt")
+    for name, _ in COLUMNS:
+        setattr(store, name, sections[name])
+    if len({len(sections[name]) for name, _ in COLUMNS}) != 1:
+        raise SnapshotError(f"{path} is truncated or corrupt")
+    store.mapped = True
+    # The memoryviews keep the mapping open, it is unmapped once the last of them is released
+    return store, sections["play_keys"], list(sections["track_years"]), entries_read
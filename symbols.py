@@ -0,0 +1,42 @@
+class SymbolTable:
+    """
+    Interns identity keys, e.g. a spotify_track_uri, to compact integer ids.
+    Id i stands for keys[i] and is shown as names[i], the display name it was first seen with.
+    """
+
+    def __init__(self, keys=(), names=()):
+        self.keys = list(keys)
+        self.names = list(names)
+        self.ids = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, name):
+        """
+        Adds a key that is not in the table yet and returns its id.
+        """
+        symbol_id = self.ids[key] = len(self.keys)
+        self.keys.append(key)
+        self.names.append(name)
+        return symbol_id
+
+    def intern(self, key, name):
+        symbol_id = self.ids.get(key)
+        if symbol_id is None:
+            symbol_id = self.add(key, name)
+        return symbol_id
+
+    def remap(self, other):
+        """
+        Interns every symbol of another table. Returns the list mapping other's ids to ids of this table.
+        """
+        return [self.intern(key, name) for key, name in zip(other.keys, other.names)]
+
+
+def track_identity(track_uri, artist_name, track_name):
+    """
+    Key identifying a track: its Spotify URI, or the artist and track names for plays without one.
+    """
+    # "\0" never occurs in a URI, so the two kinds of keys cannot collide
+    return track_uri or f"{artist_name}\0{track_name}"
@@ -0,0 +1,22 @@
+import json
+import os
+
+
+def make_entry(artist, track, ms_played, ts="2023-05-01T12:00:00Z", **fields):
+    """
+    An entry of a Spotify export. fields adds or replaces any other field, e.g. spotify_track_uri or platform.
+    """
+    entry = {"ts": ts, "ms_played": ms_played,
+             "master_metadata_track_name": track, "master_metadata_album_artist_name": artist}
+    entry.update(fields)
+    return entry
+
+
+def write_export(directory, name, entries):
+    """
+    Writes entries as the export file name in directory and returns its path.
+    """
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(entries, file)
+    return path
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import aggregate_cache
+from aggregate_cache import AggregateCache
+from analyze_json import SpotifyAnalyzer
+
+
+def write_export(directory, name, entries):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(entries, file)
+    return path
+
+
+def make_entries(artist, count, year=2023):
+    return [{"ts": f"{year}-01-01T10:00:00Z", "ms_played": 30000 + i,
+             "master_metadata_track_name": f"Track{i % 3}", "master_metadata_album_artist_name": artist}
+            for i in range(count)]
+
+
+class TestAggregateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "cache", "aggregates.sqlite3")
+        self.cache = AggregateCache(self.cache_path)
+        self.paths = [write_export(self.tmp.name, "a.json", make_entries("Artist1", 5)),
+                      write_export(self.tmp.name, "b.json", make_entries("Artist2", 4, 2022))]
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_reopen_uses_cache(self):
+        expected = SpotifyAnalyzer()
+        expected.process_files(self.paths)
+
+        first = SpotifyAnalyzer(cache=self.cache)
+        self.assertIsNone(first.process_files(self.paths))
+        self.assertEqual(first.track_plays, expected.track_plays)
+
+        second = SpotifyAnalyzer(cache=self.cache)
+        with patch.object(SpotifyAnalyzer, "iter_json_entries", side_effect=AssertionError("file was parsed")):
+            self.assertIsNone(second.process_files(self.paths))
+        self.assertEqual(second.track_plays, expected.track_plays)
+        self.assertEqual(second.artist_play_time, expected.artist_play_time)
+        self.assertEqual(second.track_years, [2022, 2023])
+
+    def test_changed_file_is_reingested(self):
+        SpotifyAnalyzer(cache=self.cache).process_files(self.paths)
+        write_export(self.tmp.name, "b.json", make_entries("Artist3", 2, 2021))
+
+        analyzer = SpotifyAnalyzer(cache=self.cache)
+        with patch.object(SpotifyAnalyzer, "iter_json_entries", wraps=analyzer.iter_json_entries) as parsed:
+            analyzer.process_files(self.paths)
+        self.assertEqual([call.args[0] for call in parsed.call_args_list], [[self.paths[1]]])
+        self.assertEqual(analyzer.artist_plays, {2021: {"Artist3": 2}, 2023: {"Artist1": 5}})
+
+    def test_columnar_entries_are_separate(self):
+        SpotifyAnalyzer(cache=self.cache).process_files(self.paths)
+        columnar = SpotifyAnalyzer(columnar=True, cache=self.cache)
+        columnar.process_files(self.paths)
+        self.assertEqual(len(columnar.store), 9)
+
+    def test_errors_are_not_cached(self):
+        missing = os.path.join(self.tmp.name, "missing.json")
+        error = SpotifyAnalyzer(cache=self.cache).process_files(self.paths + [missing])
+        self.assertEqual(error, f"Error: File not found {missing}.")
+        self.assertIsNone(self.cache.get(missing, False))
+
+    def test_schema_version_invalidates(self):
+        SpotifyAnalyzer(cache=self.cache).process_files(self.paths)
+        self.cache.close()
+        with patch.object(aggregate_cache, "SCHEMA_VERSION", aggregate_cache.SCHEMA_VERSION + 1):
+            self.cache = AggregateCache(self.cache_path)
+        self.assertIsNone(self.cache.get(self.paths[0], False))
+
+    def test_eviction(self):
+        self.cache.max_bytes = 1
+        SpotifyAnalyzer(cache=self.cache).process_files(self.paths)
+        rows = self.cache.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self.assertEqual(rows, 0)
+        self.assertIsNone(self.cache.get(self.paths[0], False))
+
+
+if __name__ == "__main__":
+    unittest.main()
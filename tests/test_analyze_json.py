@@ -1,6 +1,12 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import patch, mock_open
-from analyze_json import SpotifyAnalyzer
+from unittest.mock import call, patch, mock_open
+import analyze_json
+from analyze_json import SpotifyAnalyzer, _play_key, _track_hash
+from helpers import make_entry, write_export
+from timestamps import epoch_seconds
+
 
 class TestSpotifyAnalyzer(unittest.TestCase):
 
@@ -26,36 +32,272 @@ class TestSpotifyAnalyzer(unittest.TestCase):
 
     def test_process_data(self):
         combined_data = [
-            {"ms_played": 30000, "master_metadata_track_name": "Track1", "master_metadata_album_artist_name": "Artist1"},
-            {"ms_played": 25000, "master_metadata_track_name": "Track2", "master_metadata_album_artist_name": "Artist2"},
-            {"ms_played": 10000, "master_metadata_track_name": "Track3", "master_metadata_album_artist_name": "Artist3"}
+            make_entry("Artist1", "Track1", 30000),
+            make_entry("Artist2", "Track2", 25000),
+            make_entry("Artist3", "Track3", 10000)
         ]
         self.analyzer.process_data(combined_data)
-        self.assertEqual(len(self.analyzer.track_plays), 2, "Should process and count tracks with ms_played >= 20000")
-        self.assertEqual(self.analyzer.track_plays["Artist1 - Track1"], 1, "Should correctly count track plays")
-        self.assertEqual(self.analyzer.track_play_time["Artist1 - Track1"], 30000, "Should correctly sum ms_played")
+        self.assertEqual(len(self.analyzer.track_plays[2023]), 2, "Should process and count tracks with ms_played >= 20000")
+        self.assertEqual(self.analyzer.track_plays[2023]["Artist1 - Track1"], 1, "Should correctly count track plays")
+        self.assertEqual(self.analyzer.track_play_time[2023]["Artist1 - Track1"], 30000, "Should correctly sum ms_played")
 
     def test_process_data_with_duplicates(self):
         combined_data = [
-            {"ms_played": 30000, "master_metadata_track_name": "Track1", "master_metadata_album_artist_name": "Artist1"},
-            {"ms_played": 25000, "master_metadata_track_name": "Track1", "master_metadata_album_artist_name": "Artist1"},
-            {"ms_played": 15000, "master_metadata_track_name": "Track1", "master_metadata_album_artist_name": "Artist1"}  # This should be ignored
+            make_entry("Artist1", "Track1", 30000),
+            make_entry("Artist1", "Track1", 25000),
+            make_entry("Artist1", "Track1", 15000)  # This should be ignored
         ]
         self.analyzer.process_data(combined_data)
-        self.assertEqual(len(self.analyzer.track_plays), 1, "Should process and count unique tracks with ms_played >= 20000")
-        self.assertEqual(self.analyzer.track_plays["Artist1 - Track1"], 2, "Should correctly count track plays")
-        self.assertEqual(self.analyzer.track_play_time["Artist1 - Track1"], 55000, "Should correctly sum ms_played")
+        self.assertEqual(len(self.analyzer.track_plays[2023]), 1, "Should process and count unique tracks with ms_played >= 20000")
+        self.assertEqual(self.analyzer.track_plays[2023]["Artist1 - Track1"], 2, "Should correctly count track plays")
+        self.assertEqual(self.analyzer.track_play_time[2023]["Artist1 - Track1"], 55000, "Should correctly sum ms_played")
 
     def test_get_sorted_by_plays(self):
-        self.analyzer.track_plays = {"Artist1 - Track1": 2, "Artist2 - Track2": 1}
+        self.analyzer.track_plays = {2023: {"Artist2 - Track2": 1, "Artist1 - Track1": 2}}
         sorted_plays = self.analyzer.get_sorted_by_plays()
         self.assertEqual(sorted_plays, [("Artist1 - Track1", 2), ("Artist2 - Track2", 1)], "Should sort tracks by plays")
 
     def test_get_sorted_by_minutes(self):
-        self.analyzer.track_play_time = {"Artist1 - Track1": 60000, "Artist2 - Track2": 30000}
-        self.analyzer.track_plays = {"Artist1 - Track1": 2, "Artist2 - Track2": 1}
+        self.analyzer.track_play_time = {2023: {"Artist1 - Track1": 30000, "Artist2 - Track2": 60000}}
+        self.analyzer.track_plays = {2023: {"Artist1 - Track1": 2, "Artist2 - Track2": 1}}
         sorted_minutes = self.analyzer.get_sorted_by_minutes()
-        self.assertEqual(sorted_minutes, [("Artist1 - Track1", 2), ("Artist2 - Track2", 1)], "Should sort tracks by minutes")
+        self.assertEqual(sorted_minutes, [("Artist2 - Track2", 1), ("Artist1 - Track1", 2)], "Should sort tracks by minutes")
+
+    def test_process_files_streams_like_process_data(self):
+        entries = [make_entry("Artist1", "Track1", 30000), make_entry("Artist1", "Track1", 25000, "2022-01-01T00:00:00Z"),
+                   make_entry("Artist2", "Track2", 10000)]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [write_export(tmp, f"Streaming_History_Audio_{i}.json", chunk)
+                     for i, chunk in enumerate((entries[:2], entries[2:]))]
+            self.assertIsNone(self.analyzer.process_files(paths))
+            streamed = (self.analyzer.track_plays.copy(), self.analyzer.track_play_time.copy(), self.analyzer.track_years)
+
+            expected = SpotifyAnalyzer()
+            expected.process_data(expected.load_json_files(paths))
+            self.assertEqual(streamed, (expected.track_plays, expected.track_play_time, expected.track_years))
+            self.assertEqual(self.analyzer.track_plays, {2022: {"Artist1 - Track1": 1}, 2023: {"Artist1 - Track1": 1}})
+
+            error = self.analyzer.process_files(paths + [os.path.join(tmp, "missing.json")])
+            self.assertTrue(error.startswith("Error:"))
+            self.assertEqual(self.analyzer.track_plays, {})
+            self.assertEqual(self.analyzer.track_years, [])
+
+    def test_columnar_matches_dict_statistics(self):
+        entries = [make_entry(f"Artist{i % 3}", f"Track{i % 5}", 15000 + i * 1000, f"20{20 + i % 4}-03-01T10:00:00Z")
+                   for i in range(40)]
+        self.analyzer.process_data(entries)
+        columnar = SpotifyAnalyzer(columnar=True)
+        columnar.process_data(entries)
+
+        self.assertEqual(len(columnar.store), 35)
+        self.assertEqual(columnar.track_years, self.analyzer.track_years)
+        for name in ("track_plays", "track_play_time", "artist_plays", "artist_play_time"):
+            self.assertEqual(getattr(columnar, name), getattr(self.analyzer, name), name)
+        self.assertEqual(columnar.get_sorted_by_minutes(), self.analyzer.get_sorted_by_minutes())
+
+        # Views are rebuilt after more data arrives
+        columnar.process_data(entries[:1] + entries[-1:])
+        self.assertEqual(columnar.track_plays, {2023: {"Artist0 - Track4": 1}})
+
+    def test_float_ms_played(self):
+        for columnar in (False, True):
+            analyzer = SpotifyAnalyzer(columnar)
+            analyzer.process_data([make_entry("Artist1", "Track1", 30000.0), make_entry("Artist1", "Track1", 25000.5, "2023-05-02T12:00:00Z")])
+            self.assertEqual(analyzer.track_play_time, {2023: {"Artist1 - Track1": 55000}})
+
+    @patch.object(analyze_json, "PARALLEL_MIN_BYTES", 0)
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [write_export(tmp, f"Streaming_History_Audio_{i}.json",
+                                  [make_entry(f"Artist{j % 4}", f"Track{(i + j) % 6}", 12000 + j * 700, f"20{18 + j % 5}-06-01T08:00:00Z")
+                                   for j in range(30)])
+                     for i in range(4)]
+            for columnar in (False, True):
+                serial = SpotifyAnalyzer(columnar)
+                self.assertIsNone(serial.process_files(paths))
+                parallel = SpotifyAnalyzer(columnar)
+                self.assertIsNone(parallel.process_files(paths, workers=2))
+                self.assertEqual(parallel.track_years, serial.track_years)
+                for name in ("track_plays", "track_play_time", "artist_plays", "artist_play_time"):
+                    self.assertEqual(getattr(parallel, name), getattr(serial, name), name)
+
+            broken = os.path.join(tmp, "broken.json")
+            with open(broken, "w", encoding="utf-8") as file:
+                file.write("[{")
+            error = self.analyzer.process_files(paths[:1] + [broken] + paths[1:], workers=2)
+            self.assertEqual(error, f"Error: File {broken} is not a valid JSON.")
+            self.assertEqual(self.analyzer.track_plays, {})
+
+    def test_add_files_deduplicates_overlapping_exports(self):
+        history = [dict(make_entry(f"Artist{i % 2}", f"Track{i % 3}", 30000 + i, f"2023-0{1 + i % 9}-01T10:00:00Z"),
+                        spotify_track_uri=f"spotify:track:{i % 3}") for i in range(12)]
+        with tempfile.TemporaryDirectory() as tmp:
+            old = write_export(tmp, "old.json", history[:8])
+            new = write_export(tmp, "new.json", history[5:])
+            expected = SpotifyAnalyzer()
+            expected.process_data(history)
+
+            for columnar in (False, True):
+                analyzer = SpotifyAnalyzer(columnar)
+                self.assertIsNone(analyzer.process_files([old]))
+                self.assertIsNone(analyzer.add_files([new]))
+                self.assertIsNone(analyzer.add_files([new]))
+                self.assertEqual(analyzer.track_plays, expected.track_plays)
+                self.assertEqual(analyzer.artist_play_time, expected.artist_play_time)
+
+                # Overlapping files within one call are deduplicated as well
+                analyzer.process_files([old, new])
+                self.assertEqual(analyzer.track_play_time, expected.track_play_time)
+
+            # Without kept keys nothing can be added to the statistics, their plays could be counted twice
+            analyzer = SpotifyAnalyzer(keep_play_keys=False)
+            analyzer.process_files([old, new])
+            self.assertEqual(analyzer.track_play_time, expected.track_play_time)
+            self.assertEqual(len(analyzer._play_keys), 0)
+            self.assertEqual(analyzer.add_files([new]), analyze_json.KEYS_DROPPED)
+            self.assertEqual(analyzer.add_entries(history), analyze_json.KEYS_DROPPED)
+            self.assertFalse(SpotifyAnalyzer().merge(analyzer))
+            self.assertEqual(analyzer.track_play_time, expected.track_play_time)
+            self.assertIsNone(analyzer.process_files([old]))
+            self.assertEqual(analyzer.add_files([new]), analyze_json.KEYS_DROPPED)
+
+            # A failing add leaves the statistics untouched
+            missing = os.path.join(tmp, "missing.json")
+            self.analyzer.process_files([old])
+            before = {year: dict(plays) for year, plays in self.analyzer.track_plays.items()}
+            self.assertEqual(self.analyzer.add_files([new, missing]), f"Error: File not found {missing}.")
+            self.assertEqual(self.analyzer.track_plays, before)
+
+    def test_add_files_after_process_files(self):
+        entries = [make_entry("A", "T", 30000, f"2023-05-0{day}T12:00:00Z") for day in range(1, 5)]
+        with tempfile.TemporaryDirectory() as tmp:
+            first = write_export(tmp, "first.json", entries[:2])
+            second = write_export(tmp, "second.json", entries)
+            # The second export repeats both plays of the first one
+            self.assertIsNone(self.analyzer.process_files([first]))
+            self.assertIsNone(self.analyzer.add_files([second]))
+            self.assertEqual(self.analyzer.get_ranking("track"), [("A - T", 4, 120000)])
+
+    def test_add_entries_aggregates_only_new_plays(self):
+        entries = [make_entry(f"Artist{i % 3}", f"Track{i % 4}", 30000 + i, f"202{2 + i % 2}-05-01T12:00:{i:02d}Z")
+                   for i in range(12)]
+        analyzer, expected = SpotifyAnalyzer(columnar=True), SpotifyAnalyzer(columnar=True)
+        analyzer.process_data(entries[:5])
+        analyzer.get_ranking("track")
+        with patch.object(analyzer.store, "aggregate", wraps=analyzer.store.aggregate) as aggregate:
+            analyzer.add_entries(entries[5:])
+            analyzer.get_ranking("track")
+        self.assertEqual(aggregate.call_args_list, [call("track", 5), call("artist", 5)])
+        expected.process_data(entries)
+        for stat_name in ("track_plays", "track_play_time", "artist_plays", "artist_play_time"):
+            # Same counters in the same order, ties rank alike
+            self.assertEqual([(year, list(values.items())) for year, values in getattr(analyzer, stat_name).items()],
+                             [(year, list(values.items())) for year, values in getattr(expected, stat_name).items()])
+
+    def test_add_entries(self):
+        analyzer = SpotifyAnalyzer()
+        analyzer.process_data([make_entry("Artist1", "Track1", 30000)])
+        analyzer.add_entries([make_entry("Artist1", "Track1", 30000), make_entry("Artist1", "Track1", 40000, "2024-01-01T00:00:00Z")])
+        self.assertEqual(analyzer.track_plays, {2023: {"Artist1 - Track1": 1}, 2024: {"Artist1 - Track1": 1}})
+        self.assertEqual(analyzer.track_years, [2023, 2024])
+
+    def test_play_keys(self):
+        entries = [dict(make_entry("Artist1", "Track1", 30000), spotify_track_uri="spotify:track:1"),
+                   make_entry("Artist2", "Track2", 40000, "2022-01-01T00:00:00Z")]
+        self.analyzer.process_data(entries)
+        expected = [_play_key(epoch_seconds("2022-01-01T00:00:00Z"), _track_hash("Artist2\0Track2"), 40000),
+                    _play_key(epoch_seconds("2023-05-01T12:00:00Z"), _track_hash("spotify:track:1"), 30000)]
+        # Keys sort by the time of their play
+        self.assertEqual(sorted(self.analyzer._play_keys), expected)
+
+    def test_tracks_are_identified_by_uri(self):
+        entries = [dict(make_entry("Artist1", "Intro", 30000, f"2023-01-0{i + 1}T00:00:00Z"), spotify_track_uri=uri)
+                   for i, uri in enumerate(("spotify:track:a", "spotify:track:b", "spotify:track:a"))]
+        # A renamed track keeps counting under the name it was first seen with
+        entries.append(dict(make_entry("Artist1", "Intro (Remastered)", 30000, "2023-02-01T00:00:00Z"), spotify_track_uri="spotify:track:a"))
+        for columnar in (False, True):
+            analyzer = SpotifyAnalyzer(columnar)
+            analyzer.process_data(entries)
+            self.assertEqual(analyzer.get_ranking("track"), [("Artist1 - Intro", 3, 90000), ("Artist1 - Intro", 1, 30000)])
+            self.assertEqual(analyzer.tracks.keys, ["spotify:track:a", "spotify:track:b"])
+            self.assertEqual(analyzer.track_plays, {2023: {"Artist1 - Intro": 4}})
+
+            merged = SpotifyAnalyzer(columnar)
+            merged.process_data(entries[1:2])
+            self.assertFalse(merged.merge(analyzer))
+            partial = SpotifyAnalyzer(columnar)
+            partial.process_data(entries[:1] + entries[2:])
+            self.assertTrue(merged.merge(partial))
+            self.assertEqual(merged.get_ranking("track"), [("Artist1 - Intro", 3, 90000), ("Artist1 - Intro", 1, 30000)])
+            self.assertEqual(merged.tracks.keys, ["spotify:track:b", "spotify:track:a"])
+
+    def test_rankings_are_memoized_and_invalidated(self):
+        entries = [make_entry(f"Artist{i % 4}", f"Track{i % 7}", 20000 + (i * 7919) % 90000, f"20{20 + i % 3}-01-01T00:00:00Z")
+                   for i in range(60)]
+        self.analyzer.process_data(entries)
+        all_plays = {}
+        for year_dict in self.analyzer.track_plays.values():
+            for track, plays in year_dict.items():
+                all_plays[track] = all_plays.get(track, 0) + plays
+        self.assertEqual(self.analyzer.get_sorted_by_plays(), sorted(all_plays.items(), key=lambda item: item[1], reverse=True))
+
+        with patch.object(analyze_json, "_sum_years", side_effect=AssertionError("totals rebuilt")):
+            for _ in range(2):
+                self.analyzer.get_sorted_by_minutes()
+                self.analyzer.get_artists_sorted_by_plays()
+                self.analyzer.get_sorted_by_plays(2021)
+        self.assertIs(self.analyzer._ranking("track_plays"), self.analyzer._ranking("track_plays"))
+
+        self.analyzer.add_entries([make_entry("Artist9", "Track9", 30000 + i, f"2021-02-0{i + 1}T00:00:00Z") for i in range(9)])
+        self.assertEqual(self.analyzer.get_sorted_by_plays()[0], ("Artist9 - Track9", 9))
+        self.assertEqual(self.analyzer.get_artists_sorted_by_plays(2021)[0], ("Artist9", 9))
+
+        self.analyzer.track_plays = {2020: {"Artist1 - Track1": 5}}
+        self.assertEqual(self.analyzer.get_sorted_by_plays(), [("Artist1 - Track1", 5)])
+
+    def test_get_ranking_pages_match_full_sort(self):
+        entries = [make_entry(f"Artist{i % 11}", f"Track{(i * 31) % 97}", 20000 + (i * 7919) % 50000) for i in range(600)]
+        self.analyzer.process_data(entries)
+        plays = self.analyzer.track_plays[2023]
+        play_time = self.analyzer.track_play_time[2023]
+        for metric, values in (("plays", plays), ("ms", play_time)):
+            full = [(key, plays[key], play_time[key]) for key in sorted(values, key=values.get, reverse=True)]
+            for limit, offset, min_plays in ((5, 0, 0), (10, 3, 0), (4, 0, 8), (3, 6, 7), (None, 10, 0), (1000, 0, 0)):
+                self.analyzer._invalidate()
+                expected = [row for row in full if row[1] >= min_plays]
+                expected = expected[offset:None if limit is None else offset + limit]
+                self.assertEqual(self.analyzer.get_ranking("track", metric, 2023, limit, offset, min_plays), expected,
+                                 (metric, limit, offset, min_plays))
+
+        # The first page does not need a full sort
+        self.analyzer._invalidate()
+        self.analyzer.get_ranking("track", "plays", None, limit=5)
+        self.assertFalse(self.analyzer._rank_cache[("track_plays", None)][1])
+        self.assertEqual(self.analyzer.get_ranking("artist", "ms", 2024), [])
+        with self.assertRaises(ValueError):
+            self.analyzer.get_ranking("album")
+
+    @patch.object(analyze_json, "PROGRESS_INTERVAL", 10)
+    def test_progress_and_cancel(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [write_export(tmp, f"{i}.json", [make_entry("Artist1", f"Track{j}", 30000, f"2023-01-01T00:00:{j:02d}Z")
+                                                     for j in range(25)]) for i in range(2)]
+            total = sum(os.path.getsize(path) for path in paths)
+            reports = []
+            self.assertIsNone(self.analyzer.process_files(paths, progress=lambda *args: reports.append(args)))
+            self.assertEqual([entries for _, _, entries in reports], [10, 20, 25, 35, 45, 50])
+            self.assertEqual(reports[-1], (total, total, 50))
+            self.assertEqual(self.analyzer.entries_read, 50)
+
+            # Cancelling an add keeps the previous data, cancelling a fresh load leaves nothing
+            for analyzer in (self.analyzer, SpotifyAnalyzer()):
+                before = analyzer.get_sorted_by_plays()
+                new_path = write_export(tmp, "new.json", [make_entry("Artist2", "Track", 30000, f"2024-01-01T00:00:{j:02d}Z")
+                                                          for j in range(25)])
+                self.assertEqual(analyzer.add_files([new_path], progress=lambda done, total, entries: entries < 20),
+                                 analyze_json.CANCELLED)
+                self.assertEqual(analyzer.get_sorted_by_plays(), before)
+
 
 if __name__ == "__main__":
     unittest.main()
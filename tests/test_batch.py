@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import batch
+from helpers import make_entry, write_export
+
+
+def make_entries(artist, count):
+    return [make_entry(artist, f"Track{i % 2}", 30000, f"2023-01-01T00:00:{i:02d}Z") for i in range(count)]
+
+
+def analyze_or_crash(user_id, file_paths, top=10):
+    """
+    Stands in for batch.analyze_user, killing the worker process for carol.
+    """
+    if user_id == "carol":
+        os._exit(1)
+    return batch.analyze_user(user_id, file_paths, top)
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for user, count in (("alice", 3), ("bob", 4)):
+            os.mkdir(os.path.join(self.tmp.name, user))
+            write_export(os.path.join(self.tmp.name, user), "Streaming_History_Audio_0.json", make_entries(user, count))
+        # Dave's second export repeats his first one
+        os.mkdir(os.path.join(self.tmp.name, "dave"))
+        for name in ("Streaming_History_Audio_0.json", "Streaming_History_Audio_1.json"):
+            write_export(os.path.join(self.tmp.name, "dave"), name, make_entries("dave", 2))
+        with open(os.path.join(self.tmp.name, "bob", "Streaming_History_Audio_1.json"), "w") as file:
+            file.write("[{broken")
+        self.manifest = write_export(self.tmp.name, "manifest.json", [
+            {"user_id": "alice", "files": ["alice/*.json"]},
+            {"user_id": "bob", "files": ["bob"]},
+            {"user_id": "carol", "files": ["carol/*.json"]},
+            {"user_id": "dave", "files": ["dave"]},
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_manifest(self):
+        users = batch.load_manifest(self.manifest)
+        self.assertEqual([(user, len(files)) for user, files in users], [("alice", 1), ("bob", 2), ("carol", 0), ("dave", 2)])
+
+    def test_run_batch_isolates_failures(self):
+        results = {}
+        report = batch.run_batch(batch.load_manifest(self.manifest), workers=2, top=1,
+                                 on_result=lambda result: results.setdefault(result["user_id"], result))
+
+        self.assertEqual(results["alice"]["status"], "ok")
+        self.assertEqual(results["alice"]["top_tracks_by_plays"], [{"name": "alice - Track0", "plays": 2, "ms_played": 60000}])
+        # Bob's broken file is reported, his valid file is still counted
+        self.assertEqual(results["bob"]["status"], "partial")
+        self.assertEqual(results["bob"]["plays"], 4)
+        self.assertIn("is not a valid JSON", results["bob"]["errors"][0])
+        self.assertEqual(results["carol"]["status"], "failed")
+        # Plays repeated across a user's exports are counted once
+        self.assertEqual((results["dave"]["entries"], results["dave"]["plays"]), (4, 2))
+
+        self.assertEqual((report["users"], report["ok"], report["partial"], report["failed"]), (4, 2, 1, 1))
+        self.assertEqual(report["entries"], 11)
+        self.assertEqual(sorted(report["failures"]), ["bob", "carol"])
+        self.assertEqual(sorted(row["user_id"] for row in report["per_user"]), ["alice", "bob", "carol", "dave"])
+
+    def test_worker_crash_fails_only_its_user(self):
+        results = {}
+        with patch.object(batch, "analyze_user", analyze_or_crash):
+            report = batch.run_batch(batch.load_manifest(self.manifest), workers=2,
+                                     on_result=lambda result: results.setdefault(result["user_id"], result))
+        self.assertEqual(results["carol"]["errors"], ["Error: Worker process died."])
+        self.assertEqual({user_id: result["status"] for user_id, result in results.items()},
+                         {"alice": "ok", "bob": "partial", "carol": "failed", "dave": "ok"})
+        self.assertEqual((report["ok"], report["partial"], report["failed"]), (2, 1, 1))
+
+    def test_main_writes_summaries_and_report(self):
+        output = os.path.join(self.tmp.name, "out.jsonl")
+        report_path = os.path.join(self.tmp.name, "report.json")
+        status = batch.main([self.manifest, "--workers", "1", "--output", output, "--report", report_path])
+        self.assertEqual(status, 1)
+        with open(output, encoding="utf-8") as file:
+            self.assertEqual(sorted(json.loads(line)["user_id"] for line in file), ["alice", "bob", "carol", "dave"])
+        with open(report_path, encoding="utf-8") as file:
+            self.assertEqual(json.load(file)["users"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
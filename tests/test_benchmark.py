@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+import benchmark
+from analyze_json import SpotifyAnalyzer
+from benchmark import compare, generate_history, parse_size, write_history
+
+
+class TestGenerator(unittest.TestCase):
+
+    def test_history_is_deterministic_and_realistic(self):
+        entries = list(generate_history(5000, seed=1))
+        self.assertEqual(entries, list(generate_history(5000, seed=1)))
+        self.assertNotEqual(entries, list(generate_history(5000, seed=2)))
+        self.assertEqual([entry["ts"] for entry in entries], sorted(entry["ts"] for entry in entries))
+        self.assertGreaterEqual(len({entry["ts"][:4] for entry in entries}), 4)
+
+        podcasts = [entry for entry in entries if entry["master_metadata_track_name"] is None]
+        skips = [entry for entry in entries if entry["ms_played"] < 20000]
+        self.assertTrue(all(entry["spotify_episode_uri"] for entry in podcasts))
+        self.assertAlmostEqual(len(podcasts) / len(entries), benchmark.PODCAST_SHARE, delta=0.02)
+        self.assertAlmostEqual(len(skips) / len(entries), benchmark.SKIP_SHARE * (1 - benchmark.PODCAST_SHARE), delta=0.03)
+
+        # Zipf: the top artist is played far more often than a typical one
+        artists = Counter(entry["master_metadata_album_artist_name"] for entry in entries if entry["master_metadata_track_name"])
+        counts = sorted(artists.values(), reverse=True)
+        self.assertGreater(counts[0], 10 * counts[len(counts) // 2])
+
+    def test_write_history(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = write_history(tmp, 2500, plays_per_file=1000)
+            self.assertEqual([os.path.basename(path) for path in paths],
+                             [f"Streaming_History_Audio_{i}.json" for i in range(3)])
+            with patch.object(benchmark, "generate_history", side_effect=AssertionError("generated again")):
+                self.assertEqual(write_history(tmp, 2500, plays_per_file=1000), paths)
+
+            analyzer = SpotifyAnalyzer()
+            self.assertIsNone(analyzer.process_files(paths))
+            expected = SpotifyAnalyzer()
+            expected.process_data(generate_history(2500))
+            self.assertEqual(analyzer.get_ranking("track"), expected.get_ranking("track"))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual([parse_size(text) for text in ("10k", "1M", "2500")], [10_000, 1_000_000, 2500])
+        with self.assertRaises(ValueError):
+            parse_size("0")
+
+    def test_compare(self):
+        baseline = {"sizes": {"10000": {"peak_rss_mb": 100, "stages": {"process_data": {"seconds": 1.0},
+                                                                        "get_sorted_by_plays": {"seconds": 0.001}}}}}
+        results = {"sizes": {"10000": {"peak_rss_mb": 110, "stages": {"process_data": {"seconds": 1.2},
+                                                                       "get_sorted_by_plays": {"seconds": 0.004}}},
+                             "1000000": {"peak_rss_mb": 900, "stages": {"process_data": {"seconds": 90.0}}}}}
+        self.assertEqual(compare(results, baseline), [])
+        results["sizes"]["10000"]["stages"]["process_data"]["seconds"] = 1.5
+        results["sizes"]["10000"]["peak_rss_mb"] = 200
+        self.assertEqual(len(compare(results, baseline)), 2)
+
+    def test_time_startup(self):
+        # Stands in for the app: reports a window after 0.1 s and a ready analyzer 0.1 s later
+        fake_app = ("import json, os, time; now = time.time(); "
+                    "json.dump({'window': now + 0.1, 'ready': now + 0.2}, open(os.environ['SPOTIFY_STARTUP_REPORT'], 'w'))")
+        timings = benchmark.time_startup([sys.executable, "-c", fake_app], runs=3)
+        self.assertEqual(set(timings), {"cold_window", "cold_ready", "window", "ready"})
+        self.assertGreater(timings["ready"], timings["window"])
+        self.assertEqual(benchmark.over_budget({"startup": {"source": timings}}, budget=60), [])
+        self.assertEqual(len(benchmark.over_budget({"startup": {"source": timings}}, budget=0.05)), 1)
+
+        with patch("builtins.print"):
+            self.assertIsNone(benchmark.time_startup([sys.executable, "-c", "raise SystemExit(3)"], runs=1))
+
+        results = {"sizes": {}, "startup": {"frozen": dict(timings, cold_ready=timings["cold_ready"] + 5)}}
+        self.assertEqual(compare(results, {"startup": {"frozen": timings}}),
+                         [f"frozen start-up: cold_ready took {timings['cold_ready'] + 5:.3f} s, "
+                          f"baseline {timings['cold_ready']:.3f} s"])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, "baseline.json")
+            args = ["--sizes", "3000", "--data-dir", tmp, "--no-ui", "--baseline", baseline]
+            self.assertEqual(benchmark.main(args + ["--save-baseline"], out=io.StringIO()), benchmark.EXIT_OK)
+            with open(baseline, encoding="utf-8") as file:
+                stages = json.load(file)["sizes"]["3000"]["stages"]
+            self.assertEqual(set(stages), {"load_json_files", "process_data", "process_files", *benchmark.SORTED_METHODS})
+
+            # Every stage of the stored baseline taking no time at all makes the new run a regression
+            for timing in stages.values():
+                timing["seconds"] = 0
+            with open(baseline, "w", encoding="utf-8") as file:
+                json.dump({"sizes": {"3000": {"peak_rss_mb": None, "stages": stages}}}, file)
+            with patch.object(benchmark, "MIN_REGRESSION_SECONDS", 0):
+                out = io.StringIO()
+                self.assertEqual(benchmark.main(args + ["--in-memory-limit", "1000"], out=out), benchmark.EXIT_REGRESSION)
+            self.assertIn("Regression: 3000 plays: process_files", out.getvalue())
+            self.assertNotIn("load_json_files", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
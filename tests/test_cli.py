@@ -0,0 +1,110 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+import cli
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        entries = [{"ts": f"202{2 + i % 2}-01-01T00:00:{i:02d}Z", "ms_played": 30000 + i * 1000,
+                    "master_metadata_track_name": f"Track{i % 3}", "master_metadata_album_artist_name": f"Artist{i % 2}"}
+                   for i in range(12)]
+        for name, chunk in (("Streaming_History_Audio_0.json", entries[:6]), ("Streaming_History_Audio_1.json", entries[6:])):
+            with open(os.path.join(self.tmp.name, name), "w", encoding="utf-8") as file:
+                json.dump(chunk, file)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, *argv):
+        out = io.StringIO()
+        status = cli.main(list(argv) + ["--quiet"], out=out)
+        return status, out.getvalue()
+
+    def test_json_output(self):
+        status, output = self.run_cli(self.tmp.name, "--entity", "artists", "--sort", "minutes", "--format", "json")
+        self.assertEqual(status, cli.EXIT_OK)
+        result = json.loads(output)
+        self.assertEqual([(row["name"], row["plays"]) for row in result["results"]], [("Artist1", 6), ("Artist0", 6)])
+        self.assertEqual(result["results"][0]["ms_played"], 6 * 30000 + 36000)
+
+    def test_csv_year_and_top(self):
+        status, output = self.run_cli(os.path.join(self.tmp.name, "*.json"), "--year", "2023", "--top", "1", "--format", "csv")
+        self.assertEqual(status, cli.EXIT_OK)
+        self.assertEqual(output.splitlines(), ["rank,name,plays,ms_played,minutes", "1,Artist1 - Track1,2,68000,1.13"])
+
+    def test_errors(self):
+        status, output = self.run_cli(os.path.join(self.tmp.name, "missing.json"))
+        self.assertEqual((status, output), (cli.EXIT_LOAD_ERROR, ""))
+        self.assertEqual(self.run_cli(os.path.join(self.tmp.name, "*.txt"))[0], cli.EXIT_LOAD_ERROR)
+        self.assertEqual(self.run_cli(self.tmp.name, "--top", "-1")[0], cli.EXIT_USAGE)
+        # A directory cannot be opened as the cache database
+        self.assertEqual(self.run_cli(self.tmp.name, "--cache", self.tmp.name)[0], cli.EXIT_USAGE)
+        self.assertEqual(self.run_cli(self.tmp.name, "--year", "1999"), (cli.EXIT_NO_DATA, ""))
+
+    def test_period(self):
+        status, output = self.run_cli(self.tmp.name, "--period", "2023-01-01..2023-01-31", "--format", "csv")
+        self.assertEqual(status, cli.EXIT_OK)
+        self.assertEqual(output, self.run_cli(self.tmp.name, "--year", "2023", "--format", "csv")[1])
+        self.assertEqual(self.run_cli(self.tmp.name, "--period", "2022-06"), (cli.EXIT_NO_DATA, ""))
+        self.assertEqual(self.run_cli(self.tmp.name, "--period", "someday")[0], cli.EXIT_USAGE)
+
+    def test_timeline(self):
+        status, output = self.run_cli(self.tmp.name, "--timeline", "sessions", "--format", "csv")
+        self.assertEqual(status, cli.EXIT_OK)
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "rank,start,end,plays,ms_played")
+        # One session per year, the 2023 plays are a little longer
+        self.assertEqual([line.split(",")[2:] for line in lines[1:]],
+                         [["2023-01-01T00:00:11Z", "6", str(6 * 30000 + 36000)],
+                          ["2022-01-01T00:00:10Z", "6", str(6 * 30000 + 30000)]])
+
+        result = json.loads(self.run_cli(self.tmp.name, "--timeline", "streaks", "--format", "json")[1])
+        self.assertEqual([(row["artist"], row["days"], row["last_day"]) for row in result["results"]],
+                         [("Artist0", 1, "2022-01-01"), ("Artist1", 1, "2023-01-01")])
+        output = self.run_cli(self.tmp.name, "--timeline", "discoveries", "--top", "1")[1]
+        self.assertEqual(output, "1. track: Artist1 - Track2, first_listen: 2023-01-01T00:00:05Z, "
+                                 "last_listen: 2023-01-01T00:00:11Z\n")
+        self.assertEqual(self.run_cli(self.tmp.name, "--timeline", "days", "--year", "2023")[0], cli.EXIT_USAGE)
+
+    def test_json_backend_options(self):
+        expected = self.run_cli(self.tmp.name, "--json-backend", "stdlib")
+        self.assertEqual(expected[0], cli.EXIT_OK)
+        self.assertEqual(self.run_cli(self.tmp.name, "--json-backend", "auto", "--used-fields"), expected)
+        with unittest.mock.patch.dict(os.environ, {"SPOTIFY_JSON_BACKEND": "unknown"}):
+            self.assertEqual(self.run_cli(self.tmp.name)[0], cli.EXIT_USAGE)
+            self.assertEqual(self.run_cli(self.tmp.name, "--json-backend", "stdlib"), expected)
+
+    def test_stats_and_profile(self):
+        with unittest.mock.patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            status, output = self.run_cli(self.tmp.name, "--stats", "--format", "json")
+        self.assertEqual(status, cli.EXIT_OK)
+        load_stats = json.loads(output)["load_stats"]
+        self.assertEqual((load_stats["files"], load_stats["entries_decoded"], load_stats["plays_counted"]), (2, 12, 12))
+        self.assertEqual(load_stats["distinct_keys"]["artists"], {"2022": 1, "2023": 1})
+        self.assertGreater(load_stats["stage_seconds"]["decode"], 0)
+        self.assertIn("Plays counted: 12", stderr.getvalue())
+
+        with unittest.mock.patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            self.assertEqual(self.run_cli(self.tmp.name, "--profile", "cprofile")[0], cli.EXIT_OK)
+        self.assertIn("function calls", stderr.getvalue())
+        with unittest.mock.patch.dict(os.environ, {"SPOTIFY_PROFILE": "unknown"}):
+            self.assertEqual(self.run_cli(self.tmp.name)[0], cli.EXIT_USAGE)
+
+    def test_no_gui_imports(self):
+        code = "import sys, analyze_json, cli; print('tkinter' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.strip(), "False")
+
+
+if __name__ == "__main__":
+    unittest.main()
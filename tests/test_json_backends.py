@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import json_backends
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry, write_export
+from json_backends import USED_FIELDS, iter_entries, iter_json_array, orjson_available, resolve_backend, resolve_fields
+
+
+def make_entries(count):
+    """
+    Entries with every field of a real export, most of which the analyzer does not read.
+    """
+    return [make_entry(f"Artist {i % 11}", f"Track {i % 37} \"é\"", 1000 * (i % 60),
+                       f"20{15 + i % 9}-0{1 + i % 9}-1{i % 10}T{10 + i % 14}:0{i % 10}:00Z",
+                       platform="Android OS", conn_country="SE", master_metadata_album_album_name="Album",
+                       spotify_track_uri=f"spotify:track:{i % 37}", reason_start="trackdone", reason_end="endplay",
+                       shuffle=i % 2 == 0, skipped=None, offline=False, offline_timestamp=1600000000 + i,
+                       incognito_mode=False)
+            for i in range(count)]
+
+
+AVAILABLE_BACKENDS = ["stdlib", "auto"] + (["orjson"] if orjson_available() else [])
+
+
+class TestIterJsonArray(unittest.TestCase):
+
+    def test_small_chunks(self):
+        entries = [{"a": "Track \"1\"", "b": 30000}, {"a": "x}", "b": [1, {"c": None}]}, 123456789, "}", [],
+                   -25000000000.0, 1.5e+300, 2e-05]
+        text = " [\n" + ",\n  ".join(json.dumps(e) for e in entries) + "\n] \n"
+        # 16 cuts -25000000000.0 right after its "."
+        self.assertEqual(list(iter_json_array(io.StringIO("[\n -25000000000.0, 1]"), 16)), [-25000000000.0, 1])
+        for chunk_size in (1, 3, 7, 16, 64):
+            self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size)), entries)
+        self.assertEqual(list(iter_json_array(io.StringIO("[ ]"), 2)), [])
+
+    def test_matches_json_loads(self):
+        entries = make_entries(500)
+        for text in (json.dumps(entries), json.dumps(entries, indent=4, ensure_ascii=False)):
+            for chunk_size in (5, 1000, 1 << 16):
+                self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size)), json.loads(text))
+
+    def test_invalid(self):
+        for text in ('{"a": 1}', '[1, 2', '[1 2]', '[1, 2] x', '', '[{"a": 1}, ]', '[{"a": 1}] {"b": 2}', '[{"a": 1}}]'):
+            for chunk_size in (2, 1 << 16):
+                with self.assertRaises(json.JSONDecodeError, msg=text):
+                    list(iter_json_array(io.StringIO(text), chunk_size))
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_backends_match_stdlib(self):
+        text = json.dumps(make_entries(300), indent=2)
+        expected = json.loads(text)
+        projected = [{key: entry[key] for key in USED_FIELDS} for entry in expected]
+        for backend in AVAILABLE_BACKENDS:
+            self.assertEqual(list(iter_entries(io.StringIO(text), backend)), expected, backend)
+            self.assertEqual(list(iter_entries(io.StringIO(text), backend, USED_FIELDS)), projected, backend)
+
+    def test_backends_reject_invalid(self):
+        for backend in AVAILABLE_BACKENDS:
+            for text in ('{"a": 1}', '[1, 2', ''):
+                with self.assertRaises(json.JSONDecodeError, msg=(backend, text)):
+                    list(iter_entries(io.StringIO(text), backend))
+
+    def test_auto_streams_large_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_export(tmp, "export.json", make_entries(3))
+            with patch.object(json_backends, "ORJSON_MAX_BYTES", 10), \
+                    patch.object(json_backends, "_iter_orjson", side_effect=AssertionError), \
+                    open(path, "r", encoding="utf-8") as file:
+                self.assertEqual(list(iter_entries(file, "auto")), make_entries(3))
+
+    @unittest.skipUnless(orjson_available(), "orjson is not installed")
+    def test_orjson_reads_bytes(self):
+        text = json.dumps(make_entries(3), ensure_ascii=False)
+        file = io.TextIOWrapper(io.BytesIO(text.encode("utf-8")), encoding="utf-8")
+        with patch.object(file, "read", side_effect=AssertionError):
+            self.assertEqual(list(iter_entries(file, "orjson")), make_entries(3))
+
+    def test_resolve(self):
+        with patch.dict(os.environ, {"SPOTIFY_JSON_BACKEND": "stdlib", "SPOTIFY_JSON_USED_FIELDS": "1"}):
+            self.assertEqual(resolve_backend(), "stdlib")
+            self.assertEqual(resolve_backend("auto"), "auto")
+            self.assertEqual(resolve_fields(), USED_FIELDS)
+            self.assertIsNone(resolve_fields(False))
+        with patch.dict(os.environ, {"SPOTIFY_JSON_BACKEND": "", "SPOTIFY_JSON_USED_FIELDS": ""}):
+            self.assertEqual(resolve_backend(), "auto")
+            self.assertIsNone(resolve_fields())
+        with self.assertRaises(ValueError):
+            resolve_backend("simdjson")
+        with patch.object(json_backends, "orjson_available", return_value=False), self.assertRaises(ValueError):
+            resolve_backend("orjson")
+
+    def test_analyzer_results_match_stdlib(self):
+        entries = make_entries(400)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [write_export(tmp, f"Streaming_History_Audio_{i}.json", entries[i * 200:(i + 1) * 200])
+                     for i in range(2)]
+
+            expected = SpotifyAnalyzer(json_backend="stdlib", used_fields_only=False)
+            self.assertIsNone(expected.process_files(paths))
+            for backend in AVAILABLE_BACKENDS:
+                for used_fields_only in (False, True):
+                    analyzer = SpotifyAnalyzer(json_backend=backend, used_fields_only=used_fields_only)
+                    self.assertIsNone(analyzer.process_files(paths))
+                    self.assertEqual(analyzer.track_plays, expected.track_plays, backend)
+                    self.assertEqual(analyzer.artist_play_time, expected.artist_play_time, backend)
+                    self.assertEqual(analyzer.entries_read, expected.entries_read, backend)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import analyze_json
+from aggregate_cache import AggregateCache
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry, write_export
+from load_stats import LoadStats, resolve_profiler
+
+
+class TestLoadStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.entries = [make_entry(f"Artist{i % 3}", f"Track{i % 5}", 30000, f"202{2 + i % 2}-01-01T00:00:{i:02d}Z",
+                                   spotify_track_uri=f"spotify:track:{i % 3}-{i % 5}")
+                        for i in range(20)]
+        # A short play and a repeated one, then a play without metadata and one with an invalid timestamp
+        files = [self.entries[:10] + [make_entry("Artist1", "Short", 5000), self.entries[0]],
+                 self.entries[10:] + [make_entry(None, None, 60000), make_entry("Artist1", "Bad", 60000, "yesterday")]]
+        self.paths = [write_export(self.tmp.name, f"{i}.json", file_entries) for i, file_entries in enumerate(files)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check_counters(self, stats):
+        self.assertEqual((stats.files, stats.entries_decoded, stats.plays_counted), (2, 24, 20))
+        self.assertEqual((stats.skipped_short, stats.missing_metadata, stats.invalid_timestamps, stats.duplicates),
+                         (1, 1, 1, 1))
+        self.assertEqual(stats.bytes_read, sum(os.path.getsize(path) for path in self.paths))
+
+    def test_counters(self):
+        for columnar in (False, True):
+            analyzer = SpotifyAnalyzer(columnar)
+            self.assertIsNone(analyzer.process_files(self.paths))
+            self.check_counters(analyzer.load_stats)
+            self.assertEqual(set(analyzer.load_stats.stage_seconds), {"stream"})
+            analyzer.get_ranking("track")
+            stats = analyzer.get_load_stats()
+            self.assertIn("sort", stats["stage_seconds"])
+            self.assertEqual(stats["distinct_keys"], {"tracks": {2022: 10, 2023: 10}, "artists": {2022: 3, 2023: 3}})
+
+            # Reloading starts over, adding files adds to the counters
+            analyzer.process_files(self.paths[:1])
+            analyzer.add_files(self.paths[1:])
+            self.check_counters(analyzer.load_stats)
+
+    def test_invalid_timestamps_are_not_duplicates(self):
+        # A timestamp that is not a string is invalid too, and a repeated invalid play stays invalid
+        bad = [make_entry("Artist1", "Bad", 60000, 12345), make_entry("Artist1", "Bad", 60000, "yesterday")]
+        for columnar in (False, True):
+            analyzer = SpotifyAnalyzer(columnar)
+            analyzer.process_data(self.entries[:2] + bad + bad)
+            stats = analyzer.load_stats
+            self.assertEqual((stats.plays_counted, stats.invalid_timestamps, stats.duplicates), (2, 4, 0))
+
+    def test_detailed(self):
+        analyzer = SpotifyAnalyzer(load_stats=LoadStats(detailed=True), json_backend="stdlib")
+        analyzer.process_files(self.paths)
+        self.check_counters(analyzer.load_stats)
+        stages = analyzer.load_stats.stage_seconds
+        self.assertEqual(set(stages), {"read", "decode", "timestamps", "count"})
+        self.assertTrue(all(seconds >= 0 for seconds in stages.values()), stages)
+        # A JSON null is an entry like any other, not the end of the file
+        self.assertEqual(list(LoadStats(detailed=True).timed_entries([{}, None, {}])), [{}, None, {}])
+
+    @patch.object(analyze_json, "PARALLEL_MIN_BYTES", 0)
+    def test_workers_and_cache(self):
+        cache = AggregateCache(":memory:")
+        for expected_hits in (0, 2):
+            analyzer = SpotifyAnalyzer(cache=cache)
+            self.assertIsNone(analyzer.process_files(self.paths, workers=2))
+            self.assertEqual(analyzer.load_stats.cache_hits, expected_hits)
+        # Cached files are not read again
+        self.assertEqual((analyzer.load_stats.files, analyzer.load_stats.bytes_read), (0, 0))
+        cache.close()
+
+        analyzer = SpotifyAnalyzer()
+        self.assertIsNone(analyzer.process_files(self.paths, workers=2))
+        self.check_counters(analyzer.load_stats)
+
+    def test_profilers(self):
+        for profiler, marker in (("cprofile", "function calls"), ("tracemalloc", "Traced memory")):
+            analyzer = SpotifyAnalyzer(load_stats=LoadStats(profiler=profiler))
+            analyzer.process_files(self.paths)
+            self.assertIn(marker, analyzer.load_stats.profile_report)
+            self.assertIn(marker, analyzer.load_report())
+        self.assertIsNone(SpotifyAnalyzer().load_stats.profile_report)
+
+        with patch.dict(os.environ, {"SPOTIFY_PROFILE": "tracemalloc"}):
+            self.assertEqual(SpotifyAnalyzer().load_stats.profiler, "tracemalloc")
+        with patch.dict(os.environ, {"SPOTIFY_PROFILE": "perf"}):
+            with self.assertRaises(ValueError):
+                resolve_profiler()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,57 +1,154 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import tkinter as tk
+from analyze_json import SpotifyAnalyzer
 from main import SpotifyAnalyzerUI
+from periods import parse_period
 
 
 class TestSpotifyAnalyzerUI(unittest.TestCase):
 
+    @patch('analyze_json.SpotifyAnalyzer')
     @patch('main.filedialog.askopenfilenames')
-    def test_select_files(self, mock_askopenfilenames):
+    def test_select_files(self, mock_askopenfilenames, mock_analyzer_class):
         mock_askopenfilenames.return_value = ["test_file.json"]
         mock_root = tk.Tk()
         ui = SpotifyAnalyzerUI(mock_root)
         ui.analyzer = MagicMock()
 
-        # Mock analyzer methods
-        ui.analyzer.load_json_files.return_value = [{"ms_played": 30000, "master_metadata_track_name": "Track1", "master_metadata_album_artist_name": "Artist1"}]
-        ui.analyzer.get_sorted_by_plays.return_value = [("Artist1 - Track1", 1)]
-        ui.analyzer.process_data = MagicMock()
+        # Mock analyzer methods of the analyzer the files are loaded into
+        loaded = mock_analyzer_class.return_value
+        loaded.process_files.return_value = None
+        loaded.track_years = [2023]
+        loaded.entries_read = 1
+        loaded.get_ranking.return_value = [("Artist1 - Track1", 1, 30000)]
 
         ui.select_files()
-        ui.analyzer.load_json_files.assert_called_once_with(["test_file.json"])
-        ui.analyzer.process_data.assert_called_once()
+        self.assertTrue(ui.loading)
+        ui.load_thread.join()
+        ui.poll_load()
+        self.assertFalse(ui.loading)
+        loaded.process_files.assert_called_once_with(["test_file.json"], workers=None, progress=ANY)
+        self.assertIs(ui.analyzer, loaded)
+        loaded.get_ranking.assert_called()
 
-    def test_display_result(self):
+    @patch('main.messagebox.showinfo')
+    @patch('analyze_json.SpotifyAnalyzer')
+    @patch('main.filedialog.askopenfilenames')
+    def test_cancelled_load_keeps_data(self, mock_askopenfilenames, mock_analyzer_class, mock_showinfo):
+        from analyze_json import CANCELLED
+        mock_askopenfilenames.return_value = ["test_file.json"]
+        mock_analyzer_class.return_value.process_files.return_value = CANCELLED
         mock_root = tk.Tk()
         ui = SpotifyAnalyzerUI(mock_root)
-        ui.result_text = MagicMock()
+        previous = ui.analyzer = MagicMock()
+        previous.track_years = [2023]
+        previous.get_ranking.return_value = []
+
+        ui.select_files()
+        ui.load_thread.join()
+        ui.poll_load()
+        self.assertIs(ui.analyzer, previous)
+        previous.get_ranking.assert_called()
 
-        sorted_data = [("Artist1 - Track1", 1)]
-        ui.display_result(sorted_data)
-        ui.result_text.insert.assert_any_call(tk.END, "1. Artist1 - Track1: 1 plays, 0.50 minutes\n")
+        # Without previous data the welcome message and an empty period list come back
+        previous.track_years = []
+        ui.period_box["values"] = ["All Time", "2023"]
+        with patch.object(ui.tracks_view, "show_message") as mock_show_message:
+            ui.select_files()
+            ui.load_thread.join()
+            ui.poll_load()
+        mock_show_message.assert_called_with(ui.welcome_message)
+        self.assertEqual(list(ui.period_box["values"]), ["All Time"])
+        mock_root.destroy()
 
-    @patch('main.SpotifyAnalyzerUI.display_result')
-    def test_sort_by_plays(self, mock_display_result):
+    def test_display_tracks(self):
         mock_root = tk.Tk()
         ui = SpotifyAnalyzerUI(mock_root)
         ui.analyzer = MagicMock()
-        ui.analyzer.get_sorted_by_plays.return_value = [("Artist1 - Track1", 1)]
+        ui.analyzer.get_ranking.return_value = [("Artist1 - Track1", 1, 30000)]
+        ui.tracks_view.tree = MagicMock()
 
-        ui.sort_by_plays()
-        ui.analyzer.get_sorted_by_plays.assert_called_once()
-        mock_display_result.assert_called_once()
+        ui.display_tracks("minutes")
+        ui.analyzer.get_ranking.assert_called_once_with("track", "ms", None, 200, 0)
+        ui.tracks_view.tree.insert.assert_any_call("", tk.END, values=(1, "Artist1 - Track1", 1, "0.50"))
+
+    def test_period_changed(self):
+        mock_root = tk.Tk()
+        ui = SpotifyAnalyzerUI(mock_root)
+        ui.analyzer = MagicMock()
+        ui.analyzer.track_years = [2023]
+        ui.analyzer.get_ranking.return_value = []
+
+        ui.selected_period.set("2023-06-01..2023-08-31")
+        ui.period_changed()
+        ui.analyzer.get_ranking.assert_called_with("artist", "plays", parse_period("2023-06-01..2023-08-31"), 200, 0)
+        ui.selected_period.set("All Time")
+        ui.period_changed()
+        ui.analyzer.get_ranking.assert_called_with("artist", "plays", None, 200, 0)
+
+    @patch('aggregate_cache.open_default_cache', return_value=None)
+    def test_init_analyzer(self, mock_open_default_cache):
+        mock_root = tk.Tk()
+        ui = SpotifyAnalyzerUI(mock_root)
+        # Created once the window is drawn, not while it is set up
+        self.assertIsNone(ui.analyzer)
+        mock_root.update()
+        self.assertIsInstance(ui.analyzer, SpotifyAnalyzer)
+        analyzer = ui.analyzer
+        ui.init_analyzer()
+        self.assertIs(ui.analyzer, analyzer)
+        mock_root.destroy()
 
-    @patch('main.SpotifyAnalyzerUI.display_result')
-    def test_sort_by_minutes(self, mock_display_result):
+    @patch('main.messagebox.showinfo')
+    def test_show_timeline(self, mock_showinfo):
         mock_root = tk.Tk()
         ui = SpotifyAnalyzerUI(mock_root)
+        ui.show_timeline()
+        mock_showinfo.assert_called_once_with("Info", "Load some files first.")
+
+        ui.analyzer = SpotifyAnalyzer(columnar=True)
+        ui.analyzer.process_data([{"ts": "2023-05-01T12:00:00Z", "ms_played": 30000, "master_metadata_track_name": "Track1",
+                                   "master_metadata_album_artist_name": "Artist1"}])
+        with patch.object(ui, "show_text") as mock_show_text:
+            ui.show_timeline()
+        title, content = mock_show_text.call_args[0]
+        self.assertEqual(title, "Sessions & Streaks")
+        self.assertIn("artist: Artist1, days: 1, last_day: 2023-05-01", content)
+        mock_root.destroy()
+
+    @patch('main.messagebox.showinfo')
+    def test_show_load_stats(self, mock_showinfo):
+        mock_root = tk.Tk()
+        ui = SpotifyAnalyzerUI(mock_root)
+        ui.show_load_stats()
+        mock_showinfo.assert_called_once()
+
         ui.analyzer = MagicMock()
-        ui.analyzer.get_sorted_by_minutes.return_value = [("Artist1 - Track1", 1)]
+        ui.analyzer.track_years = [2023]
+        ui.analyzer.load_report.return_value = "Plays counted: 1"
+        ui.show_load_stats()
+        ui.analyzer.load_report.assert_called_once_with()
+
+    @patch('main.SpotifyAnalyzerUI.display_artists')
+    @patch('main.SpotifyAnalyzerUI.display_tracks')
+    def test_sort_by_plays(self, mock_display_tracks, mock_display_artists):
+        mock_root = tk.Tk()
+        ui = SpotifyAnalyzerUI(mock_root)
+
+        ui.sort_by_plays()
+        mock_display_tracks.assert_called_once_with("plays")
+        mock_display_artists.assert_called_once_with("plays")
+
+    @patch('main.SpotifyAnalyzerUI.display_artists')
+    @patch('main.SpotifyAnalyzerUI.display_tracks')
+    def test_sort_by_minutes(self, mock_display_tracks, mock_display_artists):
+        mock_root = tk.Tk()
+        ui = SpotifyAnalyzerUI(mock_root)
 
         ui.sort_by_minutes()
-        ui.analyzer.get_sorted_by_minutes.assert_called_once()
-        mock_display_result.assert_called_once()
+        mock_display_tracks.assert_called_once_with("minutes")
+        mock_display_artists.assert_called_once_with("minutes")
 
 
 if __name__ == "__main__":
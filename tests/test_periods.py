@@ -0,0 +1,131 @@
+import random
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import analyze_json
+import play_store
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry
+from periods import Period, parse_period, range_labels
+from timestamps import epoch_seconds
+
+
+def make_entries(count, seed=3):
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(count):
+        moment = datetime.fromtimestamp(1500000000 + rnd.randrange(200_000_000), timezone.utc)
+        ms_played, track, artist = rnd.randrange(15000, 300000), f"Track{rnd.randrange(40)}", f"Artist{rnd.randrange(9)}"
+        entries.append(make_entry(artist, track, ms_played, moment.strftime("%Y-%m-%dT%H:%M:%SZ"), spotify_track_uri=str(i)))
+    return entries
+
+
+class TestParsePeriod(unittest.TestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_period("2023"), 2023)
+        self.assertEqual(parse_period("2023-06"), Period("range", epoch_seconds("2023-06-01T00:00:00Z"),
+                                                         epoch_seconds("2023-07-01T00:00:00Z")))
+        self.assertEqual(parse_period("2024-W01"), Period("range", epoch_seconds("2024-01-01T00:00:00Z"),
+                                                          epoch_seconds("2024-01-08T00:00:00Z")))
+        self.assertEqual(parse_period("2023-06-01..2023-08-31"), Period("range", epoch_seconds("2023-06-01T00:00:00Z"),
+                                                                        epoch_seconds("2023-09-01T00:00:00Z")))
+        self.assertEqual(parse_period("2022..2023-02").end, epoch_seconds("2023-03-01T00:00:00Z"))
+
+    def test_weekday_and_hour(self):
+        self.assertEqual(parse_period("Monday"), Period("weekday", 0, 0))
+        self.assertEqual(parse_period("sun"), Period("weekday", 6, 6))
+        self.assertEqual(parse_period("14:00"), Period("hour", 14, 14))
+        self.assertEqual(parse_period("7h"), Period("hour", 7, 7))
+
+    def test_invalid(self):
+        for text in ("", "June", "2023-13", "2023-W60", "24:00", "2023-08..2023-06", "2023-06-01..", "T"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_period(text)
+
+    def test_range_labels(self):
+        timestamps = [epoch_seconds(ts) for ts in ("2022-12-31T23:59:59Z", "2023-01-01T00:00:00Z",
+                                                   "2023-01-02T00:00:00Z", "2023-03-15T12:00:00Z")]
+        self.assertEqual(range_labels("year", timestamps), ["2022", "2023"])
+        self.assertEqual(range_labels("month", timestamps), ["2022-12", "2023-01", "2023-03"])
+        self.assertEqual(range_labels("week", timestamps), ["2022-W52", "2023-W01", "2023-W11"])
+
+
+class TestPeriodRankings(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = make_entries(2000)
+        self.analyzer = SpotifyAnalyzer(columnar=True)
+        self.analyzer.process_data(self.entries)
+
+    def expected(self, keep):
+        plays, play_time = {}, {}
+        for entry in self.entries:
+            moment = datetime.fromisoformat(entry["ts"].replace("Z", "+00:00"))
+            if entry["ms_played"] >= 20000 and keep(moment):
+                artist = entry["master_metadata_album_artist_name"]
+                plays[artist] = plays.get(artist, 0) + 1
+                play_time[artist] = play_time.get(artist, 0) + entry["ms_played"]
+        return plays, play_time
+
+    def check(self, period, keep):
+        plays, play_time = self.expected(keep)
+        rows = self.analyzer.get_ranking("artist", "ms", period)
+        self.assertEqual({name: (count, total) for name, count, total in rows},
+                         {name: (plays[name], play_time[name]) for name in plays}, period)
+        self.assertEqual([total for _, _, total in rows], sorted(play_time.values(), reverse=True))
+
+    def test_periods_match_a_full_scan(self):
+        for _ in range(2):
+            self.check("2018-06", lambda moment: (moment.year, moment.month) == (2018, 6))
+            self.check("2018-W23", lambda moment: moment.isocalendar()[:2] == (2018, 23))
+            self.check("2018-06-01..2018-08-31", lambda moment: (2018, 6, 1) <= (moment.year, moment.month, moment.day) <= (2018, 8, 31))
+            self.check("Tuesday", lambda moment: moment.weekday() == 1)
+            self.check("14:00", lambda moment: moment.hour == 14)
+            self.check("2019", lambda moment: moment.year == 2019)
+            # Without NumPy the same rows go through the pure Python reductions
+            with patch.object(play_store, "np", None):
+                self.analyzer.store._time_order = None
+                self.check("2018-06-01..2018-08-31", lambda moment: (2018, 6, 1) <= (moment.year, moment.month, moment.day) <= (2018, 8, 31))
+            # Chronological input is indexed without sorting
+            self.entries.sort(key=lambda entry: entry["ts"])
+            self.analyzer.process_data(self.entries)
+        self.assertIsInstance(self.analyzer.store.time_order()[0], range)
+
+    def test_available_periods(self):
+        months = sorted({entry["ts"][:7] for entry in self.entries if entry["ms_played"] >= 20000})
+        self.assertEqual(self.analyzer.available_periods("month"), months)
+        self.assertEqual(self.analyzer.available_periods("year"), [str(year) for year in self.analyzer.track_years])
+        self.assertEqual(len(self.analyzer.available_periods("hour")), 24)
+        self.assertEqual(self.analyzer.available_periods("weekday")[0], "Monday")
+
+    def test_new_plays_update_period_rankings(self):
+        before = dict((name, plays) for name, plays, _ in self.analyzer.get_ranking("artist", year="2018-06"))
+        self.analyzer.add_entries([make_entry("Artist1", "New", 30000, "2018-06-10T10:00:00Z", spotify_track_uri="new")])
+        after = dict((name, plays) for name, plays, _ in self.analyzer.get_ranking("artist", year="2018-06"))
+        self.assertEqual(after["Artist1"], before.get("Artist1", 0) + 1)
+
+    @patch.object(analyze_json, "PERIOD_CACHE_SIZE", 3)
+    def test_period_caches_are_bounded(self):
+        months = self.analyzer.available_periods("month")
+        for month in months:
+            self.analyzer.get_ranking("artist", "plays", month)
+            self.analyzer.get_ranking("artist", "ms", month)
+        self.assertEqual(len(self.analyzer._period_stats), 3)
+        self.assertEqual({key[1] for key in self.analyzer._rank_cache}, {parse_period(month) for month in months[-3:]})
+        self.check("2018-06", lambda moment: (moment.year, moment.month) == (2018, 6))
+
+    def test_dict_mode(self):
+        analyzer = SpotifyAnalyzer()
+        analyzer.process_data(self.entries)
+        # Ties may be listed in a different order by the two modes
+        self.assertEqual(sorted(analyzer.get_ranking("track", year="2019")),
+                         sorted(self.analyzer.get_ranking("track", year=2019)))
+        self.assertEqual(analyzer.available_periods("month"), [])
+        with self.assertRaises(ValueError):
+            analyzer.get_ranking("track", year="2019-01")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import pickle
+import random
+import unittest
+from array import array
+from unittest.mock import patch
+
+import play_keys
+from play_keys import PlayKeys
+
+
+def make_keys(count, seed=0):
+    # Chronological plays, one per minute, as analyze_json._play_key builds them
+    rng = random.Random(seed)
+    return [(1672531200 + i * 60) << 32 | rng.getrandbits(32) for i in range(count)]
+
+
+class TestPlayKeys(unittest.TestCase):
+
+    def test_duplicates_across_batches(self):
+        keys = make_keys(500)
+        with patch.object(play_keys, "BATCH_KEYS", 64):
+            seen = PlayKeys()
+            self.assertTrue(all(seen.add(key) for key in keys))
+            self.assertEqual(len(seen.batches), 500 // 64)
+            self.assertFalse(any(seen.add(key) for key in keys))
+            self.assertEqual(len(seen), 500)
+            self.assertEqual(sorted(seen), keys)
+            # A chronological export fills batches with disjoint key ranges
+            self.assertTrue(all(earlier[-1] < later[0] for earlier, later in zip(seen.batches, seen.batches[1:])))
+
+    def test_disjoint_and_extend(self):
+        keys = make_keys(300)
+        with patch.object(play_keys, "BATCH_KEYS", 50):
+            first, second, overlapping = PlayKeys(), PlayKeys(), PlayKeys()
+            for key in keys[:200]:
+                first.add(key)
+            for key in keys[200:]:
+                second.add(key)
+            for key in keys[150:250]:
+                overlapping.add(key)
+            self.assertTrue(first.isdisjoint(second))
+            self.assertFalse(first.isdisjoint(overlapping))
+            first.extend(second)
+            self.assertFalse(first.add(keys[250]))
+            self.assertEqual(len(first), 300)
+
+    def test_snapshot_keys(self):
+        keys = make_keys(100)
+        seen = PlayKeys()
+        seen.add_sorted(memoryview(array('Q', keys[:50])))
+        self.assertIn(keys[10], seen)
+        self.assertFalse(seen.add(keys[10]))
+        self.assertTrue(seen.add(keys[60]))
+        self.assertEqual(len(seen), 51)
+        seen.clear()
+        self.assertEqual(len(seen), 0)
+
+    def test_pickle_sorts_pending_keys(self):
+        keys = make_keys(100)
+        seen = PlayKeys()
+        for key in keys:
+            seen.add(key)
+        copy = pickle.loads(pickle.dumps(seen))
+        self.assertEqual(len(copy.batches), 1)
+        self.assertFalse(any(copy.add(key) for key in keys))
+        self.assertTrue(copy.isdisjoint(PlayKeys()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from array import array
+from unittest.mock import patch
+
+import play_store
+from play_store import PlayStore
+
+
+class TestPlayStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PlayStore()
+        for uri, year, ms_played in (("uri1", 2022, 30000), ("uri1", 2023, 40000), ("uri2", 2023, 50000), ("uri1", 2023, 20000)):
+            self.append(self.store, uri, f"Artist1 - Track{uri[-1]}", "Artist1", year, ms_played)
+
+    @staticmethod
+    def append(store, uri, track_name, artist_name, year, ms_played):
+        store.append(store.tracks.intern(uri, track_name), store.artists.intern(artist_name, artist_name), year, 0, ms_played)
+
+    def test_interning(self):
+        self.assertEqual(self.store.tracks.keys, ["uri1", "uri2"])
+        self.assertEqual(self.store.tracks.names, ["Artist1 - Track1", "Artist1 - Track2"])
+        self.assertEqual(list(self.store.track_ids), [0, 0, 1, 0])
+        self.assertEqual(list(self.store.artist_ids), [0, 0, 0, 0])
+
+    def test_aggregate_python(self):
+        with patch.object(play_store, "np", None):
+            plays, play_time = self.store.aggregate("track")
+            artist_plays, artist_time = self.store.aggregate("artist")
+        self.assertEqual(plays, {2022: {0: 1}, 2023: {0: 2, 1: 1}})
+        self.assertEqual(play_time[2023], {0: 60000, 1: 50000})
+        self.assertEqual(artist_plays, {2022: {0: 1}, 2023: {0: 3}})
+        self.assertEqual(artist_time, {2022: {0: 30000}, 2023: {0: 110000}})
+
+    @unittest.skipIf(play_store.np is None, "NumPy is not installed")
+    def test_aggregate_numpy_matches_python(self):
+        expected = {}
+        with patch.object(play_store, "np", None):
+            for entity in ("track", "artist"):
+                expected[entity] = self.store.aggregate(entity)
+        for entity in ("track", "artist"):
+            self.assertEqual(self.store.aggregate(entity), expected[entity])
+
+    @unittest.skipIf(play_store.np is None, "NumPy is not installed")
+    def test_aggregate_numpy_keeps_first_seen_order(self):
+        # Tracks first played in the opposite order of their ids, so ties rank the same with and without NumPy
+        for uri, year in (("uri3", 2024), ("uri2", 2024), ("uri1", 2024), ("uri2", 2022)):
+            self.append(self.store, uri, f"Artist1 - Track{uri[-1]}", "Artist1", year, 30000)
+        rows = array('i', [6, 5, 4, 7, 0])
+        with patch.object(play_store, "np", None):
+            expected = self.store.aggregate("track"), self.store.aggregate_rows("track", rows)
+        plays, play_time = self.store.aggregate("track")
+        self.assertEqual([(year, list(values)) for year, values in plays.items()],
+                         [(year, list(values)) for year, values in expected[0][0].items()])
+        self.assertEqual([list(values) for values in play_time.values()], [list(values) for values in expected[0][1].values()])
+        self.assertEqual([list(values) for values in self.store.aggregate_rows("track", rows)],
+                         [list(values) for values in expected[1]])
+
+    def test_indexes_extend_with_appended_rows(self):
+        def add_rows(store, rows):
+            for track_id in range(3):
+                store.tracks.intern(f"uri{track_id}", f"Artist1 - Track{track_id}")
+            for track_id, timestamp, platform_id in rows:
+                store.append(track_id, 0, 2023, timestamp, 30000, platform_id)
+
+        first = [(0, 100, 1), (1, 100, 2), (0, 200, 1)]
+        # Appended plays in time order, then some earlier ones and ties with plays already stored
+        for added in ([(1, 200, 1), (2, 300, 3)], [(2, 50, 3), (1, 100, 1), (0, 150, 2)]):
+            for numpy in (True, False) if play_store.np is not None else (False,):
+                with patch.object(play_store, "np", play_store.np if numpy else None):
+                    store, fresh = PlayStore(), PlayStore()
+                    add_rows(store, first)
+                    store.time_order(), store.bucket_rows("hour", lambda ts: ts // 100), store.bitmaps("platform_ids")
+                    add_rows(store, added)
+                    add_rows(fresh, first + added)
+                    self.assertEqual([list(values) for values in store.time_order()],
+                                     [list(values) for values in fresh.time_order()])
+                    for stored, expected in ((store.bucket_rows("hour", lambda ts: ts // 100),
+                                              fresh.bucket_rows("hour", lambda ts: ts // 100)),
+                                             (store.bitmaps("platform_ids"), fresh.bitmaps("platform_ids"))):
+                        self.assertEqual({value: stored[value] for value in expected}, expected)
+                    only_added = PlayStore()
+                    add_rows(only_added, added)
+                    self.assertEqual(store.aggregate("track", len(first)), only_added.aggregate("track"))
+
+    def test_extend_remaps_ids(self):
+        other = PlayStore()
+        self.append(other, "uri9", "Artist2 - Track9", "Artist2", 2021, 25000)
+        self.append(other, "uri2", "Artist1 - Track2 (Remastered)", "Artist1", 2021, 25000)
+        self.store.extend(other)
+        self.assertEqual(len(self.store), 6)
+        self.assertEqual(list(self.store.track_ids)[4:], [2, 1])
+        self.assertEqual(list(self.store.artist_ids)[4:], [1, 0])
+        self.assertEqual(list(self.store.years)[4:], [2021, 2021])
+        self.assertEqual(self.store.tracks.names, ["Artist1 - Track1", "Artist1 - Track2", "Artist2 - Track9"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import play_store
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry
+from periods import parse_period
+from queries import make_filter
+
+PLATFORMS = ("Android OS 12 API 31", "iOS 16.1 (iPhone14,2)", "Windows 10 (10.0.19045; x64)", None)
+REASONS = ("trackdone", "fwdbtn", "endplay")
+
+
+def make_entries(count):
+    return [make_entry(f"Artist{i % 6}", f"Track{i % 13}", 20000 + (i * 7919) % 200000,
+                       f"20{20 + i % 4}-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00Z",
+                       platform=PLATFORMS[i % 4], reason_end=REASONS[i % 3], shuffle=i % 5 < 2,
+                       skipped=None if i % 7 else True, spotify_track_uri=f"spotify:track:{i % 13}-{i % 6}")
+            for i in range(count)]
+
+
+def matches(entry, where):
+    """
+    The conditions of make_filter checked on a single entry, for comparison.
+    """
+    timestamp = datetime.strptime(entry["ts"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    artists = where.get("artist")
+    if artists is not None and entry["master_metadata_album_artist_name"] not in (
+            [artists] if isinstance(artists, str) else artists):
+        return False
+    if "platform" in where and where["platform"].lower() not in (entry["platform"] or "").lower():
+        return False
+    if "reason_end" in where and entry["reason_end"] != where["reason_end"]:
+        return False
+    if "years" in where and timestamp.year not in where["years"]:
+        return False
+    if "period" in where:
+        period = parse_period(where["period"])
+        if isinstance(period, int):
+            if timestamp.year != period:
+                return False
+        elif period.kind == "weekday":
+            if timestamp.weekday() != period.start:
+                return False
+        elif not period.start <= timestamp.timestamp() < period.end:
+            return False
+    if "min_ms" in where and entry["ms_played"] < where["min_ms"]:
+        return False
+    for key in ("shuffle", "skipped"):
+        if key in where and bool(entry[key]) != where[key]:
+            return False
+    return True
+
+
+class TestQueries(unittest.TestCase):
+
+    WHERE = ({}, {"artist": "Artist2"}, {"artist": ["Artist1", "Artist4", "Nobody"]}, {"platform": "android"},
+             {"platform": "iOS", "shuffle": True}, {"reason_end": "fwdbtn", "years": [2021, 2023]},
+             {"skipped": True}, {"skipped": False, "min_ms": 100000}, {"period": "2022-03"},
+             {"period": "2021"}, {"period": "Monday", "artist": "Artist3"},
+             {"artist": "Artist5", "period": "2020-01-01..2022-06-30", "platform": "windows", "skipped": False},
+             {"reason_end": "unknown"})
+
+    def setUp(self):
+        self.entries = make_entries(600)
+        self.analyzer = SpotifyAnalyzer(columnar=True)
+        self.analyzer.process_data(self.entries)
+
+    def expected(self, where):
+        plays, play_time = Counter(), Counter()
+        for entry in self.entries:
+            if matches(entry, where):
+                artist = entry["master_metadata_album_artist_name"]
+                plays[artist] += 1
+                play_time[artist] += entry["ms_played"]
+        return {artist: (count, play_time[artist]) for artist, count in plays.items()}
+
+    def check_queries(self, analyzer):
+        for where in self.WHERE:
+            result = analyzer.query("artist", "ms", where)
+            self.assertEqual({name: (plays, ms) for name, plays, ms in result}, self.expected(where), where)
+            self.assertEqual([ms for _, _, ms in result], sorted((ms for _, _, ms in result), reverse=True))
+
+    def test_queries_match_a_scan(self):
+        self.check_queries(self.analyzer)
+
+    def test_queries_without_numpy(self):
+        with patch.object(play_store, "np", None):
+            self.check_queries(self.analyzer)
+
+    @unittest.skipIf(play_store.np is None, "NumPy is not installed")
+    def test_numpy_indexes_match_python(self):
+        store = self.analyzer.store
+        expected = {}
+        with patch.object(play_store, "np", None):
+            for name in ("platform_ids", "shuffle"):
+                expected[name] = store.bitmaps(name)
+            expected["rows"] = store.bitmap_rows(expected["shuffle"][1])
+            store._bitmaps.clear()
+        for name in ("platform_ids", "shuffle"):
+            self.assertEqual(store.bitmaps(name), expected[name])
+        self.assertEqual(store.bitmap_rows(store.bitmaps("shuffle")[1]), expected["rows"])
+
+    def test_results_follow_new_plays(self):
+        where = {"artist": "Artist2", "platform": "android"}
+        before = self.analyzer.query("track", where=where)
+        self.analyzer.add_entries(make_entries(1200)[600:])
+        self.entries = make_entries(1200)
+        after = self.analyzer.query("track", where=where)
+        self.assertNotEqual(before, after)
+        self.assertEqual(sum(plays for _, plays, _ in after), sum(count for count, _ in self.expected(where).values()))
+
+    def test_snapshot_keeps_filter_columns(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.snapshot")
+            self.assertIsNone(self.analyzer.save_snapshot(path))
+            analyzer = SpotifyAnalyzer()
+            self.assertIsNone(analyzer.load_snapshot(path))
+            self.check_queries(analyzer)
+            del analyzer
+
+    def test_invalid_queries(self):
+        for where in ({"genre": "jazz"}, {"years": "2021"}, {"shuffle": 1}, {"min_ms": "1000"}, {"artist": []}):
+            with self.assertRaises(ValueError, msg=where):
+                make_filter(where)
+        self.assertEqual(make_filter({"period": "2021", "years": [2021, 2022]}), make_filter({"years": 2021}))
+        with self.assertRaises(ValueError):
+            SpotifyAnalyzer().query(where={"artist": "Artist1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+import unittest
+
+import cli
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry, write_export
+from snapshot import is_snapshot, read_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.entries = [make_entry(f"Artist{i % 3}", f"Track{i % 5} 🎵", 20000 + i * 1000,
+                                   f"20{18 + i % 4}-03-01T10:{i // 60:02d}:{i % 60:02d}Z",
+                                   spotify_track_uri=f"spotify:track:{i % 3}-{i % 5}")
+                        for i in range(90)]
+        self.paths = [write_export(self.tmp.name, f"Streaming_History_Audio_{i}.json", self.entries[i * 45:(i + 1) * 45])
+                      for i in range(2)]
+        self.snapshot_path = os.path.join(self.tmp.name, "history.snapshot")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def saved_analyzer(self):
+        analyzer = SpotifyAnalyzer(columnar=True)
+        self.assertIsNone(analyzer.process_files(self.paths))
+        self.assertIsNone(analyzer.save_snapshot(self.snapshot_path))
+        return analyzer
+
+    def test_round_trip(self):
+        expected = self.saved_analyzer()
+        self.assertTrue(is_snapshot(self.snapshot_path))
+        self.assertFalse(is_snapshot(self.paths[0]))
+
+        analyzer = SpotifyAnalyzer()
+        self.assertIsNone(analyzer.load_snapshot(self.snapshot_path))
+        self.assertTrue(analyzer.store.mapped)
+        self.assertEqual(analyzer.track_years, expected.track_years)
+        self.assertEqual(analyzer.entries_read, 90)
+        for name in ("track_plays", "track_play_time", "artist_plays", "artist_play_time"):
+            self.assertEqual(getattr(analyzer, name), getattr(expected, name), name)
+        self.assertEqual(analyzer.get_ranking("artist", "ms"), expected.get_ranking("artist", "ms"))
+        self.assertEqual(list(analyzer.store.timestamps), list(expected.store.timestamps))
+        self.assertEqual(sorted(analyzer._play_keys), sorted(expected._play_keys))
+
+    def test_adding_files_copies_and_deduplicates(self):
+        self.saved_analyzer()
+        analyzer = SpotifyAnalyzer()
+        self.assertIsNone(analyzer.load_snapshot(self.snapshot_path))
+        extra = write_export(self.tmp.name, "extra.json",
+                             self.entries[40:50] + [make_entry("Artist9", "New", 30000, "2024-01-01T00:00:00Z")])
+        self.assertIsNone(analyzer.add_files([extra]))
+        self.assertFalse(analyzer.store.mapped)
+        self.assertEqual(analyzer.track_years[-1], 2024)
+        self.assertEqual(sum(plays for _, plays, _ in analyzer.get_ranking("artist")), 91)
+
+        self.assertIsNone(analyzer.save_snapshot(self.snapshot_path))
+        store, play_keys, years, entries_read = read_snapshot(self.snapshot_path)
+        self.assertEqual((len(store), len(play_keys), entries_read), (91, 91, 101))
+
+    def test_errors(self):
+        analyzer = SpotifyAnalyzer()
+        self.assertIsInstance(analyzer.save_snapshot(self.snapshot_path), str)
+        self.assertIsInstance(analyzer.load_snapshot(self.paths[0]), str)
+        self.assertIsInstance(analyzer.load_snapshot(os.path.join(self.tmp.name, "missing")), str)
+
+        self.saved_analyzer()
+        with open(self.snapshot_path, "rb") as file:
+            data = file.read()
+        for broken in (data[:100], b""):
+            with open(self.snapshot_path, "wb") as file:
+                file.write(broken)
+            self.assertIsInstance(analyzer.load_snapshot(self.snapshot_path), str)
+            self.assertEqual(analyzer.track_years, [])
+
+    def test_cli(self):
+        out = io.StringIO()
+        self.assertEqual(cli.main(self.paths + ["--save-snapshot", self.snapshot_path, "--quiet"], out=out), cli.EXIT_OK)
+        from_snapshot = io.StringIO()
+        self.assertEqual(cli.main(["--snapshot", self.snapshot_path, "--quiet"], out=from_snapshot), cli.EXIT_OK)
+        self.assertEqual(from_snapshot.getvalue(), out.getvalue())
+        self.assertEqual(cli.main(["--quiet"], out=io.StringIO()), cli.EXIT_USAGE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import defaultdict
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import play_store
+from analyze_json import SpotifyAnalyzer
+from helpers import make_entry
+from timeline import build_timeline, day_date, time_ordered_rows
+
+
+def make_entries(count, seed=0):
+    """
+    Plays in bursts of a few minutes with pauses between them, shuffled like files given out of order.
+    """
+    rng = random.Random(seed)
+    entries, now = [], 1672531200    # 2023-01-01
+    for i in range(count):
+        now += rng.choice((200, 240, 300, 3000, 20000, 90000))
+        ms_played, artist = rng.randrange(20000, 400000), f"Artist{rng.randrange(5)}"
+        entries.append(make_entry(artist, f"Track{i % 17}", ms_played,
+                                  datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                  spotify_track_uri=f"spotify:track:{i % 17}"))
+    rng.shuffle(entries)
+    return entries
+
+
+def expected_timeline(entries, gap):
+    """
+    Sessions, days, streaks and listens worked out from the entries one question at a time.
+    """
+    plays = sorted((int(datetime.strptime(entry["ts"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()),
+                    entry) for entry in entries)
+    sessions = []
+    for timestamp, entry in plays:
+        started = timestamp - entry["ms_played"] // 1000
+        if not sessions or started - sessions[-1][1] > gap:
+            sessions.append([started, timestamp, 0, 0])
+        session = sessions[-1]
+        session[0], session[1] = min(session[0], started), timestamp
+        session[2] += 1
+        session[3] += entry["ms_played"]
+
+    days, artist_days, listens = defaultdict(lambda: [0, 0]), defaultdict(set), {}
+    for timestamp, entry in plays:
+        days[timestamp // 86400][0] += 1
+        days[timestamp // 86400][1] += entry["ms_played"]
+        artist_days[entry["master_metadata_album_artist_name"]].add(timestamp // 86400)
+        listens.setdefault(entry["spotify_track_uri"], [timestamp, timestamp])[1] = timestamp
+    streaks = {}
+    for artist, played_days in artist_days.items():
+        best = max(length for length in range(1, len(played_days) + 1)
+                   if any(all(day + offset in played_days for offset in range(length)) for day in played_days))
+        streaks[artist] = best
+    return ([tuple(session) for session in sessions], sorted((day, *totals) for day, totals in days.items()),
+            streaks, listens)
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = make_entries(400)
+        self.analyzer = SpotifyAnalyzer(columnar=True)
+        self.analyzer.process_data(self.entries)
+
+    def check(self, timeline, gap=1800):
+        sessions, days, streaks, listens = expected_timeline(self.entries, gap)
+        self.assertEqual(sorted(timeline.longest_sessions()), sorted(sessions))
+        self.assertEqual(timeline.longest_sessions(3), sorted(sessions, key=lambda session: session[3], reverse=True)[:3])
+        self.assertEqual(timeline.daily_totals(), days)
+        self.assertEqual(timeline.daily_totals(days[2][0], days[5][0]), days[2:6])
+
+        names = self.analyzer.artists.names
+        self.assertEqual({names[artist_id]: length for artist_id, length, _ in timeline.longest_streaks()}, streaks)
+        artist_id, length, last_day = timeline.longest_streaks(1)[0]
+        self.assertEqual(length, max(streaks.values()))
+        self.assertEqual(timeline.streak_days[artist_id], length)
+        self.assertGreaterEqual(day_date(last_day).year, 2023)
+        self.assertEqual({self.analyzer.tracks.keys[track_id]: list(timeline.listens(track_id))
+                          for track_id in range(len(self.analyzer.tracks))}, listens)
+
+    def test_matches_a_scan(self):
+        self.check(self.analyzer.get_timeline())
+        self.check(self.analyzer.get_timeline(gap=600), gap=600)
+
+    def test_without_numpy(self):
+        with patch.object(play_store, "np", None):
+            self.analyzer.store._time_order = None
+            self.check(build_timeline(self.analyzer.store))
+
+    def test_cached_until_new_plays(self):
+        timeline = self.analyzer.get_timeline()
+        self.assertIs(self.analyzer.get_timeline(), timeline)
+        self.analyzer.add_entries(make_entries(10, seed=1))
+        self.assertIsNot(self.analyzer.get_timeline(), timeline)
+        with self.assertRaises(ValueError):
+            SpotifyAnalyzer().get_timeline()
+
+    def test_external_sort_of_a_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.snapshot")
+            self.assertIsNone(self.analyzer.save_snapshot(path))
+            analyzer = SpotifyAnalyzer()
+            self.assertIsNone(analyzer.load_snapshot(path))
+            store = analyzer.store
+            self.assertTrue(store.mapped)
+            rows = list(time_ordered_rows(store, run_plays=37))
+            self.assertIsNone(store._time_order)
+            self.assertEqual(rows, list(self.analyzer.store.time_order()[0]))
+            self.check(build_timeline(store, rows=iter(rows)))
+            del analyzer, store
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from datetime import datetime, timezone
+
+from timestamps import epoch_seconds, parse_timestamp, timestamp_year
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_fast_path_matches_datetime(self):
+        for ts in ("2023-05-01T12:34:56Z", "1970-01-01T00:00:00Z", "2024-02-29T23:59:59Z", "2016-12-31T00:00:01Z"):
+            moment = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+            self.assertEqual(parse_timestamp(ts),
+                             (moment.year, moment.month, moment.day, moment.hour, int(moment.timestamp())), ts)
+            self.assertEqual(timestamp_year(ts), moment.year)
+
+    def test_slow_path(self):
+        self.assertEqual(parse_timestamp("2023-05-01T12:34:56.123Z")[4], epoch_seconds("2023-05-01T12:34:56Z"))
+        self.assertEqual(parse_timestamp("2023-05-01T14:34:56+02:00"), (2023, 5, 1, 14, epoch_seconds("2023-05-01T12:34:56Z")))
+        # Naive values are taken as UTC
+        self.assertEqual(epoch_seconds("2023-05-01T12:00:00"),
+                         int(datetime(2023, 5, 1, 12, tzinfo=timezone.utc).timestamp()))
+
+    def test_invalid(self):
+        for ts in ("2023-02-30T12:00:00Z", "2023-05-01T24:00:00Z", "2023-05-01T12:60:00Z", "2023-05-01T12:00:60Z",
+                   "2023-0a-01T12:00:00Z", "not a timestamp", "", 1682942400, None):
+            with self.assertRaises(ValueError, msg=repr(ts)):
+                parse_timestamp(ts)
+            with self.assertRaises(ValueError, msg=repr(ts)):
+                timestamp_year(ts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import heapq
+import os
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+# A pause longer than this between two plays starts a new listening session
+SESSION_GAP_SECONDS = 30 * 60
+# Plays sorted in memory at a time when a memory-mapped store is put in time order, see time_ordered_rows
+SORT_RUN_PLAYS = 1 << 20
+# (timestamp, row) pairs read from a sorted run at a time while the runs are merged
+_MERGE_READ_PAIRS = 1 << 14
+_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+
+
+def day_date(day):
+    """
+    Returns the date of a day number, days since 1970-01-01 in UTC like the "ts" of the exports.
+    """
+    return _EPOCH + timedelta(days=day)
+
+
+def _read_run(path):
+    with open(path, "rb") as file:
+        while True:
+            pairs = array('q')
+            data = file.read(_MERGE_READ_PAIRS * 2 * pairs.itemsize)
+            if not data:
+                return
+            pairs.frombytes(data)
+            for index in range(0, len(pairs), 2):
+                yield pairs[index], pairs[index + 1]
+
+
+def _merged_runs(timestamps, run_plays):
+    with tempfile.TemporaryDirectory(prefix="spotify_timeline_") as tmp:
+        paths = []
+        for start in range(0, len(timestamps), run_plays):
+            rows = sorted(range(start, min(start + run_plays, len(timestamps))), key=timestamps.__getitem__)
+            pairs = array('q')
+            for row in rows:
+                pairs.append(timestamps[row])
+                pairs.append(row)
+            paths.append(os.path.join(tmp, f"run{len(paths)}"))
+            with open(paths[-1], "wb") as file:
+                pairs.tofile(file)
+            del rows, pairs
+        # Runs cover ascending row ranges, so ties merge in row order like a stable sort
+        for _, row in heapq.merge(*map(_read_run, paths)):
+            yield row
+
+
+def time_ordered_rows(store, run_plays=SORT_RUN_PLAYS):
+    """
+    Returns the rows of a PlayStore in time order, ties in row order.
+    A store in memory uses its time index. A memory-mapped store of more than run_plays plays out of time order
+    may not fit in memory and is sorted externally instead: runs of run_plays rows are sorted and spilled to
+    temporary files, then merged while they are read back, so only one run is held at a time.
+    """
+    if not store.mapped or len(store) <= run_plays or store.in_time_order():
+        return store.time_order()[0]
+    return _merged_runs(store.timestamps, run_plays)
+
+
+class Timeline:
+    """
+    Listening sessions, daily totals, artist streaks and first and last listens of the plays of a PlayStore,
+    built by build_timeline and held in arrays: one entry per session, per day with plays, per artist id
+    and per track id. Times are epoch seconds, days are numbers for day_date, all in UTC.
+    """
+
+    def __init__(self, gap):
+        self.gap = gap
+        # Sessions in time order: when the first play started, when the last one ended, plays and ms played
+        self.session_starts = array('q')
+        self.session_ends = array('q')
+        self.session_plays = array('i')
+        self.session_ms = array('q')
+        # Days with at least one play in order, and their plays and ms played
+        self.days = array('i')
+        self.day_plays = array('i')
+        self.day_ms = array('q')
+        # Per artist id: the longest run of consecutive days with a play and the last day of the run
+        self.streak_days = array('i')
+        self.streak_ends = array('i')
+        # Per track id: the times it was first and last played
+        self.first_listens = array('q')
+        self.last_listens = array('q')
+
+    def longest_sessions(self, limit=None):
+        """
+        Returns up to limit sessions as (start, end, plays, ms_played) tuples, the most ms played first.
+        """
+        indexes = range(len(self.session_ms))
+        if limit is None:
+            indexes = sorted(indexes, key=self.session_ms.__getitem__, reverse=True)
+        else:
+            indexes = heapq.nlargest(limit, indexes, key=self.session_ms.__getitem__)
+        return [(self.session_starts[i], self.session_ends[i], self.session_plays[i], self.session_ms[i])
+                for i in indexes]
+
+    def daily_totals(self, first_day=None, last_day=None):
+        """
+        Returns (day, plays, ms_played) of every day with plays from first_day to last_day, both included.
+        """
+        start = 0 if first_day is None else bisect_left(self.days, first_day)
+        end = len(self.days) if last_day is None else bisect_right(self.days, last_day)
+        return list(zip(self.days[start:end], self.day_plays[start:end], self.day_ms[start:end]))
+
+    def longest_streaks(self, limit=None):
+        """
+        Returns up to limit (artist_id, days, last_day) tuples, the longest streak of daily plays first.
+        """
+        ids = range(len(self.streak_days))
+        if limit is None:
+            ids = sorted(ids, key=self.streak_days.__getitem__, reverse=True)
+        else:
+            ids = heapq.nlargest(limit, ids, key=self.streak_days.__getitem__)
+        return [(artist_id, self.streak_days[artist_id], self.streak_ends[artist_id]) for artist_id in ids
+                if self.streak_days[artist_id]]
+
+    def listens(self, track_id):
+        """
+        Returns the (first, last) times track_id was played, or None if it never was.
+        """
+        if track_id >= len(self.first_listens) or self.first_listens[track_id] < 0:
+            return None
+        return self.first_listens[track_id], self.last_listens[track_id]
+
+
+def build_timeline(store, gap=SESSION_GAP_SECONDS, rows=None):
+    """
+    Builds the Timeline of a PlayStore in one pass over its plays in time order, rows if given,
+    otherwise time_ordered_rows(store). A play starts ms_played before its timestamp, and a session ends
+    when the next play starts more than gap seconds after the previous one ended.
+    """
+    timeline = Timeline(gap)
+    artist_count, track_count = len(store.artists), len(store.tracks)
+    timeline.streak_days = array('i', bytes(4 * artist_count))
+    timeline.streak_ends = array('i', bytes(4 * artist_count))
+    timeline.first_listens = array('q', [-1]) * track_count
+    timeline.last_listens = array('q', [-1]) * track_count
+    if rows is None:
+        rows = time_ordered_rows(store)
+
+    # Bound to locals, they are used once per play
+    timestamps, ms_played_column = store.timestamps, store.ms_played
+    track_ids, artist_ids = store.track_ids, store.artist_ids
+    first_listens, last_listens = timeline.first_listens, timeline.last_listens
+    streak_days, streak_ends = timeline.streak_days, timeline.streak_ends
+    last_days = array('i', [-2]) * artist_count
+    current_streaks = array('i', bytes(4 * artist_count))
+    session_start = session_end = day = None
+    session_plays = session_ms = day_plays = day_ms = 0
+
+    for row in rows:
+        timestamp, ms_played = timestamps[row], ms_played_column[row]
+        started = timestamp - ms_played // 1000
+        if session_end is None or started - session_end > gap:
+            if session_end is not None:
+                timeline.session_starts.append(session_start)
+                timeline.session_ends.append(session_end)
+                timeline.session_plays.append(session_plays)
+                timeline.session_ms.append(session_ms)
+            session_start, session_plays, session_ms = started, 0, 0
+        # Plays are in the order they ended, a long one may have started before the session did
+        session_start = min(session_start, started)
+        session_end = timestamp
+        session_plays += 1
+        session_ms += ms_played
+
+        play_day = timestamp // _DAY
+        if play_day != day:
+            if day is not None:
+                timeline.days.append(day)
+                timeline.day_plays.append(day_plays)
+                timeline.day_ms.append(day_ms)
+            day, day_plays, day_ms = play_day, 0, 0
+        day_plays += 1
+        day_ms += ms_played
+
+        artist_id = artist_ids[row]
+        last_day = last_days[artist_id]
+        if last_day != play_day:
+            streak = current_streaks[artist_id] + 1 if last_day == play_day - 1 else 1
+            current_streaks[artist_id] = streak
+            last_days[artist_id] = play_day
+            if streak > streak_days[artist_id]:
+                streak_days[artist_id] = streak
+                streak_ends[artist_id] = play_day
+
+        track_id = track_ids[row]
+        if first_listens[track_id] < 0:
+            first_listens[track_id] = timestamp
+        last_listens[track_id] = timestamp
+
+    if session_end is not None:
+        timeline.session_starts.append(session_start)
+        timeline.session_ends.append(session_end)
+        timeline.session_plays.append(session_plays)
+        timeline.session_ms.append(session_ms)
+        timeline.days.append(day)
+        timeline.day_plays.append(day_plays)
+        timeline.day_ms.append(day_ms)
+    return timeline
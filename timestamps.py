@@ -0,0 +1,81 @@
+import sys
+from datetime import date, datetime, timezone
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# A 10 year history has under 4000 distinct dates, the bound only guards against garbage input
+_MAX_CACHED_DATES = 100_000
+
+# "YYYY-MM-DD" -> (year, month, day, epoch seconds at midnight UTC), filled on first sight of each date
+_date_cache = {}
+# "HH:MM" -> seconds since midnight and "SS" -> seconds, doubling as validation tables
+_MINUTE_OFFSETS = {f"{h:02d}:{m:02d}": h * 3600 + m * 60 for h in range(24) for m in range(60)}
+_SECOND_OFFSETS = {f"{s:02d}": s for s in range(60)}
+
+# datetime.fromisoformat, which only reads the "Z" suffix of Spotify's timestamps since Python 3.11
+if sys.version_info >= (3, 11):
+    from_isoformat = datetime.fromisoformat
+else:
+    def from_isoformat(ts):
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+
+def parse_timestamp(ts):
+    """
+    Returns (year, month, day, hour, epoch_seconds) for the "ts" field of an entry.
+    Spotify's fixed "YYYY-MM-DDTHH:MM:SSZ" layout is decoded from per-date and per-minute
+    lookup tables without building datetime objects, anything else goes through datetime.fromisoformat.
+    Raises ValueError if the value is not a valid ISO 8601 timestamp.
+    """
+    if type(ts) is str and len(ts) == 20 and ts[10] == "T" and ts[16] == ":" and ts[19] == "Z":
+        day = _date_cache.get(ts[:10]) or _cache_date(ts[:10])
+        minutes = _MINUTE_OFFSETS.get(ts[11:16])
+        seconds = _SECOND_OFFSETS.get(ts[17:19])
+        if day is not None and minutes is not None and seconds is not None:
+            return day[0], day[1], day[2], minutes // 3600, day[3] + minutes + seconds
+    return _parse_slow(ts)
+
+
+def timestamp_year(ts):
+    """
+    Returns only the year of a timestamp.
+    When nothing but the year is needed, the C implementation of datetime.fromisoformat
+    measures faster than the validated lookups of parse_timestamp, so it is used directly.
+    """
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00")).year
+    except AttributeError:
+        raise ValueError(f"Timestamp is not a string: {ts!r}")
+
+
+def epoch_seconds(ts):
+    """
+    Returns the timestamp as seconds since 1970-01-01 UTC.
+    """
+    return parse_timestamp(ts)[4]
+
+
+def _cache_date(prefix):
+    """
+    Validates a "YYYY-MM-DD" prefix and caches its parts. Returns None if it is not a valid date.
+    """
+    if not (prefix.isascii() and prefix[4] == "-" and prefix[7] == "-"
+            and prefix[:4].isdigit() and prefix[5:7].isdigit() and prefix[8:].isdigit()):
+        return None
+    try:
+        parsed = date(int(prefix[:4]), int(prefix[5:7]), int(prefix[8:]))
+    except ValueError:
+        return None
+    if len(_date_cache) >= _MAX_CACHED_DATES:
+        _date_cache.clear()
+    day = _date_cache[prefix] = (parsed.year, parsed.month, parsed.day,
+                                 (parsed.toordinal() - _EPOCH_ORDINAL) * 86400)
+    return day
+
+
+def _parse_slow(ts):
+    if not isinstance(ts, str):
+        raise ValueError(f"Timestamp is not a string: {ts!r}")
+    moment = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.year, moment.month, moment.day, moment.hour, int(moment.timestamp())